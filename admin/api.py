@@ -2,12 +2,15 @@ from datetime import datetime, timedelta
 from flask import request, jsonify
 from flask_login import current_user
 from models import db, Appointment, Patient, ClinicalNote
-from services.calendar_sync_service import update_calendar_event_status, sync_from_calendar
+from services import outbox
+from services.calendar_sync_service import queue_calendar_status_change, repair_calendar_events, sync_from_calendar
 from .decorators import login_required_admin, admin_required
 from . import admin_bp
 
 
 _MAX_NOTE_LENGTH = 10_000  # caracteres máximos para notas clínicas
+_MAX_BULK_APPOINTMENTS = 500  # citas máximas por cambio de estado en bloque
+_ALLOWED_STATUSES = ("pending", "confirmed", "completed", "cancelled")
 
 
 @admin_bp.route("/api/appointments/<int:appt_id>/status", methods=["PATCH"])
@@ -17,20 +20,58 @@ def update_appointment_status(appt_id):
     data = request.get_json(silent=True) or {}
     new_status = data.get("status")
 
-    allowed = ("pending", "confirmed", "completed", "cancelled")
-    if new_status not in allowed:
-        return jsonify({"error": f"Estado inválido. Permitidos: {allowed}"}), 400
+    if new_status not in _ALLOWED_STATUSES:
+        return jsonify({"error": f"Estado inválido. Permitidos: {_ALLOWED_STATUSES}"}), 400
 
-    cal_ok = update_calendar_event_status(appt, new_status)
+    # El cambio en Calendar se guarda en el outbox, en la misma transacción que el estado
     appt.status = new_status
     appt.updated_at = datetime.utcnow()
+    calendar_queued = queue_calendar_status_change(appt, new_status)
     db.session.commit()
+    if calendar_queued:
+        outbox.kick()
 
     return jsonify({
         "ok": True,
         "status": appt.status,
         "status_label": appt.status_label,
-        "calendar_updated": cal_ok,
+        "calendar_queued": calendar_queued,
+    })
+
+
+@admin_bp.route("/api/appointments/status", methods=["PATCH"])
+@login_required_admin
+def bulk_update_appointment_status():
+    data = request.get_json(silent=True) or {}
+    new_status = data.get("status")
+    ids = data.get("ids")
+
+    if new_status not in _ALLOWED_STATUSES:
+        return jsonify({"error": f"Estado inválido. Permitidos: {_ALLOWED_STATUSES}"}), 400
+    if (not isinstance(ids, list) or not ids or len(ids) > _MAX_BULK_APPOINTMENTS
+            or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"error": f"'ids' debe ser una lista de 1 a {_MAX_BULK_APPOINTMENTS} IDs"}), 400
+
+    # Un solo commit con todos los estados y sus mensajes del outbox; el drenado
+    # los envía a Calendar en batch HTTP (un round trip por cada 50 cambios)
+    appointments = Appointment.query.filter(Appointment.id.in_(ids)).all()
+    now = datetime.utcnow()
+    calendar_queued = 0
+    for appt in appointments:
+        appt.status = new_status
+        appt.updated_at = now
+        calendar_queued += queue_calendar_status_change(appt, new_status)
+    db.session.commit()
+    if calendar_queued:
+        outbox.kick()
+
+    found = {appt.id for appt in appointments}
+    return jsonify({
+        "ok": True,
+        "status": new_status,
+        "updated": len(appointments),
+        "not_found": [i for i in ids if i not in found],
+        "calendar_queued": calendar_queued,
     })
 
 
@@ -88,6 +129,9 @@ def delete_clinical_note(patient_id, note_id):
 @admin_required  # Solo admins pueden forzar sincronización
 def calendar_sync():
     result = sync_from_calendar()
+    if result.get("ok"):
+        # Con el espejo recién sincronizado: corregir en Calendar lo que no cuadra con la DB
+        result["repairs"] = repair_calendar_events()
     return jsonify(result)
 
 
@@ -1,21 +1,19 @@
 import os
-import logging
-import sys
+import json
+import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
 
 from dotenv import load_dotenv
 
 # Cargar .env antes de cualquier os.getenv() — crítico para Sentry y otros servicios
 load_dotenv()
 
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify, make_response
+from flask import Flask, Response, render_template, request, session, redirect, url_for, jsonify, make_response, stream_with_context
 from googleapiclient.errors import HttpError
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
-from dateutil import parser
 
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
@@ -30,18 +28,22 @@ if _sentry_dsn:
         send_default_pii=False,
     )
 
+from services.log_pipeline import setup_logging
 from services.validation_service import ValidationService
+from services.llm_executor import ExecutorBusy
+from services.idempotency import IdempotencyInProgress, IdempotencyKeyReused, valid_idempotency_key
 from constants import SINTOMAS_DISPONIBLES
-from services.conversation_service import ConversationService
+from services.conversation_service import ConversationService, RESPUESTA_OCUPADO, warm_symptom_openings
 from services.appointment_service import (
     validar_telefono,
     validar_horario_cita,
-    verificar_disponibilidad_atomica,
     crear_evento_calendar,
     enviar_correo_confirmacion,
-    agendar_cita_completa,
-    get_calendar_service,
-    parsear_fecha_google
+    agendar_cita_idempotente,
+    buscar_proximos_horarios,
+    consultar_horario_ocupado,
+    obtener_disponibilidad_dia,
+    warm_calendar_clients,
 )
 
 app = Flask(__name__)
@@ -136,22 +138,28 @@ limiter = Limiter(
     strategy="fixed-window"
 )
 
-os.makedirs('logs', exist_ok=True)
+# Logging asíncrono: los requests solo encolan; un hilo formatea y escribe (stdout + archivo)
+setup_logging()
 
-handler = RotatingFileHandler('logs/app.log', maxBytes=10 * 1024 * 1024, backupCount=5)
-handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
+# ==================== SERVICIOS ====================
 
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-app.logger.addHandler(console_handler)
+validation_service = ValidationService()
 
-logging.basicConfig(level=logging.INFO)
-app.logger.setLevel(logging.INFO)
+def _calentar_worker():
+    """Abre la conexión con Groq y precalcula las aperturas por síntoma."""
+    from services.ai_service import AIServiceFactory
+    AIServiceFactory.get_instance().warm_up()
+    if os.getenv('AI_WARM_OPENINGS', 'true').lower() != 'false':
+        warm_symptom_openings()
 
-# ==================== SERVICIOS ====================
+# Calentamiento en segundo plano al arrancar cada worker (no bloquea el arranque)
+if os.getenv('GROQ_API_KEY') and os.getenv('FLASK_ENV') != 'testing':
+    threading.Thread(target=_calentar_worker, name="warm-worker", daemon=True).start()
+
+# Clientes de Calendar y token listos antes del primer request que los necesite
+if os.getenv('GOOGLE_CREDENTIALS') and os.getenv('FLASK_ENV') != 'testing':
+    threading.Thread(target=warm_calendar_clients, name="warm-calendar", daemon=True).start()
 
-validation_service = ValidationService()
 @app.route("/", methods=["GET", "POST"])
 @limiter.limit("500 per hour")
 def index():
@@ -164,6 +172,9 @@ def index():
     
     # Inicializar sesión si es necesario
     conversation_service.initialize_session()
+
+    # Registrar la respuesta de un stream anterior (si la hay)
+    conversation_service.resolve_pending_response()
     
     if request.method == "POST":
         # Manejar solicitud POST usando el servicio de conversación
@@ -172,6 +183,11 @@ def index():
         if not success and error_message:
             # Si hay un error, renderizar con mensaje de error
             template_data = conversation_service.get_template_data()
+            if error_message == RESPUESTA_OCUPADO:
+                # Saturado: la respuesta de ocupado se muestra pero no se guarda en el historial
+                conversacion = template_data["conversacion"]
+                conversacion.historial = conversacion.historial + [{"tipo": "bot", "mensaje": RESPUESTA_OCUPADO}]
+                return render_template("index.html", **template_data), 503, {"Retry-After": "5"}
             return render_template("index.html", error=error_message, **template_data)
         
         # Redirigir para evitar reenvío de formulario
@@ -181,6 +197,40 @@ def index():
     template_data = conversation_service.get_template_data()
     return render_template("index.html", **template_data)
 
+@app.route("/chat/stream", methods=["POST"])
+@limiter.limit("500 per hour")
+def chat_stream():
+    """
+    Conversación con respuesta en streaming (Server-Sent Events).
+    Emite eventos "token" con cada fragmento y un evento "done" con la respuesta final.
+    """
+    data = request.get_json(silent=True) or {}
+    conversation_service = ConversationService()
+    conversation_service.initialize_session()
+
+    try:
+        success, error_message, eventos = conversation_service.start_streaming_response(
+            data.get("user_input", "")
+        )
+    except ExecutorBusy as e:
+        # Saturado: se rechaza sin retener el hilo; el cliente conserva el mensaje
+        app.logger.warning(f"⏳ Chat en streaming rechazado por saturación: {e}")
+        response = jsonify({"error": RESPUESTA_OCUPADO, "ocupado": True})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    if not success:
+        return jsonify({"error": error_message}), 400
+
+    def generar():
+        for evento, dato in eventos:
+            yield f"event: {evento}\ndata: {json.dumps(dato, ensure_ascii=False)}\n\n"
+
+    response = Response(stream_with_context(generar()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 @app.route("/reset", methods=["POST"])
 @limiter.limit("50 per hour")
 def reset():
@@ -222,58 +272,17 @@ def verificar_horario():
         except ValueError:
             return jsonify({"error": "Formato de fecha u hora inválido"}), 400
         
-        # Verificar servicio de calendario primero
-        service = get_calendar_service()
-        if not service:
-            app.logger.error("❌ Servicio de calendario no disponible")
-            return jsonify({"disponible": False, "error": "Servicio no disponible"})
-        
-        # Verificación estricta
-        start_time = f"{fecha}T{hora}:00-05:00"
-        end_time = f"{fecha}T{int(hora.split(':')[0])+1}:00:00-05:00"
-        
-        time_min = f"{fecha}T00:00:00-05:00"
-        time_max = f"{fecha}T23:59:59-05:00"
-        
+        # Índice de ocupación en memoria (freebusy) en lugar de listar los eventos del día
         try:
-            eventos = service.events().list(
-                calendarId='primary',
-                timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                maxResults=50,
-                orderBy='startTime'
-            ).execute()
-            
-            app.logger.info(f"📅 Eventos encontrados: {len(eventos.get('items', []))}")
-            
+            ocupado = consultar_horario_ocupado(fecha, hora)
         except Exception as e:
-            app.logger.error(f"❌ Error al listar eventos: {e}")
+            app.logger.error(f"❌ Error al consultar el calendario: {e}")
             return jsonify({"disponible": False, "error": "Error al verificar calendario"})
+        if ocupado is None:
+            app.logger.error("❌ Servicio de calendario no disponible")
+            return jsonify({"disponible": False, "error": "Servicio no disponible"})
         
-        # Verificar superposición 
-        disponible = True
-        hora_solicitada_start = parser.isoparse(start_time)
-        hora_solicitada_end = parser.isoparse(end_time)
-        
-        for evento in eventos.get('items', []):
-            evento_start_str = evento['start'].get('dateTime', evento['start'].get('date'))
-            evento_end_str = evento['end'].get('dateTime', evento['end'].get('date'))
-            
-            try:
-                # Convertir tiempos del evento usando la nueva función
-                if 'T' in evento_start_str:
-                    fecha_inicio, fecha_fin = parsear_fecha_google(evento)
-                    if fecha_inicio and fecha_fin:
-                        # Verificar superposición estricta
-                        if (fecha_inicio < hora_solicitada_end and fecha_fin > hora_solicitada_start):
-                            app.logger.info(f"❌ Horario {hora} ocupado por evento: {evento.get('summary', 'Sin título')}")
-                            disponible = False
-                            break
-                        
-            except ValueError as e:
-                app.logger.warning(f"Error parsing event time: {e}")
-                continue
+        disponible = not ocupado
         
         app.logger.info(f"Horario {fecha} {hora}: {'✅ DISPONIBLE' if disponible else '❌ OCUPADO'}")
         
@@ -289,7 +298,10 @@ def verificar_horario():
 @app.route("/obtener-horarios-disponibles", methods=["POST"])
 @limiter.limit("60 per minute")
 def obtener_horarios_disponibles():
-    """Endpoint para obtener horarios disponibles con validaciones estrictas"""
+    """
+    Horarios del día con su ocupación real ({hora, disponible, mensaje}),
+    a partir de una sola consulta de intervalos ocupados al calendario.
+    """
     try:
         data = request.get_json(silent=True)
         if not data or 'fecha' not in data:
@@ -303,14 +315,29 @@ def obtener_horarios_disponibles():
         except ValueError:
             return jsonify({"error": "Formato de fecha inválido"}), 400
         
-        horarios_disponibles = validation_service.get_available_time_slots(fecha)
-        
-        return jsonify(horarios_disponibles)
+        return jsonify(obtener_disponibilidad_dia(fecha))
         
     except Exception as e:
         app.logger.error(f"Error obteniendo horarios disponibles: {e}")
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@app.route("/proximos-horarios", methods=["GET"])
+@limiter.limit("60 per minute")
+def proximos_horarios():
+    """Primeros horarios libres de los próximos 30 días (?cantidad=N, máximo 20)."""
+    try:
+        cantidad = min(max(int(request.args.get('cantidad', 5)), 1), 20)
+    except ValueError:
+        return jsonify({"error": "Cantidad inválida"}), 400
+    try:
+        horarios = buscar_proximos_horarios(cantidad)
+    except Exception as e:
+        app.logger.error(f"Error buscando próximos horarios: {e}")
+        return jsonify({"error": "Error interno del servidor"}), 500
+    if horarios is None:
+        return jsonify({"error": "Servicio no disponible"}), 503
+    return jsonify({"horarios": horarios})
+
 @app.route("/agendar-cita", methods=["POST"])
 @limiter.limit("40 per minute")
 def agendar_cita():
@@ -332,39 +359,35 @@ def agendar_cita():
         if sintoma not in SINTOMAS_DISPONIBLES:
             return jsonify({"error": "Síntoma no válido"}), 400
 
-        # Usar la función completa de agendamiento
-        success, message, calendar_event_id = agendar_cita_completa(fecha, hora, telefono, sintoma)
+        # Los reintentos de fetchWithRetry y los dobles clics repiten la misma clave
+        clave = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+        if clave is not None and not valid_idempotency_key(clave):
+            return jsonify({"error": "Idempotency-Key inválida"}), 400
+
+        # Reserva en la DB; Calendar y el correo los procesa un worker
+        try:
+            success, message, appointment_id, repetida = agendar_cita_idempotente(
+                clave, fecha, hora, telefono, sintoma, nombre=data.get("nombre", "Paciente")
+            )
+        except IdempotencyKeyReused:
+            return jsonify({"error": "La Idempotency-Key ya se usó con otros datos"}), 422
+        except IdempotencyInProgress:
+            return jsonify({"error": "La reserva sigue en proceso. Intenta de nuevo en unos segundos."}), 409
 
         if not success:
             if "inválido" in message.lower() or "formato" in message.lower():
                 return jsonify({"error": message}), 400
-            elif "no disponible" in message.lower() or "ocupado" in message.lower():
+            elif any(p in message.lower() for p in ("no disponible", "ocupado", "reservado")):
                 return jsonify({"error": message}), 409
             else:
                 return jsonify({"error": message}), 500
 
-        # Guardar cita y paciente en la base de datos
-        try:
-            from services.admin_service import find_or_create_patient
-            from models import Appointment as AppointmentModel
-            patient_name = data.get("nombre", "Paciente")
-            patient = find_or_create_patient(
-                name=patient_name, phone=telefono, symptom=sintoma
-            )
-            scheduled_dt = datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M")
-            appt = AppointmentModel(
-                patient_id=patient.id,
-                scheduled_at=scheduled_dt,
-                symptom=sintoma,
-                status="pending",
-                calendar_event_id=calendar_event_id,  # ID real del evento
-            )
-            db.session.add(appt)
-            db.session.commit()
-        except Exception as db_err:
-            app.logger.warning(f"No se pudo guardar cita en DB: {db_err}")
-
-        app.logger.info(f"✅ Cita agendada exitosamente: {fecha} {hora} para {telefono}")
+        if repetida:
+            app.logger.info(f"🔁 Reserva repetida con la misma clave: id={appointment_id}")
+            if session.get("estado") == "fin":
+                return _respuesta_reserva(repetida)
+        else:
+            app.logger.info(f"✅ Cita agendada exitosamente: id={appointment_id} {fecha} {hora} para {telefono}")
 
         # Actualizar sesión para mostrar estado final
         if "conversacion_data" not in session:
@@ -393,15 +416,32 @@ def agendar_cita():
         session["estado"] = "fin"
         session["conversacion_data"] = conversacion_data
 
-        return jsonify({
-            "status": "success",
-            "message": "Cita agendada exitosamente",
-        })
+        return _respuesta_reserva(repetida)
         
     except Exception as e:
         app.logger.error(f"Error al agendar cita: {e}")
         return jsonify({"error": "Error al procesar la cita"}), 500
 
+
+def _respuesta_reserva(repetida: bool):
+    response = jsonify({
+        "status": "success",
+        "message": "Cita agendada exitosamente",
+    })
+    if repetida:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+@app.route("/calendar/webhook", methods=["POST"])
+@csrf.exempt
+@limiter.limit("120 per minute")
+def calendar_webhook():
+    """Notificación push de Google Calendar (events.watch): dispara una sincronización incremental del espejo."""
+    from services.calendar_mirror import handle_push_notification
+    status, accion = handle_push_notification(request.headers, app)
+    app.logger.debug("📡 Push del calendario (%s): %s", request.headers.get('X-Goog-Resource-State'), accion)
+    return ('', status)
+
 @app.route('/health')
 def health_check():
     """
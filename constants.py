@@ -4,18 +4,25 @@ Constantes globales de la aplicación Equilibra.
 """
 
 import re as _re
+from typing import NamedTuple, Optional, Tuple
 
-# Patrones de detección de crisis (expresiones regulares)
-CRISIS_PATTERNS = [
-    r'suicidio', r'autolesión', r'autoflagelo', r'matarme',
-    r'no\s+quiero\s+vivir', r'acabar\s+con\s+todo',
-    r'no\s+vale\s+la\s+pena', r'sin\s+esperanza',
-    r'quiero\s+morir', r'terminar\s+con\s+todo',
-    r'me\s+quiero\s+morir', r'acabar\s+con\s+mi\s+vida',
-    r'no\s+puedo\s+m[aá]s', r'estoy\s+harto(a)?', r'sin\s+sentido',
-    r'despedirme', r'adios', r'no\s+aguanto', r'cansado(a)?\s+de\s+vivir',
-    r'desesperado',
-]
+# Patrones de detección de crisis (expresiones regulares), agrupados por categoría
+CRISIS_CATEGORIES = {
+    "ideacion_suicida": [
+        r'suicidio', r'matarme', r'no\s+quiero\s+vivir', r'quiero\s+morir',
+        r'me\s+quiero\s+morir', r'acabar\s+con\s+mi\s+vida',
+        r'acabar\s+con\s+todo', r'terminar\s+con\s+todo',
+        r'cansado(?:a)?\s+de\s+vivir',
+    ],
+    "autolesion": [r'autolesión', r'autoflagelo'],
+    "desesperanza": [
+        r'no\s+vale\s+la\s+pena', r'sin\s+esperanza', r'no\s+puedo\s+m[aá]s',
+        r'estoy\s+harto(?:a)?', r'sin\s+sentido', r'no\s+aguanto', r'desesperado',
+    ],
+    "despedida": [r'despedirme', r'adios'],
+}
+
+CRISIS_PATTERNS = [p for patterns in CRISIS_CATEGORIES.values() for p in patterns]
 
 CRISIS_RESPONSE = (
     "Veo que estás pasando por un momento muy difícil. "
@@ -28,10 +35,47 @@ CRISIS_RESPONSE = (
 )
 
 
+class CrisisMatch(NamedTuple):
+    """Resultado de buscar_crisis: categoría, posición y texto que coincidió."""
+    category: str
+    span: Tuple[int, int]
+    matched: str
+
+
+def _compilar_patrones_crisis() -> "_re.Pattern":
+    """
+    Une todos los patrones en una sola alternancia con un grupo nombrado por categoría.
+    Coincide con las mismas subcadenas que re.search patrón por patrón (sin límites
+    de palabra: "radios" contiene "adios"); el texto se pasa a minúsculas una vez
+    en lugar de usar IGNORECASE, que desactiva la búsqueda rápida por prefijo literal.
+    """
+    grupos = [
+        f"(?P<{categoria}>{'|'.join(patterns)})"
+        for categoria, patterns in CRISIS_CATEGORIES.items()
+    ]
+    return _re.compile("|".join(grupos))
+
+
+# Compilado una sola vez al importar: una única pasada por mensaje
+_CRISIS_RE = _compilar_patrones_crisis()
+
+
+def buscar_crisis(texto: str) -> Optional[CrisisMatch]:
+    """
+    Busca indicadores de crisis en una sola pasada.
+    Retorna la primera coincidencia (categoría + span sobre texto.lower()) o None.
+    """
+    if not texto:
+        return None
+    match = _CRISIS_RE.search(texto.lower())
+    if match is None:
+        return None
+    return CrisisMatch(match.lastgroup, match.span(), match.group())
+
+
 def detectar_crisis(texto: str) -> bool:
     """Devuelve True si el texto contiene indicadores de crisis."""
-    texto_lower = texto.lower()
-    return any(_re.search(p, texto_lower) for p in CRISIS_PATTERNS)
+    return buscar_crisis(texto) is not None
 
 
 SINTOMAS_DISPONIBLES = [
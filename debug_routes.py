@@ -5,7 +5,6 @@ NUNCA debe estar accesible en producción.
 
 from flask import Blueprint, jsonify, current_app
 import os
-import time
 
 debug_bp = Blueprint("debug", __name__)
 
@@ -39,20 +38,20 @@ def debug_env_detailed():
 
 @debug_bp.route("/test-calendar-connection")
 def test_calendar_connection():
-    from services.appointment_service import get_calendar_service
+    from services.appointment_service import calendar_client
     from googleapiclient.errors import HttpError
     try:
-        service = get_calendar_service()
-        if not service:
-            return jsonify({"error": "No se pudo crear el servicio"})
-        calendars = service.calendarList().list().execute()
-        test_event = {
-            "summary": "Test Connection - DELETE",
-            "start": {"dateTime": "2025-01-01T10:00:00-05:00", "timeZone": "America/Guayaquil"},
-            "end": {"dateTime": "2025-01-01T11:00:00-05:00", "timeZone": "America/Guayaquil"},
-        }
-        created = service.events().insert(calendarId="primary", body=test_event).execute()
-        service.events().delete(calendarId="primary", eventId=created["id"]).execute()
+        with calendar_client() as service:
+            if not service:
+                return jsonify({"error": "No se pudo crear el servicio"})
+            calendars = service.calendarList().list().execute()
+            test_event = {
+                "summary": "Test Connection - DELETE",
+                "start": {"dateTime": "2025-01-01T10:00:00-05:00", "timeZone": "America/Guayaquil"},
+                "end": {"dateTime": "2025-01-01T11:00:00-05:00", "timeZone": "America/Guayaquil"},
+            }
+            created = service.events().insert(calendarId="primary", body=test_event).execute()
+            service.events().delete(calendarId="primary", eventId=created["id"]).execute()
         return jsonify({
             "status": "success",
             "calendars": len(calendars.get("items", [])),
@@ -64,18 +63,18 @@ def test_calendar_connection():
 
 @debug_bp.route("/debug-calendario")
 def debug_calendario():
-    from services.appointment_service import get_calendar_service
+    from services.appointment_service import calendar_client
     from datetime import datetime, timedelta
     try:
-        service = get_calendar_service()
-        if not service:
-            return jsonify({"error": "No hay servicio de calendario"})
-        hoy = datetime.now().strftime("%Y-%m-%dT00:00:00-05:00")
-        manana = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%dT00:00:00-05:00")
-        eventos = service.events().list(
-            calendarId="primary", timeMin=hoy, timeMax=manana,
-            singleEvents=True, maxResults=50, orderBy="startTime",
-        ).execute()
+        with calendar_client() as service:
+            if not service:
+                return jsonify({"error": "No hay servicio de calendario"})
+            hoy = datetime.now().strftime("%Y-%m-%dT00:00:00-05:00")
+            manana = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%dT00:00:00-05:00")
+            eventos = service.events().list(
+                calendarId="primary", timeMin=hoy, timeMax=manana,
+                singleEvents=True, maxResults=50, orderBy="startTime",
+            ).execute()
         return jsonify({
             "total_eventos": len(eventos.get("items", [])),
             "eventos": [
@@ -89,20 +88,20 @@ def debug_calendario():
 
 @debug_bp.route("/test-calendar")
 def test_calendar():
-    from services.appointment_service import get_calendar_service
+    from services.appointment_service import calendar_client
     from googleapiclient.errors import HttpError
     try:
-        service = get_calendar_service()
-        if not service:
-            return jsonify({"error": "No se pudo crear el servicio"})
-        calendars = service.calendarList().list().execute()
-        test_event = {
-            "summary": "Test Equilibra - Borrar",
-            "start": {"dateTime": "2025-01-01T10:00:00-05:00", "timeZone": "America/Guayaquil"},
-            "end": {"dateTime": "2025-01-01T11:00:00-05:00", "timeZone": "America/Guayaquil"},
-        }
-        created = service.events().insert(calendarId="primary", body=test_event).execute()
-        service.events().delete(calendarId="primary", eventId=created["id"]).execute()
+        with calendar_client() as service:
+            if not service:
+                return jsonify({"error": "No se pudo crear el servicio"})
+            calendars = service.calendarList().list().execute()
+            test_event = {
+                "summary": "Test Equilibra - Borrar",
+                "start": {"dateTime": "2025-01-01T10:00:00-05:00", "timeZone": "America/Guayaquil"},
+                "end": {"dateTime": "2025-01-01T11:00:00-05:00", "timeZone": "America/Guayaquil"},
+            }
+            created = service.events().insert(calendarId="primary", body=test_event).execute()
+            service.events().delete(calendarId="primary", eventId=created["id"]).execute()
         return jsonify({
             "status": "success",
             "calendars": [c["summary"] for c in calendars.get("items", [])],
@@ -118,21 +117,45 @@ def test_calendar():
 
 @debug_bp.route("/debug-cache")
 def debug_cache():
-    from app import respuestas_ia_cache, respuestas_ia_cache_lock, CACHE_MAX_SIZE, CACHE_TTL
+    from services.appointment_service import (
+        busy_index, calendar_pool, get_calendar_token_stats, reservas_idempotentes, slot_locks,
+    )
+    from services.calendar_mirror import get_mirror_stats
+    from services.calendar_ops import get_calendar_ops_stats
+    from services.outbox import get_outbox_stats
+    from services.response_cache import get_cache_stats
     try:
-        with respuestas_ia_cache_lock:
-            entries = []
-            for key, (ts, resp) in list(respuestas_ia_cache.items())[:5]:
-                entries.append({
-                    "key": key[:12] + "...",
-                    "age_seconds": int(time.time() - ts),
-                    "preview": resp[:100] + "..." if len(resp) > 100 else resp,
-                })
-            return jsonify({
-                "total_entries": len(respuestas_ia_cache),
-                "max_size": CACHE_MAX_SIZE,
-                "ttl_seconds": CACHE_TTL,
-                "entries": entries,
-            })
+        return jsonify({
+            "caches": get_cache_stats(include_entries=True),
+            "calendar_busy_index": busy_index.stats(),
+            "calendar_pool": calendar_pool.stats(),
+            "calendar_token": get_calendar_token_stats(),
+            "calendar_mirror": get_mirror_stats(),
+            "calendar_ops": get_calendar_ops_stats(),
+            "outbox": get_outbox_stats(),
+            "booking_idempotency": reservas_idempotentes.stats(),
+            "slot_locks": slot_locks.stats(),
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@debug_bp.route("/debug-ai")
+def debug_ai():
+    from services.groq_transport import get_transport_stats
+    from services.hedging import get_hedging_stats
+    from services.llm_executor import get_executor_stats
+    from services.log_pipeline import get_logging_stats
+    from services.model_router import get_routing_stats
+    from services.rate_governor import get_rate_limit_stats
+    try:
+        return jsonify({
+            "hedging": get_hedging_stats(),
+            "routing": get_routing_stats(),
+            "rate_limits": get_rate_limit_stats(),
+            "executors": get_executor_stats(),
+            "http_transport": get_transport_stats(),
+            "logging": get_logging_stats(),
+        })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
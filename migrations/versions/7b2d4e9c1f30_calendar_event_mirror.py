@@ -0,0 +1,57 @@
+"""calendar event mirror and sync state
+
+Revision ID: 7b2d4e9c1f30
+Revises: 3acc282e0e25
+Create Date: 2026-10-17 10:12:05.118233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2d4e9c1f30'
+down_revision = '3acc282e0e25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'calendar_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('calendar_id', sa.String(length=200), nullable=False),
+        sa.Column('event_id', sa.String(length=200), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('summary', sa.String(length=500), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('start_at', sa.DateTime(), nullable=False),
+        sa.Column('end_at', sa.DateTime(), nullable=False),
+        sa.Column('all_day', sa.Boolean(), nullable=False),
+        sa.Column('transparent', sa.Boolean(), nullable=False),
+        sa.Column('google_updated', sa.String(length=40), nullable=True),
+        sa.Column('synced_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('calendar_id', 'event_id', name='uq_calendar_events_event'),
+    )
+    with op.batch_alter_table('calendar_events', schema=None) as batch_op:
+        batch_op.create_index('ix_calendar_events_range', ['calendar_id', 'start_at', 'end_at'], unique=False)
+
+    op.create_table(
+        'calendar_sync_state',
+        sa.Column('calendar_id', sa.String(length=200), nullable=False),
+        sa.Column('sync_token', sa.Text(), nullable=True),
+        sa.Column('last_full_sync', sa.DateTime(), nullable=True),
+        sa.Column('last_sync', sa.DateTime(), nullable=True),
+        sa.Column('channel_id', sa.String(length=100), nullable=True),
+        sa.Column('channel_resource_id', sa.String(length=200), nullable=True),
+        sa.Column('channel_expiration', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('calendar_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('calendar_sync_state')
+    with op.batch_alter_table('calendar_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_calendar_events_range')
+    op.drop_table('calendar_events')
@@ -7,5 +7,7 @@ from .patient import Patient
 from .appointment import Appointment
 from .conversation import Conversation
 from .clinical_note import ClinicalNote
+from .calendar_event import CalendarEvent, CalendarSyncState
+from .outbox import OutboxMessage
 
-__all__ = ["db", "User", "Patient", "Appointment", "Conversation", "ClinicalNote"]
+__all__ = ["db", "User", "Patient", "Appointment", "Conversation", "ClinicalNote", "CalendarEvent", "CalendarSyncState", "OutboxMessage"]
@@ -2,13 +2,15 @@ from datetime import datetime
 from . import db
 
 
-APPOINTMENT_STATUSES = ("pending", "confirmed", "completed", "cancelled")
+# "conflict": el worker encontró el horario ocupado en Calendar al ir a crear el evento
+APPOINTMENT_STATUSES = ("pending", "confirmed", "completed", "cancelled", "conflict")
 
 STATUS_LABELS = {
     "pending": "Pendiente",
     "confirmed": "Confirmada",
     "completed": "Completada",
     "cancelled": "Cancelada",
+    "conflict": "Conflicto de horario",
 }
 
 
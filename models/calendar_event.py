@@ -0,0 +1,53 @@
+from datetime import datetime
+from . import db
+
+
+class CalendarEvent(db.Model):
+    """Copia local de un evento de Google Calendar (espejo mantenido con syncToken)."""
+
+    __tablename__ = "calendar_events"
+    __table_args__ = (
+        db.UniqueConstraint("calendar_id", "event_id", name="uq_calendar_events_event"),
+        db.Index("ix_calendar_events_range", "calendar_id", "start_at", "end_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.String(200), nullable=False, default="primary")
+    event_id = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="confirmed")
+    summary = db.Column(db.String(500), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+    # Hora local (America/Guayaquil) sin zona, como Appointment.scheduled_at
+    start_at = db.Column(db.DateTime, nullable=False)
+    end_at = db.Column(db.DateTime, nullable=False)
+    all_day = db.Column(db.Boolean, nullable=False, default=False)
+    # "transparent" = no bloquea el horario (Mostrar como: Disponible)
+    transparent = db.Column(db.Boolean, nullable=False, default=False)
+    google_updated = db.Column(db.String(40), nullable=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "event_id": self.event_id,
+            "status": self.status,
+            "summary": self.summary,
+            "start_at": self.start_at.isoformat() if self.start_at else None,
+            "end_at": self.end_at.isoformat() if self.end_at else None,
+            "all_day": self.all_day,
+            "transparent": self.transparent,
+        }
+
+
+class CalendarSyncState(db.Model):
+    """Estado de la sincronización incremental por calendario."""
+
+    __tablename__ = "calendar_sync_state"
+
+    calendar_id = db.Column(db.String(200), primary_key=True)
+    sync_token = db.Column(db.Text, nullable=True)
+    last_full_sync = db.Column(db.DateTime, nullable=True)
+    last_sync = db.Column(db.DateTime, nullable=True)
+    # Canal de notificaciones push (events.watch), si está configurado
+    channel_id = db.Column(db.String(100), nullable=True)
+    channel_resource_id = db.Column(db.String(200), nullable=True)
+    channel_expiration = db.Column(db.DateTime, nullable=True)
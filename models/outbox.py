@@ -0,0 +1,37 @@
+from datetime import datetime
+from . import db
+
+
+OUTBOX_STATUSES = ("pending", "done", "failed")
+
+
+class OutboxMessage(db.Model):
+    """Efecto externo pendiente (Calendar, email), escrito en la misma transacción que la cita."""
+
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        db.Index("ix_outbox_messages_pending", "status", "available_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    appointment_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "appointment_id": self.appointment_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "processed_at": self.processed_at.isoformat() if self.processed_at else None,
+        }
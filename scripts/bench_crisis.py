@@ -0,0 +1,55 @@
+"""
+Microbenchmark de la detección de crisis por mensaje.
+
+Compara el recorrido anterior (un re.search por patrón sobre el texto en
+minúsculas) con la expresión única compilada de constants.buscar_crisis.
+
+Uso:
+    python scripts/bench_crisis.py [repeticiones]
+"""
+import sys
+import os
+import re
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import CRISIS_PATTERNS, buscar_crisis
+
+MENSAJES = [
+    "Hola, últimamente me siento muy ansioso en el trabajo y no duermo bien.",
+    "Discuto mucho con mi pareja y no sé cómo manejarlo, me frustra bastante. " * 3,
+    "La verdad ya no puedo más con esta situación.",
+    "Creo que necesito ayuda para organizar mejor mi día.",
+]
+
+
+def detectar_por_patron(texto: str) -> bool:
+    """Implementación previa: un re.search por patrón en cada mensaje."""
+    texto_lower = texto.lower()
+    return any(re.search(p, texto_lower) for p in CRISIS_PATTERNS)
+
+
+def detectar_compilado(texto: str) -> bool:
+    return buscar_crisis(texto) is not None
+
+
+def medir(func, repeticiones: int) -> float:
+    """Microsegundos por mensaje (mejor de 5 rondas)."""
+    tiempos = timeit.repeat(
+        lambda: [func(m) for m in MENSAJES], number=repeticiones, repeat=5
+    )
+    return min(tiempos) / (repeticiones * len(MENSAJES)) * 1e6
+
+
+if __name__ == "__main__":
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    for m in MENSAJES:
+        assert detectar_por_patron(m) == detectar_compilado(m), m
+
+    antes = medir(detectar_por_patron, repeticiones)
+    despues = medir(detectar_compilado, repeticiones)
+    print(f"Por patrón (re.search x{len(CRISIS_PATTERNS)}): {antes:.2f} µs/mensaje")
+    print(f"Expresión única compilada:       {despues:.2f} µs/mensaje")
+    print(f"Mejora: {antes / despues:.1f}x")
@@ -0,0 +1,52 @@
+"""
+Simula una notificación push de Google Calendar contra el webhook local.
+
+Google solo entrega notificaciones a URLs HTTPS públicas; en desarrollo este
+script envía las mismas cabeceras que manda events.watch para probar el flujo
+webhook → sincronización incremental del espejo.
+
+Uso:
+    python scripts/simulate_calendar_push.py [url] [estado]
+
+    url     — default: http://localhost:5000/calendar/webhook
+    estado  — X-Goog-Resource-State: sync | exists | not_exists (default: exists)
+
+Requiere CALENDAR_WEBHOOK_TOKEN (el mismo que usa la app).
+"""
+import sys
+import os
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def push_headers(token: str, state: str = "exists", message_number: int = 1) -> dict:
+    """Cabeceras de una notificación de events.watch."""
+    return {
+        "X-Goog-Channel-ID": f"local-{uuid.uuid4().hex[:8]}",
+        "X-Goog-Channel-Token": token,
+        "X-Goog-Message-Number": str(message_number),
+        "X-Goog-Resource-ID": "local-resource",
+        "X-Goog-Resource-State": state,
+        "X-Goog-Resource-URI": "https://www.googleapis.com/calendar/v3/calendars/primary/events",
+    }
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:5000/calendar/webhook"
+    state = sys.argv[2] if len(sys.argv) > 2 else "exists"
+    token = os.getenv("CALENDAR_WEBHOOK_TOKEN")
+    if not token:
+        print("[ERROR] Define CALENDAR_WEBHOOK_TOKEN")
+        sys.exit(1)
+
+    response = httpx.post(url, headers=push_headers(token, state))
+    print(f"[INFO] {state} → HTTP {response.status_code}")
+
+
+if __name__ == "__main__":
+    main()
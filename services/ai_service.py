@@ -7,76 +7,131 @@ import os
 import time
 import threading
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List
 import re
 from groq import Groq
 from functools import wraps
 import logging
-from constants import CRISIS_PATTERNS, CRISIS_RESPONSE
+from constants import CRISIS_RESPONSE, buscar_crisis
+from .prompt_normalizer import PromptNormalizer
+from .response_cache import CacheKeyBuilder, create_response_cache, register_cache
+from .single_flight import create_single_flight
+from .hedging import HedgedExecutor, HedgePolicy, register_hedging
+from .model_router import ModelRouter, register_router
+from .groq_transport import TransportConfig, build_http_client, register_transport, transport_stats
+from .rate_governor import (
+    BACKGROUND, CRISIS, INTERACTIVE, AdmissionRejected, RateGovernor,
+    current_priority, register_governor,
+)
 
 logger = logging.getLogger(__name__)
 
+# Expresiones de limpieza de respuestas, compiladas una sola vez
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC_RE = re.compile(r'\*(.*?)\*')
+_HEADER_RE = re.compile(r'^#+\s*', re.MULTILINE)
+_BULLET_RE = re.compile(r'^[\s]*[•\-*]\s*', re.MULTILINE)
+_NUMBERED_RE = re.compile(r'^[\s]*\d+[\.\)]\s*', re.MULTILINE)
+_EMOJI_RE = re.compile("["
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    u"\U00002702-\U000027B0"  # dingbats
+    u"\U000024C2-\U0001F251"
+    "]+", flags=re.UNICODE)
+_BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+
+
+class UncachedResponse(str):
+    """Respuesta de contingencia: se entrega al usuario pero cache_response no la guarda."""
+
 # ==================== DECORATOR PATTERN ====================
 
-def cache_response(max_size: int = 100, ttl: int = 3600):
+def cache_response(max_size: int = 100, ttl: int = 3600, max_bytes: int = 2 * 1024 * 1024,
+                   normalize_args: tuple = (), scope_arg: str = None, ignore_args: tuple = ()):
     """
-    Decorador para cachear respuestas de IA usando LRU cache
+    Decorador para cachear respuestas de IA sobre un ResponseCache (LRU + TTL),
+    con nivel L2 en Redis compartido entre workers cuando REDIS_URL está configurada.
+    La clave es un hash estable de los argumentos (sin la instancia); los argumentos
+    de `normalize_args` se canonicalizan, `scope_arg` agrupa las claves por ámbito
+    y los de `ignore_args` no entran en la clave.
+    Los fallos concurrentes con la misma clave se coalescen (single-flight): solo
+    uno ejecuta la función y el resto recibe su resultado, también entre workers.
+    Expone `wrapper.cache_lookup(*args, **kwargs) -> (clave, valor|None)`,
+    `wrapper.cache_store(respuesta, *args, **kwargs)` y `wrapper.cache` para que
+    otras rutas (p. ej. streaming) usen la misma caché, y `wrapper.uncached`
+    para generar variantes sin pasar por ella (p. ej. el pool de aperturas).
     """
-    cache = {}
-    cache_lock = threading.Lock()
-    
     def decorator(func):
+        normalizer = PromptNormalizer() if normalize_args else None
+        key_builder = CacheKeyBuilder(
+            func, normalizer=normalizer, normalize_args=normalize_args, scope_arg=scope_arg,
+            ignore_args=ignore_args,
+        )
+        cache = create_response_cache(func.__qualname__, max_entries=max_size, ttl=ttl, max_bytes=max_bytes)
+        flight = create_single_flight(func.__qualname__)
+        extra_stats = {"single_flight": flight.stats}
+        if normalizer:
+            extra_stats["normalization"] = normalizer.stats
+        register_cache(cache, **extra_stats)
+
+        def cache_lookup(*args, **kwargs):
+            cache_key, fingerprint = key_builder.build(*args, **kwargs)
+            cached = cache.get(cache_key)
+            if normalizer:
+                normalizer.record(cache_key, fingerprint, cached is not None)
+            return cache_key, cached
+
+        def cache_store(response, *args, **kwargs):
+            cache_key, fingerprint = key_builder.build(*args, **kwargs)
+            if cache.set(cache_key, response) and normalizer:
+                normalizer.remember(cache_key, fingerprint)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generar clave de caché basada en argumentos
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
-            
-            with cache_lock:
-                # Verificar si está en caché y no ha expirado
-                if cache_key in cache:
-                    timestamp, response = cache[cache_key]
-                    if time.time() - timestamp < ttl:
-                        logger.info(f"✅ Respuesta obtenida del caché para {func.__name__}")
-                        return response
-                    else:
-                        # Eliminar entrada expirada
-                        del cache[cache_key]
-            
-            # Ejecutar función original
-            response = func(*args, **kwargs)
-            
-            if response and len(response) > 10:
-                with cache_lock:
-                    # Limitar tamaño del caché
-                    if len(cache) >= max_size:
-                        # Eliminar la entrada más antigua
-                        oldest_key = min(cache.keys(), key=lambda k: cache[k][0])
-                        del cache[oldest_key]
-                    
-                    # Guardar en caché
-                    cache[cache_key] = (time.time(), response)
-                    logger.info(f"💾 Respuesta guardada en caché. Tamaño: {len(cache)}")
-            
+            cache_key, cached = cache_lookup(*args, **kwargs)
+            if cached is not None:
+                logger.debug("✅ Respuesta obtenida del caché para %s", func.__name__)
+                return cached
+
+            def compute():
+                response = func(*args, **kwargs)
+                if response and len(response) > 10 and not isinstance(response, UncachedResponse):
+                    cache_store(response, *args, **kwargs)
+                    logger.debug(f"💾 Respuesta guardada en caché. Tamaño: {len(cache)}")
+                return response
+
+            response, shared = flight.do(cache_key, compute, peek=lambda: cache.peek(cache_key))
+            if shared:
+                logger.debug("🔗 Respuesta compartida por coalescencia para %s", func.__name__)
             return response
+
+        wrapper.cache = cache
+        wrapper.flight = flight
+        wrapper.cache_lookup = cache_lookup
+        wrapper.cache_store = cache_store
+        wrapper.uncached = func
         return wrapper
     return decorator
 
 def log_execution(func):
     """
-    Decorador para logging de ejecución de funciones de IA
+    Decorador para logging de ejecución de funciones de IA.
+    Solo registra nombre y duración (en DEBUG, con formateo perezoso): los
+    argumentos contienen el texto del usuario y no deben ir a los logs.
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        logger.info(f"🚀 Iniciando {func.__name__} con args: {args}, kwargs: {kwargs}")
+        logger.debug("🚀 Iniciando %s", func.__name__)
         
         try:
             result = func(*args, **kwargs)
-            execution_time = time.time() - start_time
-            logger.info(f"✅ {func.__name__} completado en {execution_time:.2f}s")
+            logger.debug("✅ %s completado en %.2fs", func.__name__, time.time() - start_time)
             return result
         except Exception as e:
-            logger.error(f"❌ Error en {func.__name__}: {e}")
+            logger.error("❌ Error en %s: %s", func.__name__, e)
             raise
     
     return wrapper
@@ -87,8 +142,11 @@ class AIServiceStrategy(ABC):
     """Interfaz Strategy para servicios de IA."""
 
     @abstractmethod
-    def generate_response(self, text: str, symptom: str = None) -> str:
-        """Genera una respuesta de IA para el texto dado."""
+    def generate_response(self, text: str, symptom: str = None, user_input: str = None) -> str:
+        """
+        Genera una respuesta de IA para el texto dado. `text` es el prompt completo;
+        `user_input` es el mensaje original del usuario (sin contexto), si se conoce.
+        """
         pass
 
     @abstractmethod
@@ -96,53 +154,310 @@ class AIServiceStrategy(ABC):
         """Selecciona el modelo apropiado basado en la situación."""
         pass
 
+    def stream_response(self, text: str, symptom: str = None, user_input: str = None) -> Iterator[str]:
+        """
+        Genera la respuesta como fragmentos de texto (generador).
+        El valor de retorno del generador es la respuesta final completa.
+        Implementación por defecto: un único fragmento con generate_response().
+        """
+        response = self.generate_response(text, symptom, user_input)
+        yield response
+        return response
+
+    def summarize(self, previous_summary: str, turns: List[tuple], max_chars: int = 800) -> str:
+        """
+        Actualiza el resumen acumulado de una conversación con nuevos mensajes
+        (lista de (tipo, mensaje)). Implementación por defecto: extractiva,
+        conserva lo dicho por el usuario y recorta por el inicio.
+        """
+        nuevos = " ".join(f"El usuario comentó: {mensaje}" for tipo, mensaje in turns if tipo == "user")
+        summary = f"{previous_summary} {nuevos}".strip()
+        return summary if len(summary) <= max_chars else "..." + summary[-(max_chars - 3):]
+
+    def warm_up(self) -> bool:
+        """Prepara conexiones con el proveedor al arrancar. Por defecto no hay nada que preparar."""
+        return False
+
 class GroqAIService(AIServiceStrategy):
     """
     Implementación concreta usando Groq API
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, policy: Optional[HedgePolicy] = None):
         self.api_key = api_key or os.getenv('GROQ_API_KEY')
         if not self.api_key:
             raise ValueError("GROQ_API_KEY no configurada")
         
-        self.client = Groq(api_key=self.api_key)
+        # Presupuesto de latencia: el timeout del cliente coincide con el plazo duro
+        self.hedger = register_hedging("groq", HedgedExecutor(policy))
+        # Pool HTTP propio (keep-alive, HTTP/2 si hay h2) compartido por todos los hilos
+        self.transport_config = TransportConfig.from_env()
+        self.http_client = build_http_client(self.transport_config, timeout=self.hedger.policy.deadline)
+        register_transport("groq", transport_stats(self.http_client))
+        self.client = Groq(api_key=self.api_key, timeout=self.hedger.policy.deadline,
+                           max_retries=1, http_client=self.http_client)
+        self.fallback_service = FallbackAIService()
         self.available_models = {
             'high_quality': 'openai/gpt-oss-120b',
             'balanced': 'llama-3.1-70b-versatile',
             'fast': 'openai/gpt-oss-20b'
         }
+        self.router = register_router("groq", ModelRouter.from_env(self.available_models))
+        self.governor = register_governor("groq", RateGovernor.from_env())
     
     def select_model(self, text_length: int, complexity: str) -> str:
         """
-        Selecciona el modelo de Groq más apropiado según la situación
+        Selecciona el modelo de Groq más barato que cumple el SLO de latencia
+        de la clase de complejidad, según las estadísticas recientes (ModelRouter).
+        """
+        decision = self.router.choose(text_length, complexity)
+        logger.debug(f"🧭 Ruta {decision.route}: {decision.model} ({decision.reason})")
+        return decision.model
+
+    def warm_up(self) -> bool:
+        """
+        Abre la conexión con Groq (DNS + TLS) con una petición barata (lista de modelos)
+        para que el primer turno del worker no pague el establecimiento. No consume tokens.
+        """
+        if not self.transport_config.warmup:
+            return False
+        stats = transport_stats(self.http_client)
+        start = time.time()
+        try:
+            self.client.models.list()
+        except Exception as e:
+            logger.warning(f"Calentamiento de la conexión con Groq fallido: {e}")
+            if stats:
+                stats.warmup = {"ok": False, "error": str(e)}
+            return False
+        elapsed = time.time() - start
+        if stats:
+            stats.warmup = {"ok": True, "seconds": round(elapsed, 3)}
+        logger.info(f"🔌 Conexión con Groq calentada en {elapsed:.2f}s")
+        return True
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Estimación conservadora (≈3 caracteres por token) del prompt más la respuesta máxima."""
+        return sum(len(m["content"]) for m in messages) // 3 + max_tokens
+
+    def _admit(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+               priority: int) -> tuple:
         """
-        if complexity == 'crisis' or text_length > 200:
-            return self.available_models['high_quality']
-        elif complexity == 'complejo' or text_length > 100:
-            return self.available_models['balanced']
+        Reserva capacidad en los límites de Groq antes de llamar.
+        Retorna (modelo a usar, tokens estimados). Si no hay capacidad: las crisis
+        llaman igualmente, las interactivas bajan al modelo rápido si este tiene
+        capacidad inmediata, y el resto se descarta con AdmissionRejected.
+        """
+        estimated = self._estimate_tokens(messages, max_tokens)
+        admission = self.governor.acquire(model, estimated, priority)
+        if admission.granted:
+            return model, estimated
+        if priority == CRISIS:
+            logger.warning(f"🚦 Crisis sin capacidad en {model} ({admission.reason}); se llama igualmente")
+            self.governor.force(model, estimated)
+            return model, estimated
+        fast_model = self.available_models['fast']
+        if priority == INTERACTIVE and model != fast_model:
+            if self.governor.acquire(fast_model, estimated, priority, max_wait=0).granted:
+                logger.info(f"🚦 {model} sin capacidad ({admission.reason}); se usa {fast_model}")
+                return fast_model, estimated
+        raise AdmissionRejected(f"{model}: {admission.reason}")
+
+    def _record_call(self, model: str, start_time: float, error: Exception = None, usage: Any = None) -> None:
+        """Registra latencia, error/429 y tokens/s de una llamada para el enrutador."""
+        if error is None:
+            self.router.record(model, time.time() - start_time, usage=usage)
         else:
-            return self.available_models['fast']
+            self.router.record(model, None, ok=False,
+                               rate_limited=getattr(error, "status_code", None) == 429)
     
-    @cache_response(max_size=100, ttl=3600)
+    @cache_response(max_size=100, ttl=3600, normalize_args=("text",), scope_arg="symptom",
+                    ignore_args=("user_input",))
     @log_execution
-    def generate_response(self, text: str, symptom: str = None) -> str:
+    def generate_response(self, text: str, symptom: str = None, user_input: str = None) -> str:
+        """
+        Genera respuesta usando Groq API con caching y logging.
+        Respeta el presupuesto de latencia (HedgePolicy): compite con el modelo
+        rápido pasado el p95 y usa el fallback al vencer el plazo duro.
+        La crisis y la complejidad se evalúan sobre `user_input` (el mensaje del
+        usuario sin el contexto de turnos anteriores); `text` solo se envía a Groq.
+        """
+        # Determinar complejidad del tema con el mensaje actual, no con el historial
+        message = text if user_input is None else user_input
+        complexity = self._determine_complexity(message, symptom)
+        
+        # Seleccionar modelo óptimo (por la longitud del mensaje, no de la plantilla)
+        model = self.select_model(len(message), complexity)
+        messages = self._build_messages(text, symptom)
+        
+        logger.debug("📊 Modelo Groq: %s | Texto: %d chars | Complejidad: %s", model, len(text), complexity)
+        
+        # Prioridad ante los límites de Groq: las crisis pasan primero
+        priority = CRISIS if complexity == 'crisis' else current_priority()
+        
+        # Si el modelo principal excede el presupuesto p95, se compite con el modelo rápido
+        fast_model = self.available_models['fast']
+        hedge = None
+        if model != fast_model:
+            hedge = lambda: self._complete(fast_model, messages, priority=priority)
+        
+        result = self.hedger.run(lambda: self._complete(model, messages, priority=priority), hedge)
+        if result.value is None:
+            logger.warning("🛟 Sin respuesta de Groq (%s) en %.2fs, usando fallback", result.outcome, result.elapsed)
+            return self._get_fallback_response(text, symptom, user_input)
+        
+        logger.info("✅ Respuesta de Groq (%s) en %.2fs", result.outcome, result.elapsed,
+                    extra={"model": model, "complexity": complexity})
+        return result.value
+
+    def summarize(self, previous_summary: str, turns: List[tuple], max_chars: int = 800) -> str:
+        """Resumen incremental con el modelo rápido; si falla, el extractivo por defecto."""
+        dialogo = "\n".join(
+            f"{'Usuario' if tipo == 'user' else 'Psicólogo'}: {mensaje}" for tipo, mensaje in turns
+        )
+        messages = [
+            {"role": "system", "content": (
+                "Resume conversaciones de apoyo psicológico en español, en tercera persona, "
+                "en un solo párrafo de máximo 120 palabras. Conserva síntomas, situaciones, "
+                "personas mencionadas, lo que ya se recomendó y el estado emocional. "
+                "No inventes información."
+            )},
+            {"role": "user", "content": (
+                f"Resumen previo: {previous_summary or '(ninguno)'}\n\n"
+                f"Nuevos mensajes:\n{dialogo}\n\n"
+                "Escribe el resumen actualizado."
+            )},
+        ]
+        try:
+            summary = self._complete(self.available_models['fast'], messages, max_tokens=300,
+                                     priority=BACKGROUND)
+        except Exception as e:
+            logger.warning(f"Resumen con Groq falló, usando resumen extractivo: {e}")
+            return super().summarize(previous_summary, turns, max_chars)
+        return summary[:max_chars]
+
+    def _complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 800,
+                  priority: int = INTERACTIVE) -> str:
+        """Una llamada (no streaming) a Groq, previa admisión; retorna la respuesta ya limpiada."""
+        model, estimated = self._admit(model, messages, max_tokens, priority)
+        start_time = time.time()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.4,
+            )
+        except Exception as e:
+            self._record_call(model, start_time, error=e)
+            raise
+        self._record_call(model, start_time, usage=response.usage)
+        self.governor.reconcile(model, estimated, getattr(response.usage, "total_tokens", None))
+        
+        raw_response = response.choices[0].message.content
+        
+        # Limpiar respuesta (eliminar cualquier markdown residual)
+        cleaned_response = self._clean_response(raw_response)
+        
+        logger.debug("📝 Groq %s: %s tokens, %d -> %d caracteres", model,
+                     getattr(response.usage, "total_tokens", "N/A"), len(raw_response), len(cleaned_response))
+        
+        return cleaned_response
+
+    def stream_response(self, text: str, symptom: str = None, user_input: str = None) -> Iterator[str]:
         """
-        Genera respuesta usando Groq API con caching y logging
+        Genera la respuesta en streaming (stream=True) y emite cada fragmento
+        de texto en cuanto llega. Al terminar, retorna la respuesta limpiada
+        con _clean_response para persistirla en el historial.
         """
+        _, cached = self.generate_response.cache_lookup(self, text, symptom)
+        if cached is not None:
+            logger.debug("✅ Respuesta en streaming servida desde caché")
+            yield cached
+            return cached
+
+        message = text if user_input is None else user_input
+        complexity = self._determine_complexity(message, symptom)
+        model = self.select_model(len(message), complexity)
+        messages = self._build_messages(text, symptom)
+        priority = CRISIS if complexity == 'crisis' else current_priority()
+        try:
+            model, estimated = self._admit(model, messages, 800, priority)
+        except AdmissionRejected as e:
+            logger.warning(f"🚦 Streaming descartado por límites de Groq: {e}")
+            fallback = self._get_fallback_response(text, symptom, user_input)
+            yield fallback
+            return fallback
+
+        partes: List[str] = []
+        usage = None
+        start_time = time.time()
+
         try:
-            # Determinar complejidad del tema
-            complexity = self._determine_complexity(text, symptom)
-            
-            # Seleccionar modelo óptimo
-            model = self.select_model(len(text), complexity)
-            
-            logger.info(f"🔥🔥🔥 LLAMANDO A GROQ API REALMENTE 🔥🔥🔥")
-            logger.info(f"📊 Modelo Groq: {model} | Texto: {len(text)} chars | Complejidad: {complexity}")
-            logger.info(f"🔑 API Key configurada: {'SÍ' if self.api_key else 'NO'} (longitud: {len(self.api_key) if self.api_key else 0})")
-            
-            # Prompt profesional para psicólogo clínico
-            system_prompt = """Eres un psicólogo profesional con enfoque clínico.
+            logger.debug("📡 Streaming Groq | Modelo: %s | Complejidad: %s", model, complexity)
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=800,
+                temperature=0.4,
+                stream=True,
+            )
+            try:
+                for chunk in stream:
+                    # Groq manda el uso de tokens en el último fragmento (x_groq.usage)
+                    usage = self._stream_usage(chunk) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not partes:
+                            logger.debug("⚡ Primer token en %.2fs", time.time() - start_time)
+                        partes.append(delta)
+                        yield delta
+            finally:
+                stream.close()
+        except Exception as e:
+            self._record_call(model, start_time, error=e)
+            self._reconcile_stream(model, estimated, messages, partes, usage)
+            logger.error(f"❌ Error en streaming de Groq: {e}")
+            if not partes:
+                fallback = self._get_fallback_response(text, symptom, user_input)
+                yield fallback
+                return fallback
+            # Respuesta parcial: se entrega pero no se cachea
+            return self._clean_response("".join(partes))
+
+        self._record_call(model, start_time, usage=usage)
+        self._reconcile_stream(model, estimated, messages, partes, usage)
+        cleaned_response = self._clean_response("".join(partes))
+        if len(cleaned_response) > 10:
+            self.generate_response.cache_store(cleaned_response, self, text, symptom)
+        logger.info("✅ Streaming completado en %.2fs (%d caracteres)", time.time() - start_time,
+                    len(cleaned_response), extra={"model": model, "complexity": complexity})
+        return cleaned_response
+
+    @staticmethod
+    def _stream_usage(chunk) -> Any:
+        """`usage` de un fragmento del stream (Groq lo incluye en x_groq del último), o None."""
+        x_groq = getattr(chunk, "x_groq", None)
+        if isinstance(x_groq, dict):
+            return x_groq.get("usage")
+        return getattr(x_groq, "usage", None)
+
+    def _reconcile_stream(self, model: str, estimated: int, messages: List[Dict[str, str]],
+                          partes: List[str], usage: Any) -> None:
+        """Ajusta en el governor los tokens reservados para un stream a los consumidos."""
+        total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+        if total is None:
+            # Sin usage (stream cortado): misma estimación de ≈3 caracteres por token
+            total = (sum(len(m["content"]) for m in messages) + sum(len(p) for p in partes)) // 3
+        self.governor.reconcile(model, estimated, total)
+
+    def _build_messages(self, text: str, symptom: str = None) -> List[Dict[str, str]]:
+        """Construye los mensajes (system + user) enviados a Groq."""
+        # Prompt profesional para psicólogo clínico
+        system_prompt = """Eres un psicólogo profesional con enfoque clínico.
 
 Debes responder con claridad, estructura y profundidad.
 
@@ -166,52 +481,25 @@ Tercero: recomendaciones prácticas desarrolladas.
 Cuarto: preguntas reflexivas completas al final.
 
 Mantén un tono profesional, empático y clínico."""
-            
-            # Crear prompt del usuario con contexto
-            user_prompt = f"""Contexto del usuario:
+
+        # Crear prompt del usuario con contexto
+        user_prompt = f"""Contexto del usuario:
 Síntoma actual: {symptom}
 
 Mensaje del usuario:
 "{text}"
 
 Responde ahora de forma estructurada y profesional."""
-            
-            logger.info(f"📝 Enviando solicitud a Groq API con modelo {model}...")
-            
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=800,
-                temperature=0.4,
-            )
-            
-            logger.info(f"🎯🎯🎯 RESPUESTA REAL RECIBIDA DE GROQ 🎯🎯🎯")
-            logger.info(f"✅ Respuesta generada con {model} - Tokens: {response.usage.total_tokens if response.usage else 'N/A'}")
-            
-            raw_response = response.choices[0].message.content
-            
-            # Limpiar respuesta (eliminar cualquier markdown residual)
-            cleaned_response = self._clean_response(raw_response)
-            
-            logger.info(f"📝 Longitud respuesta: {len(raw_response)} -> {len(cleaned_response)} caracteres")
-            logger.info(f"📋 Primeros 100 chars: {cleaned_response[:100]}...")
-            
-            return cleaned_response
-            
-        except Exception as e:
-            logger.error(f"❌❌❌ ERROR en Groq API: {e}")
-            logger.error(f"📌 Stack trace completo:", exc_info=True)
-            return self._get_fallback_response(text)
-    
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
     def _determine_complexity(self, text: str, symptom: str = None) -> str:
         """Determina la complejidad del tema basado en el texto y síntoma."""
-        text_lower = text.lower()
-        for pattern in CRISIS_PATTERNS:
-            if re.search(pattern, text_lower):
-                return 'crisis'
+        if buscar_crisis(text):
+            return 'crisis'
 
         complex_symptoms = ["Ansiedad", "Depresión", "Estrés", "Problemas familiares", "Problemas de pareja"]
         if len(text) > 150 or (symptom and symptom in complex_symptoms):
@@ -230,42 +518,35 @@ Responde ahora de forma estructurada y profesional."""
         cleaned = response
         
         # Eliminar **negritas**
-        cleaned = re.sub(r'\*\*(.*?)\*\*', r'\1', cleaned)
+        cleaned = _BOLD_RE.sub(r'\1', cleaned)
         
         # Eliminar *cursivas*
-        cleaned = re.sub(r'\*(.*?)\*', r'\1', cleaned)
+        cleaned = _ITALIC_RE.sub(r'\1', cleaned)
         
         # Eliminar encabezados markdown (#, ##, ###)
-        cleaned = re.sub(r'^#+\s*', '', cleaned, flags=re.MULTILINE)
+        cleaned = _HEADER_RE.sub('', cleaned)
         
         # Eliminar listas con viñetas o números
-        cleaned = re.sub(r'^[\s]*[•\-*]\s*', '', cleaned, flags=re.MULTILINE)
-        cleaned = re.sub(r'^[\s]*\d+[\.\)]\s*', '', cleaned, flags=re.MULTILINE)
+        cleaned = _BULLET_RE.sub('', cleaned)
+        cleaned = _NUMBERED_RE.sub('', cleaned)
         
         # Eliminar emojis comunes
-        emoji_pattern = re.compile("["
-            u"\U0001F600-\U0001F64F"  # emoticons
-            u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-            u"\U0001F680-\U0001F6FF"  # transport & map symbols
-            u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            u"\U00002702-\U000027B0"  # dingbats
-            u"\U000024C2-\U0001F251"
-            "]+", flags=re.UNICODE)
-        cleaned = emoji_pattern.sub('', cleaned)
+        cleaned = _EMOJI_RE.sub('', cleaned)
         
         # Asegurar separación adecuada entre párrafos
         # Reemplazar múltiples saltos de línea por dos
-        cleaned = re.sub(r'\n\s*\n\s*\n+', '\n\n', cleaned)
+        cleaned = _BLANK_LINES_RE.sub('\n\n', cleaned)
         
         # Eliminar espacios en blanco al inicio y final
         cleaned = cleaned.strip()
         
         return cleaned
     
-    def _get_fallback_response(self, text: str) -> str:
-        if self._determine_complexity(text) == 'crisis':
-            return CRISIS_RESPONSE
-        return "Entiendo que estás pasando por un momento difícil. ¿Te gustaría contarme más sobre cómo te sientes?"
+    def _get_fallback_response(self, text: str, symptom: str = None, user_input: str = None) -> str:
+        """Respuesta de contingencia (no se cachea): crisis o la de FallbackAIService."""
+        if buscar_crisis(text if user_input is None else user_input):
+            return UncachedResponse(CRISIS_RESPONSE)
+        return UncachedResponse(self.fallback_service.generate_response(text, symptom))
 
 class FallbackAIService(AIServiceStrategy):
     """
@@ -294,7 +575,7 @@ class FallbackAIService(AIServiceStrategy):
     def select_model(self, text_length: int, complexity: str) -> str:
         return "fallback"
 
-    def generate_response(self, text: str, symptom: str = None) -> str:
+    def generate_response(self, text: str, symptom: str = None, user_input: str = None) -> str:
         import random
         
         if symptom and symptom in self.predefined_responses:
@@ -4,14 +4,18 @@ Servicio de agendamiento de citas - Lógica compartida entre app.py y conversati
 
 import os
 import json
+import hashlib
 import logging
-import time
 import threading
 import html as _html
-from datetime import datetime
-from typing import Tuple, Dict, Any, Optional
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Tuple, Dict, Any, List, Optional
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from googleapiclient.errors import HttpError
 from dateutil import parser
 from sqlalchemy.exc import IntegrityError
@@ -23,6 +27,12 @@ logger = logging.getLogger(__name__)
 _NOTIFICATION_EMAIL = os.getenv('PSICOLOGO_EMAIL', 'chatbotequilibra@gmail.com')
 
 # Importar servicios compartidos
+from .busy_index import BusyIntervalIndex
+from . import outbox
+from .calendar_pool import CalendarClientPool, TokenRefresher
+from .idempotency import create_idempotency_store, request_fingerprint
+from .slot_lock import create_slot_locks
+from .response_cache import ResponseCache, register_cache
 from .validation_service import ValidationService
 
 validation_service = ValidationService()
@@ -37,37 +47,28 @@ def validar_horario_cita(fecha_str: str, hora_str: str) -> Tuple[bool, str]:
     """Validación estricta de horarios de cita"""
     return validation_service.validate_appointment_time(fecha_str, hora_str)
 
-# ==================== GOOGLE CALENDAR (singleton con TTL) ====================
+# ==================== GOOGLE CALENDAR (pool de clientes) ====================
 
-_calendar_service_cache: Dict[str, Any] = {"service": None, "ts": 0.0}
-_calendar_service_lock = threading.Lock()
-_CALENDAR_SERVICE_TTL = 3600  # reutilizar el cliente durante 1 hora
+_calendar_credentials: Dict[str, Any] = {"creds": None, "refresher": None}
+_calendar_credentials_lock = threading.Lock()
+_CALENDAR_HTTP_TIMEOUT = 30
 
 
-def get_calendar_service():
+@lru_cache(maxsize=1)
+def _calendar_discovery() -> Dict[str, Any]:
     """
-    Obtiene el cliente de Google Calendar.
-    Reutiliza la instancia durante _CALENDAR_SERVICE_TTL segundos para
-    evitar crear una nueva conexión en cada request.
+    Documento de descubrimiento de Calendar v3, leído y parseado una vez por proceso.
+    Es la copia que trae google-api-python-client: construir un cliente no toca la red.
     """
-    with _calendar_service_lock:
-        cached = _calendar_service_cache
-        if cached["service"] is not None and (time.time() - cached["ts"]) < _CALENDAR_SERVICE_TTL:
-            return cached["service"]
+    return json.loads(get_static_doc('calendar', 'v3'))
 
-    # Construir nueva instancia fuera del lock para no bloquear durante I/O
-    service = _build_calendar_service()
 
-    with _calendar_service_lock:
-        _calendar_service_cache["service"] = service
-        _calendar_service_cache["ts"] = time.time()
+def _load_calendar_credentials():
+    """Credencial de la service account, compartida por todos los clientes del pool (un solo token)."""
+    with _calendar_credentials_lock:
+        if _calendar_credentials["creds"] is not None:
+            return _calendar_credentials["creds"]
 
-    return service
-
-
-def _build_calendar_service():
-    """Construye un cliente de Google Calendar desde las credenciales de entorno."""
-    try:
         google_credentials = os.getenv('GOOGLE_CREDENTIALS')
         if not google_credentials:
             logger.error("GOOGLE_CREDENTIALS no configuradas")
@@ -91,63 +92,126 @@ def _build_calendar_service():
             creds_dict,
             scopes=['https://www.googleapis.com/auth/calendar'],
         )
-        service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
-        logger.info("Servicio de Google Calendar creado exitosamente")
+        # El token se renueva en segundo plano antes de vencer
+        refresher = TokenRefresher(creds, margin=float(os.getenv('CALENDAR_TOKEN_REFRESH_MARGIN', 300)))
+        refresher.start()
+        _calendar_credentials.update(creds=creds, refresher=refresher)
+        return creds
+
+
+def _build_calendar_service():
+    """Construye un cliente de Google Calendar con su propio transporte httplib2."""
+    try:
+        creds = _load_calendar_credentials()
+        if creds is None:
+            return None
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=_CALENDAR_HTTP_TIMEOUT))
+        service = build_from_document(_calendar_discovery(), http=http)
+        logger.debug("Cliente de Google Calendar creado")
         return service
 
     except Exception as e:
         logger.error(f"Error creando servicio de calendario: {e}")
         return None
 
-def crear_evento_calendar(fecha: str, hora: str, telefono: str, sintoma: str) -> Optional[Dict[str, str]]:
+
+# Un cliente por hilo en uso; por defecto tantos como hilos de gunicorn
+calendar_pool = CalendarClientPool(
+    _build_calendar_service,
+    size=int(os.getenv('CALENDAR_POOL_SIZE', 4)),
+    acquire_timeout=float(os.getenv('CALENDAR_POOL_TIMEOUT', 10)),
+)
+
+
+def warm_calendar_clients() -> int:
+    """Al arrancar el worker: credencial cargada (su hilo pide el primer token) y pool lleno. Retorna los clientes libres."""
+    if _load_calendar_credentials() is None:
+        return 0
+    clientes = calendar_pool.prefill()
+    logger.info(f"📅 {clientes} clientes de Google Calendar listos")
+    return clientes
+
+
+def get_calendar_token_stats() -> Dict[str, Any]:
+    refresher = _calendar_credentials["refresher"]
+    return refresher.stats() if refresher else {"running": False}
+
+
+def calendar_client():
+    """
+    Presta un cliente de Google Calendar durante un bloque `with`:
+
+        with calendar_client() as service:
+            if not service: ...
+
+    El cliente es None si el calendario no está disponible.
+    """
+    return calendar_pool.lease()
+
+def descripcion_evento(telefono: str, sintoma: str) -> str:
+    """Descripción de los eventos que crea Equilibra (sin etiqueta de estado)."""
+    return (
+        f'Teléfono del paciente: {telefono}\n'
+        f'Síntoma principal: {sintoma}\n'
+        f'Cita agendada a través de Equilibra'
+    )
+
+
+def crear_evento_calendar(fecha: str, hora: str, telefono: str, sintoma: str,
+                          event_id: Optional[str] = None) -> Optional[Dict[str, str]]:
     """
     Crear evento en Google Calendar.
     Retorna dict con 'event_id' (para guardar en DB) y 'html_link' (para mostrar al usuario),
     o None si falla.
+    Con `event_id` el ID lo fija el cliente: reintentar la misma creación no duplica el evento.
     """
     try:
         datetime.strptime(fecha, "%Y-%m-%d")
         datetime.strptime(hora, "%H:%M")
 
-        service = get_calendar_service()
-        if not service:
-            logger.error("No se pudo obtener el servicio de calendario")
-            return None
+        with calendar_client() as service:
+            if not service:
+                logger.error("No se pudo obtener el servicio de calendario")
+                return None
+
+            start_time = f"{fecha}T{hora}:00-05:00"
+            end_time = f"{fecha}T{int(hora.split(':')[0])+1}:00:00-05:00"
+
+            event = {
+                'summary': f'Cita Psicológica - {sintoma}',
+                'description': descripcion_evento(telefono, sintoma),
+                'start': {'dateTime': start_time, 'timeZone': 'America/Guayaquil'},
+                'end': {'dateTime': end_time, 'timeZone': 'America/Guayaquil'},
+                'reminders': {
+                    'useDefault': False,
+                    'overrides': [
+                        {'method': 'email', 'minutes': 24 * 60},
+                        {'method': 'popup', 'minutes': 30},
+                    ],
+                },
+            }
+            if event_id:
+                event['id'] = event_id
+
+            logger.info(f"Intentando crear evento: {fecha} {hora} para {telefono}")
+            event_created = service.events().insert(calendarId='primary', body=event).execute()
 
-        start_time = f"{fecha}T{hora}:00-05:00"
-        end_time = f"{fecha}T{int(hora.split(':')[0])+1}:00:00-05:00"
-
-        event = {
-            'summary': f'Cita Psicológica - {sintoma}',
-            'description': (
-                f'Teléfono del paciente: {telefono}\n'
-                f'Síntoma principal: {sintoma}\n'
-                f'Cita agendada a través de Equilibra'
-            ),
-            'start': {'dateTime': start_time, 'timeZone': 'America/Guayaquil'},
-            'end': {'dateTime': end_time, 'timeZone': 'America/Guayaquil'},
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},
-                    {'method': 'popup', 'minutes': 30},
-                ],
-            },
-        }
-
-        logger.info(f"Intentando crear evento: {fecha} {hora} para {telefono}")
-        event_created = service.events().insert(calendarId='primary', body=event).execute()
-
-        event_id = event_created.get('id')
-        html_link = event_created.get('htmlLink')
-        logger.info(f"✅ Evento creado exitosamente. ID: {event_id}")
-
-        return {'event_id': event_id, 'html_link': html_link}
+            logger.info(f"✅ Evento creado exitosamente. ID: {event_created.get('id')}")
+
+            # Write-through: el horario queda ocupado en el índice sin esperar al TTL
+            busy_index.add(*rango_horario(fecha, hora))
+
+            return {'event_id': event_created.get('id'), 'html_link': event_created.get('htmlLink')}
 
     except ValueError as ve:
         logger.error(f"❌ Formato de fecha/hora inválido: {ve}")
         return None
     except HttpError as error:
+        if error.resp.status == 409 and event_id:
+            # Un intento anterior ya lo creó
+            logger.info(f"Evento {event_id} ya existía en Google Calendar")
+            busy_index.add(*rango_horario(fecha, hora))
+            return {'event_id': event_id, 'html_link': None}
         logger.error(f"❌ Error de Google Calendar API: {error}")
         if error.resp.status == 403:
             logger.error("❌ Error 403: Permisos insuficientes.")
@@ -168,64 +232,188 @@ def parsear_fecha_google(event: Dict[str, Any]) -> Tuple[Optional[datetime], Opt
         logger.error(f"Error parseando fecha de Google Calendar: {e}")
         return None, None
 
-def verificar_disponibilidad_atomica(fecha: str, hora: str) -> Dict[str, Any]:
-    """Verificación atómica estricta con todas las validaciones"""
-    try:
-        # 1. Validación básica de formato
-        datetime.strptime(fecha, "%Y-%m-%d")
-        datetime.strptime(hora, "%H:%M")
-        
-        # 2. Validación estricta de horario
-        es_valido, mensaje = validar_horario_cita(fecha, hora)
-        if not es_valido:
-            logger.warning(f"❌ Validación fallida para {fecha} {hora}: {mensaje}")
-            return {"disponible": False, "error": mensaje}
-        
-        # 3. Verificar disponibilidad en Google Calendar
-        service = get_calendar_service()
+# ==================== DISPONIBILIDAD POR DÍA ====================
+
+_TZ_OFFSET = "-05:00"  # America/Guayaquil, sin horario de verano
+
+
+def rango_horario(fecha: str, hora: str) -> Tuple[datetime, datetime]:
+    """Inicio y fin (1 hora) de un horario de cita."""
+    inicio = parser.isoparse(f"{fecha}T{hora}:00{_TZ_OFFSET}")
+    return inicio, inicio + timedelta(hours=1)
+
+
+def _consultar_freebusy(time_min: datetime, time_max: datetime) -> Optional[List[Tuple[datetime, datetime]]]:
+    """Una consulta freebusy al calendario. Retorna None si el calendario no está disponible."""
+    with calendar_client() as service:
         if not service:
-            return {"disponible": False, "error": "Servicio no disponible"}
-            
-        start_time = f"{fecha}T{hora}:00-05:00"
-        end_time = f"{fecha}T{int(hora.split(':')[0])+1}:00:00-05:00"
-        
-        # Verificación estricta de eventos
-        time_min = f"{fecha}T00:00:00-05:00"
-        time_max = f"{fecha}T23:59:59-05:00"
-        
-        eventos = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            maxResults=50,
-            orderBy='startTime'
-        ).execute()
-        
-        hora_solicitada_start = parser.isoparse(start_time)
-        hora_solicitada_end = parser.isoparse(end_time)
-        
-        for evento in eventos.get('items', []):
-            evento_start_str = evento['start'].get('dateTime', evento['start'].get('date'))
-            evento_end_str = evento['end'].get('dateTime', evento['end'].get('date'))
-            
-            if 'T' in evento_start_str:
-                try:
-                    # Usar la nueva función de parseo
-                    fecha_inicio, fecha_fin = parsear_fecha_google(evento)
-                    if fecha_inicio and fecha_fin:
-                        if (fecha_inicio < hora_solicitada_end and fecha_fin > hora_solicitada_start):
-                            logger.warning(f"❌ Verificación atómica: Horario {hora} ocupado por {evento.get('summary', 'Sin título')}")
-                            return {"disponible": False, "error": "Horario ya ocupado"}
-                except ValueError:
-                    continue
-        
-        logger.info(f"✅ Horario {fecha} {hora} disponible y válido")
-        return {"disponible": True}
-        
+            return None
+        result = service.freebusy().query(body={
+            'timeMin': time_min.isoformat(),
+            'timeMax': time_max.isoformat(),
+            'timeZone': 'America/Guayaquil',
+            'items': [{'id': 'primary'}],
+        }).execute()
+
+    calendario = result.get('calendars', {}).get('primary', {})
+    if calendario.get('errors'):
+        logger.error(f"❌ Error en freebusy ({time_min:%Y-%m-%d} a {time_max:%Y-%m-%d}): {calendario['errors']}")
+        return None
+    return sorted(
+        (parser.isoparse(b['start']), parser.isoparse(b['end'])) for b in calendario.get('busy', [])
+    )
+
+
+def _consultar_ocupacion(time_min: datetime, time_max: datetime) -> Optional[List[Tuple[datetime, datetime]]]:
+    """Ocupación desde el espejo local del calendario; si no está al día, con freebusy."""
+    try:
+        from .calendar_mirror import mirror_busy_intervals
+        ocupados = mirror_busy_intervals(time_min, time_max)
     except Exception as e:
-        logger.error(f"Error en verificación atómica: {e}")
-        return {"disponible": False, "error": str(e)}
+        # Sin app context o sin tablas del espejo: se consulta a Google
+        logger.debug("Espejo del calendario no disponible: %s", e)
+        ocupados = None
+    if ocupados is not None:
+        return ocupados
+    return _consultar_freebusy(time_min, time_max)
+
+
+# Ocupación de los próximos 30 días en memoria (una consulta al espejo o freebusy por TTL)
+busy_index = BusyIntervalIndex(
+    _consultar_ocupacion,
+    horizon_days=30,
+    ttl=float(os.getenv('CALENDAR_BUSY_TTL', 120)),
+)
+
+
+def obtener_intervalos_ocupados(fecha: str) -> Optional[List[Tuple[datetime, datetime]]]:
+    """
+    Intervalos ocupados del día, desde el índice en memoria; fuera de su horizonte
+    (o si no pudo cargarse) con una consulta freebusy del día.
+    Retorna None si el calendario no está disponible.
+    """
+    dia = datetime.strptime(fecha, "%Y-%m-%d").date()
+    ocupados = busy_index.busy(dia)
+    if ocupados is not None:
+        return ocupados
+    inicio = parser.isoparse(f"{fecha}T00:00:00{_TZ_OFFSET}")
+    return _consultar_ocupacion(inicio, inicio + timedelta(days=1))
+
+
+def horario_ocupado(ocupados: List[Tuple[datetime, datetime]], inicio: datetime, fin: datetime) -> bool:
+    """True si [inicio, fin) se superpone con algún intervalo ocupado."""
+    return any(ocupado_inicio < fin and ocupado_fin > inicio for ocupado_inicio, ocupado_fin in ocupados)
+
+
+def consultar_horario_ocupado(fecha: str, hora: str) -> Optional[bool]:
+    """
+    Ocupación de un horario: búsqueda binaria en el índice; fuera de su horizonte,
+    consulta freebusy del día. Retorna None si el calendario no está disponible.
+    """
+    inicio, fin = rango_horario(fecha, hora)
+    ocupado = busy_index.is_busy(inicio, fin)
+    if ocupado is not None:
+        return ocupado
+    ocupados = obtener_intervalos_ocupados(fecha)
+    return None if ocupados is None else horario_ocupado(ocupados, inicio, fin)
+
+
+def _horarios_reservados(desde: datetime, hasta: datetime) -> List[datetime]:
+    """
+    Inicio (hora local, sin zona) de las citas no canceladas en [desde, hasta) según
+    la DB, incluidas las que el outbox todavía no llevó a Calendar. Una sola consulta;
+    lista vacía si la DB no está disponible.
+    """
+    from models import Appointment
+    try:
+        citas = Appointment.query.with_entities(Appointment.scheduled_at).filter(
+            Appointment.scheduled_at >= desde,
+            Appointment.scheduled_at < hasta,
+            Appointment.status != "cancelled",
+        ).order_by(Appointment.scheduled_at).all()
+    except Exception as e:
+        # Sin app context o sin tablas: solo cuenta la ocupación del calendario
+        logger.debug("Citas de la DB no disponibles (%s a %s): %s", desde, hasta, e)
+        return []
+    return [cita.scheduled_at for cita in citas]
+
+
+def _citas_activas_del_dia(fecha: str) -> List[Tuple[datetime, datetime]]:
+    """Intervalos de las citas no canceladas del día en la DB (ver _horarios_reservados)."""
+    dia = datetime.strptime(fecha, "%Y-%m-%d")
+    return [rango_horario(fecha, inicio.strftime("%H:%M"))
+            for inicio in _horarios_reservados(dia, dia + timedelta(days=1))]
+
+
+def obtener_disponibilidad_dia(fecha: str) -> List[Dict[str, Any]]:
+    """
+    Horarios válidos del día con su ocupación real, a partir de una única
+    consulta al calendario (en lugar de una por horario) más las citas
+    activas del día en la DB (las reservas pendientes aún no están en Calendar).
+    """
+    horarios = validation_service.get_available_time_slots(fecha)
+    if not horarios:
+        return horarios
+
+    try:
+        ocupados = obtener_intervalos_ocupados(fecha)
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo ocupación de {fecha}: {e}")
+        ocupados = None
+    if ocupados is not None:
+        ocupados = ocupados + _citas_activas_del_dia(fecha)
+
+    for horario in horarios:
+        if ocupados is None:
+            horario.update(disponible=False, mensaje='No se pudo verificar el calendario')
+        elif horario_ocupado(ocupados, *rango_horario(fecha, horario['hora'])):
+            horario.update(disponible=False, mensaje='Ocupado')
+    return horarios
+
+
+# Resultados por versión del índice de ocupación: mientras no cambie, repetir la búsqueda es gratis
+_proximos_horarios_cache = register_cache(ResponseCache("next_free_slots", max_entries=32, ttl=600))
+
+
+def buscar_proximos_horarios(cantidad: int = 5, dias: int = 30) -> Optional[List[Dict[str, str]]]:
+    """
+    Primeros `cantidad` horarios libres en los próximos `dias` días, en una sola
+    pasada: horarios válidos según ValidationService, ocupación desde el índice y
+    las citas de la DB del rango (una consulta; incluye las que aún no están en Calendar).
+    Retorna None si la ocupación del calendario no está disponible.
+    """
+    ahora = datetime.now()
+    hoy = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    dias = min(dias, busy_index.horizon_days)
+    reservados = set(_horarios_reservados(hoy, hoy + timedelta(days=dias)))
+    # La clave cambia con el índice, con las reservas de la DB (también las de otros
+    # workers) y con la hora actual: los horarios de hoy que ya pasaron se descartan
+    huella = hashlib.blake2b("|".join(sorted(r.isoformat() for r in reservados)).encode(),
+                             digest_size=8).hexdigest()
+    clave = f"{busy_index.version}:{huella}:{ahora:%Y-%m-%d %H}:{cantidad}:{dias}"
+    cacheado = _proximos_horarios_cache.get(clave)
+    if cacheado is not None:
+        return json.loads(cacheado)
+
+    libres: List[Dict[str, str]] = []
+    for offset in range(dias):
+        fecha = (ahora + timedelta(days=offset)).strftime("%Y-%m-%d")
+        for horario in validation_service.get_available_time_slots(fecha):
+            if datetime.strptime(f"{fecha} {horario['hora']}", "%Y-%m-%d %H:%M") in reservados:
+                continue
+            ocupado = busy_index.is_busy(*rango_horario(fecha, horario['hora']))
+            if ocupado is None:
+                return None
+            if not ocupado:
+                libres.append({'fecha': fecha, 'hora': horario['hora']})
+                if len(libres) >= cantidad:
+                    break
+        if len(libres) >= cantidad:
+            break
+
+    _proximos_horarios_cache.set(clave, json.dumps(libres))
+    return libres
+
 
 # ==================== RESEND EMAIL ====================
 
@@ -308,14 +496,27 @@ def enviar_correo_confirmacion(destinatario: str, fecha: str, hora: str, telefon
     return True
 
 # ==================== AGENDAMIENTO COMPLETO ====================
+#
+# Write-behind: el request solo valida y reserva el horario en la DB. Un candado corto
+# por horario (services/slot_lock.py) descarta en milisegundos al segundo request
+# concurrente; el constraint uq_appointments_scheduled_at_active sigue resolviendo
+# la carrera si el candado no alcanza. En la misma transacción se escribe un mensaje
+# "calendar.create" en el outbox; el evento de Calendar y el correo los hace después
+# el worker que lo drena (services/outbox.py), tras verificar el horario con un
+# freebusy directo a Google: el índice y el espejo pueden llevar minutos de atraso.
+
+slot_locks = create_slot_locks()
 
-def agendar_cita_completa(fecha: str, hora: str, telefono: str, sintoma: str) -> Tuple[bool, str, Optional[str]]:
+
+def agendar_cita_completa(fecha: str, hora: str, telefono: str, sintoma: str,
+                          nombre: str = "Paciente") -> Tuple[bool, str, Optional[int]]:
     """
-    Función principal para agendar una cita completa.
-    Returns: (success, message, calendar_event_id)
-      - calendar_event_id: ID real del evento en Google Calendar (para guardar en DB).
-        El html_link se puede construir desde el panel o no se necesita exponer.
+    Reserva una cita: validaciones locales + una transacción en la DB.
+    Returns: (success, message, appointment_id)
     """
+    from models import db, Appointment
+    from services.admin_service import find_or_create_patient
+
     try:
         # 1. Validar teléfono
         valido, mensaje_error = validar_telefono(telefono)
@@ -329,35 +530,161 @@ def agendar_cita_completa(fecha: str, hora: str, telefono: str, sintoma: str) ->
             logger.error(f"Horario inválido: {mensaje_validacion}")
             return False, mensaje_validacion, None
 
-        # 3. Verificación atómica estricta de disponibilidad
-        verificacion = verificar_disponibilidad_atomica(fecha, hora)
-        if not verificacion.get("disponible", False):
-            error_msg = verificacion.get("error", "El horario ya no está disponible")
-            logger.error(f"Horario no disponible: {error_msg}")
-            return False, error_msg, None
-
-        # 4. Crear evento en Google Calendar
-        evento_data = crear_evento_calendar(fecha, hora, telefono, sintoma)
-        if not evento_data:
-            logger.error("Error al crear evento en Google Calendar")
-            return False, "Error al crear la cita en el calendario", None
-
-        calendar_event_id = evento_data['event_id']
-
-        # 5. Enviar correo de confirmación (no bloqueante)
-        email_enviado = enviar_correo_confirmacion(
-            "chatbotequilibra@gmail.com", fecha, hora, telefono, sintoma
-        )
-        if not email_enviado:
-            logger.warning("Email no enviado (cita creada en calendario)")
-
-        logger.info(f"Cita agendada exitosamente: {fecha} {hora} para {telefono}")
-        return True, "Cita agendada exitosamente", calendar_event_id
+        # 3. Candado del horario: el segundo request concurrente por el mismo slot falla
+        #    aquí, antes de consultar la ocupación y de abrir la transacción
+        with slot_locks.hold(f"{fecha}T{hora}") as libre:
+            if not libre:
+                db.session.rollback()
+                logger.warning(f"Horario en reserva por otro request: {fecha} {hora}")
+                return False, "Ese horario está siendo reservado por otra persona. Por favor elige otro.", None
+
+            # 4. Ocupación según el índice en memoria (eventos que no son citas de la DB)
+            if consultar_horario_ocupado(fecha, hora):
+                db.session.rollback()
+                logger.warning(f"Horario ocupado en el calendario: {fecha} {hora}")
+                return False, "Horario ya ocupado", None
+
+            # 5. Reserva en la DB: el constraint único sigue siendo la última palabra
+            patient = find_or_create_patient(name=nombre or "Paciente", phone=telefono, symptom=sintoma)
+            appt = Appointment(
+                patient_id=patient.id,
+                scheduled_at=datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M"),
+                symptom=sintoma,
+                status="pending",
+            )
+            db.session.add(appt)
+            db.session.flush()
+            outbox.enqueue("calendar.create", {"appointment_id": appt.id}, appt.id)
+            db.session.commit()
 
     except IntegrityError:
         # El constraint uq_appointments_scheduled_at_active capturó un doble booking
+        db.session.rollback()
         logger.warning(f"Doble booking bloqueado por constraint DB: {fecha} {hora}")
         return False, "Ese horario acaba de ser reservado. Por favor elige otro.", None
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error al agendar cita: {e}")
-        return False, str(e), None
\ No newline at end of file
+        return False, str(e), None
+
+    busy_index.add(*rango_horario(fecha, hora))
+    outbox.kick()
+    logger.info(f"Cita reservada: id={appt.id} {fecha} {hora} para {telefono}")
+    return True, "Cita agendada exitosamente", appt.id
+
+
+# Reservas ya hechas por clave de idempotencia: los reintentos del cliente y los
+# dobles clics reciben la misma respuesta sin reservar ni encolar nada otra vez
+reservas_idempotentes = create_idempotency_store(
+    "reservas", ttl=int(os.getenv('BOOKING_IDEMPOTENCY_TTL', 86400))
+)
+
+
+def agendar_cita_idempotente(clave: Optional[str], fecha: str, hora: str, telefono: str, sintoma: str,
+                             nombre: str = "Paciente") -> Tuple[bool, str, Optional[int], bool]:
+    """
+    agendar_cita_completa con clave de idempotencia (sin clave, se agenda directamente).
+    Solo se guardan las reservas exitosas: un fallo se puede reintentar con la misma clave.
+    Returns: (success, message, appointment_id, repetida)
+    Lanza IdempotencyKeyReused / IdempotencyInProgress (services.idempotency).
+    """
+    if not clave:
+        return (*agendar_cita_completa(fecha, hora, telefono, sintoma, nombre=nombre), False)
+
+    huella = request_fingerprint({"fecha": fecha, "hora": hora, "telefono": telefono, "sintoma": sintoma})
+    resultado, repetida = reservas_idempotentes.execute(
+        clave, huella,
+        lambda: list(agendar_cita_completa(fecha, hora, telefono, sintoma, nombre=nombre)),
+        should_store=lambda r: r[0],
+    )
+    success, message, appointment_id = resultado
+    return success, message, appointment_id, repetida
+
+
+def _event_id_reserva(appt) -> str:
+    """ID de evento determinista (base32hex: a-v, 0-9) para que los reintentos no dupliquen el evento."""
+    creada = int(appt.created_at.timestamp()) if appt.created_at else 0
+    return f"equilibra{appt.id}t{creada}"
+
+
+def _evento_propio_existe(event_id: str) -> bool:
+    """True si el evento con nuestro ID determinista ya existe (lo creó un intento anterior)."""
+    with calendar_client() as service:
+        if not service:
+            raise RuntimeError("No hay servicio de calendario disponible")
+        try:
+            evento = service.events().get(calendarId='primary', eventId=event_id).execute()
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return False
+            raise
+    return evento.get('status') != 'cancelled'
+
+
+def horario_libre_en_calendar(fecha: str, hora: str, event_id: str) -> bool:
+    """
+    Verificación final y autoritativa de un horario: freebusy de Google solo para esa
+    hora, sin índice ni espejo. El evento propio `event_id` no cuenta como conflicto.
+    Lanza RuntimeError si Calendar no responde (el outbox reintenta).
+    """
+    inicio, fin = rango_horario(fecha, hora)
+    ocupados = _consultar_freebusy(inicio, fin)
+    if ocupados is None:
+        raise RuntimeError(f"No se pudo verificar el horario {fecha} {hora} en Calendar")
+    if not horario_ocupado(ocupados, inicio, fin):
+        return True
+    return _evento_propio_existe(event_id)
+
+
+def procesar_reserva(appointment_id: int) -> Dict[str, Any]:
+    """
+    Handler de "calendar.create": verifica el horario en Google (freebusy), crea el
+    evento en Calendar, guarda su ID en la cita y encola el correo en la misma
+    transacción. Si el horario ya está ocupado la cita queda en "conflict" sin evento.
+    Es idempotente: si la cita ya tiene evento o fue cancelada no hace nada.
+    Lanza RuntimeError si conviene reintentar.
+    """
+    from models import db, Appointment
+
+    appt = db.session.get(Appointment, appointment_id)
+    if appt is None or appt.status in ("cancelled", "conflict"):
+        return {"status": "skipped", "appointment_id": appointment_id}
+    if appt.calendar_event_id:
+        return {"status": "already_synced", "appointment_id": appointment_id,
+                "event_id": appt.calendar_event_id}
+
+    fecha = appt.scheduled_at.strftime("%Y-%m-%d")
+    hora = appt.scheduled_at.strftime("%H:%M")
+    telefono = appt.patient.phone if appt.patient else ""
+    sintoma = appt.symptom or "Consulta psicológica"
+    event_id = _event_id_reserva(appt)
+
+    if not horario_libre_en_calendar(fecha, hora, event_id):
+        # Otro evento tomó el horario después de la reserva: no se crea un evento encima
+        db.session.refresh(appt)
+        if appt.status != "cancelled":
+            appt.status = "conflict"
+        db.session.commit()
+        busy_index.invalidate(appt.scheduled_at.date())
+        logger.warning(f"⚠️ Cita {appointment_id} en conflicto: {fecha} {hora} ya está ocupado en Calendar")
+        return {"status": "conflict", "appointment_id": appointment_id}
+
+    evento = crear_evento_calendar(fecha, hora, telefono, sintoma, event_id=event_id)
+    if not evento:
+        raise RuntimeError(f"No se pudo crear el evento de la cita {appointment_id}")
+
+    # El admin pudo cambiar el estado mientras se creaba el evento
+    db.session.refresh(appt)
+    appt.calendar_event_id = evento['event_id']
+    if appt.status == "cancelled":
+        outbox.enqueue("calendar.delete", {"event_id": evento['event_id'], "scheduled_at": appt.scheduled_at.isoformat()},
+                       appointment_id)
+    else:
+        if appt.status != "pending":
+            outbox.enqueue("calendar.patch", {"event_id": evento['event_id'], "status": appt.status}, appointment_id)
+        outbox.enqueue("email.confirmation", {"fecha": fecha, "hora": hora, "telefono": telefono, "sintoma": sintoma},
+                       appointment_id)
+    db.session.commit()
+
+    logger.info(f"✅ Cita {appointment_id} sincronizada con Calendar: {evento['event_id']}")
+    return {"status": "synced", "appointment_id": appointment_id, "event_id": evento['event_id']}
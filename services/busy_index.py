@@ -0,0 +1,212 @@
+"""
+Índice en memoria de intervalos ocupados del calendario.
+
+Cubre los próximos `horizon_days` días y se llena con una sola consulta freebusy
+a Google. Los intervalos de cada día se fusionan y se guardan ordenados en dos
+listas paralelas (inicios y fines), así que comprobar un horario es una búsqueda
+binaria (bisect) en lugar de listar y recorrer los eventos del día.
+
+- Se refresca completo cuando vence el TTL.
+- Escritura inmediata (write-through): al crear un evento se añade su intervalo.
+  Al cancelar uno se invalida su día, que se vuelve a consultar solo (un freebusy
+  de un día) en la siguiente lectura.
+- Cada worker tiene su índice; los cambios hechos por otro worker se ven al
+  vencer el TTL. Por eso el índice solo filtra en el request: la verificación
+  final la hace el worker del outbox con un freebusy directo a Google para ese
+  horario, justo antes de crear el evento (procesar_reserva).
+- `version` cambia con cada modificación, para cachear resultados derivados.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[datetime, datetime]
+
+# America/Guayaquil: UTC-5 todo el año
+LOCAL_TZ = timezone(timedelta(hours=-5))
+
+
+def _merge(intervals: List[Interval]) -> Tuple[List[datetime], List[datetime]]:
+    """Fusiona intervalos solapados; retorna (inicios, fines), ambos ordenados."""
+    starts: List[datetime] = []
+    ends: List[datetime] = []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class BusyIntervalIndex:
+    """Intervalos ocupados por día local; `fetch(time_min, time_max)` consulta freebusy."""
+
+    def __init__(self, fetch: Callable[[datetime, datetime], Optional[List[Interval]]],
+                 horizon_days: int = 30, ttl: float = 120, retry_after: float = 30,
+                 clock: Callable[[], float] = time.time):
+        self.fetch = fetch
+        self.horizon_days = horizon_days
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.clock = clock
+        self._days: Dict[date, Tuple[List[datetime], List[datetime]]] = {}
+        self._stale_days: set = set()
+        self._first_day: Optional[date] = None
+        self._loaded_at = 0.0
+        self._failed_at = 0.0
+        self._version = 0
+        self._lock = threading.RLock()
+        self._counters = {"lookups": 0, "misses": 0, "refreshes": 0, "day_refreshes": 0,
+                          "writes": 0, "invalidations": 0, "fetch_errors": 0}
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            self._ensure_fresh()
+            return self._version
+
+    def _today(self) -> date:
+        return datetime.fromtimestamp(self.clock(), LOCAL_TZ).date()
+
+    def _day_bounds(self, first: date, days: int) -> Tuple[datetime, datetime]:
+        start = datetime.combine(first, dtime.min, LOCAL_TZ)
+        return start, start + timedelta(days=days)
+
+    def _split_by_day(self, intervals: List[Interval]) -> Dict[date, List[Interval]]:
+        per_day: Dict[date, List[Interval]] = {}
+        for start, end in intervals:
+            start, end = start.astimezone(LOCAL_TZ), end.astimezone(LOCAL_TZ)
+            day = start.date()
+            while True:
+                day_end = datetime.combine(day + timedelta(days=1), dtime.min, LOCAL_TZ)
+                clipped_start = max(start, datetime.combine(day, dtime.min, LOCAL_TZ))
+                per_day.setdefault(day, []).append((clipped_start, min(end, day_end)))
+                if end <= day_end:
+                    break
+                day += timedelta(days=1)
+        return per_day
+
+    def _ensure_fresh(self) -> None:
+        now = self.clock()
+        if self._first_day == self._today() and now - self._loaded_at < self.ttl:
+            return
+        if now - self._failed_at < self.retry_after:
+            return
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Recarga todo el horizonte con una sola consulta."""
+        with self._lock:
+            first = self._today()
+            time_min, time_max = self._day_bounds(first, self.horizon_days)
+            try:
+                intervals = self.fetch(time_min, time_max)
+            except Exception as e:
+                logger.warning(f"No se pudo cargar la ocupación del calendario: {e}")
+                intervals = None
+            if intervals is None:
+                # Sin datos frescos no se responde desde el índice (los llamadores consultan directo)
+                self._days, self._first_day = {}, None
+                self._failed_at = self.clock()
+                self._counters["fetch_errors"] += 1
+                return False
+            per_day = self._split_by_day(intervals)
+            self._days = {
+                first + timedelta(days=i): _merge(per_day.get(first + timedelta(days=i), []))
+                for i in range(self.horizon_days)
+            }
+            self._stale_days.clear()
+            self._first_day = first
+            self._loaded_at = self.clock()
+            self._version += 1
+            self._counters["refreshes"] += 1
+            logger.debug("📅 Índice de ocupación recargado: %d días", self.horizon_days)
+            return True
+
+    def _refresh_day(self, day: date) -> bool:
+        time_min, time_max = self._day_bounds(day, 1)
+        try:
+            intervals = self.fetch(time_min, time_max)
+        except Exception as e:
+            logger.warning(f"No se pudo recargar la ocupación del {day}: {e}")
+            intervals = None
+        if intervals is None:
+            self._counters["fetch_errors"] += 1
+            return False
+        self._days[day] = _merge(self._split_by_day(intervals).get(day, []))
+        self._stale_days.discard(day)
+        self._version += 1
+        self._counters["day_refreshes"] += 1
+        return True
+
+    def _day(self, day: date) -> Optional[Tuple[List[datetime], List[datetime]]]:
+        self._ensure_fresh()
+        if day not in self._days:
+            return None
+        if day in self._stale_days and not self._refresh_day(day):
+            return None
+        return self._days[day]
+
+    def busy(self, day: date) -> Optional[List[Interval]]:
+        """Intervalos ocupados del día, o None si está fuera del horizonte o no hay datos."""
+        with self._lock:
+            self._counters["lookups"] += 1
+            data = self._day(day)
+            if data is None:
+                self._counters["misses"] += 1
+                return None
+            return list(zip(*data))
+
+    def is_busy(self, start: datetime, end: datetime) -> Optional[bool]:
+        """True si [start, end) se solapa con algo ocupado; None si no se puede responder."""
+        start, end = start.astimezone(LOCAL_TZ), end.astimezone(LOCAL_TZ)
+        with self._lock:
+            self._counters["lookups"] += 1
+            data = self._day(start.date())
+            if data is None:
+                self._counters["misses"] += 1
+                return None
+            starts, ends = data
+            # Primer intervalo que termina después de `start`; como están fusionados,
+            # es el único candidato a solaparse
+            i = bisect_right(ends, start)
+            return i < len(starts) and starts[i] < end
+
+    def add(self, start: datetime, end: datetime) -> None:
+        """Write-through de un evento recién creado."""
+        with self._lock:
+            for day, intervals in self._split_by_day([(start, end)]).items():
+                if day in self._days:
+                    starts, ends = self._days[day]
+                    self._days[day] = _merge(list(zip(starts, ends)) + intervals)
+            self._version += 1
+            self._counters["writes"] += 1
+
+    def invalidate(self, day: Optional[date] = None) -> None:
+        """Marca un día (o todo el índice) para volver a consultarlo en la siguiente lectura."""
+        with self._lock:
+            if day is None:
+                self._loaded_at = 0.0
+            elif day in self._days:
+                self._stale_days.add(day)
+            self._version += 1
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "horizon_days": self.horizon_days,
+                "ttl": self.ttl,
+                "version": self._version,
+                "loaded_days": len(self._days),
+                "stale_days": len(self._stale_days),
+                "age_seconds": round(self.clock() - self._loaded_at, 1) if self._loaded_at else None,
+                **self._counters,
+            }
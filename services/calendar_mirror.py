@@ -0,0 +1,283 @@
+"""
+Espejo local de Google Calendar (tablas calendar_events y calendar_sync_state).
+
+- La primera sincronización descarga todos los eventos (paginando) y guarda el
+  `nextSyncToken`; las siguientes piden solo los cambios desde ese token.
+- Si Google responde 410 (token vencido) se borra el espejo y se hace una
+  sincronización completa.
+- La ejecuta Celery beat cada CALENDAR_SYNC_INTERVAL segundos y, si hay canal
+  push configurado (CALENDAR_WEBHOOK_URL), también cada notificación de Google.
+- La disponibilidad lee el espejo mientras esté al día (CALENDAR_MIRROR_MAX_AGE);
+  si no, vuelve a consultar freebusy.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dateutil import parser as dateutil_parser
+from googleapiclient.errors import HttpError
+
+from models import db, CalendarEvent, CalendarSyncState
+from .appointment_service import busy_index, calendar_client
+from .busy_index import LOCAL_TZ
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_ID = "primary"
+MIRROR_MAX_AGE = int(os.getenv("CALENDAR_MIRROR_MAX_AGE", 900))
+_PAGE_SIZE = 250
+
+
+def _local_naive(value: str) -> datetime:
+    return dateutil_parser.isoparse(value).astimezone(LOCAL_TZ).replace(tzinfo=None)
+
+
+def _event_times(event: Dict[str, Any]) -> Optional[Tuple[datetime, datetime, bool]]:
+    """(inicio, fin, todo_el_día) en hora local sin zona, o None si el evento no trae fechas."""
+    start, end = event.get("start", {}), event.get("end", {})
+    if start.get("dateTime") and end.get("dateTime"):
+        return _local_naive(start["dateTime"]), _local_naive(end["dateTime"]), False
+    if start.get("date") and end.get("date"):
+        return (datetime.fromisoformat(start["date"]), datetime.fromisoformat(end["date"]), True)
+    return None
+
+
+def _apply_event(calendar_id: str, event: Dict[str, Any]) -> str:
+    """Aplica un evento (o su borrado) al espejo. Retorna 'upserted', 'deleted' o 'skipped'."""
+    row = CalendarEvent.query.filter_by(calendar_id=calendar_id, event_id=event.get("id")).first()
+    if event.get("status") == "cancelled":
+        if row is None:
+            return "skipped"
+        db.session.delete(row)
+        return "deleted"
+
+    times = _event_times(event)
+    if times is None:
+        return "skipped"
+    if row is None:
+        row = CalendarEvent(calendar_id=calendar_id, event_id=event["id"])
+        db.session.add(row)
+    row.start_at, row.end_at, row.all_day = times
+    row.status = event.get("status", "confirmed")
+    row.summary = (event.get("summary") or "")[:500]
+    row.description = event.get("description")
+    row.transparent = event.get("transparency") == "transparent"
+    row.google_updated = event.get("updated")
+    return "upserted"
+
+
+def _list_pages(service, calendar_id: str, sync_token: Optional[str]) -> Iterator[Dict[str, Any]]:
+    params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": _PAGE_SIZE}
+    if sync_token:
+        params["syncToken"] = sync_token
+    page_token = None
+    while True:
+        page = service.events().list(pageToken=page_token, **params).execute()
+        yield page
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def _run_sync(service, state: CalendarSyncState, full: bool) -> Dict[str, int]:
+    counters = {"upserted": 0, "deleted": 0, "skipped": 0, "pages": 0}
+    if full:
+        CalendarEvent.query.filter_by(calendar_id=state.calendar_id).delete()
+    next_sync_token = None
+    for page in _list_pages(service, state.calendar_id, None if full else state.sync_token):
+        counters["pages"] += 1
+        for event in page.get("items", []):
+            counters[_apply_event(state.calendar_id, event)] += 1
+        next_sync_token = page.get("nextSyncToken") or next_sync_token
+
+    now = datetime.utcnow()
+    state.sync_token = next_sync_token
+    state.last_sync = now
+    if full:
+        state.last_full_sync = now
+    db.session.commit()
+    return counters
+
+
+def sync_calendar_mirror(service=None, calendar_id: str = CALENDAR_ID) -> Dict[str, Any]:
+    """Trae los cambios de Google al espejo (incremental si hay syncToken). Requiere app context."""
+    if service is None:
+        with calendar_client() as client:
+            return _sync_mirror(client, calendar_id)
+    return _sync_mirror(service, calendar_id)
+
+
+def _sync_mirror(service, calendar_id: str) -> Dict[str, Any]:
+    if not service:
+        return {"ok": False, "error": "No hay servicio de calendario disponible"}
+
+    state = db.session.get(CalendarSyncState, calendar_id)
+    if state is None:
+        state = CalendarSyncState(calendar_id=calendar_id)
+        db.session.add(state)
+    mode = "incremental" if state.sync_token else "full"
+
+    try:
+        try:
+            counters = _run_sync(service, state, full=mode == "full")
+        except HttpError as e:
+            if e.resp.status != 410 or mode == "full":
+                raise
+            logger.warning("📅 syncToken vencido (410): resincronización completa del espejo")
+            db.session.rollback()
+            state = db.session.get(CalendarSyncState, calendar_id)
+            mode = "full"
+            counters = _run_sync(service, state, full=True)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error sincronizando el espejo del calendario: {e}")
+        return {"ok": False, "mode": mode, "error": str(e)}
+
+    if counters["upserted"] or counters["deleted"] or mode == "full":
+        busy_index.invalidate()
+    logger.info(f"📅 Espejo del calendario sincronizado ({mode}): {counters}")
+    return {"ok": True, "mode": mode, **counters}
+
+
+def mirror_busy_intervals(time_min: datetime, time_max: datetime,
+                          calendar_id: str = CALENDAR_ID) -> Optional[List[Tuple[datetime, datetime]]]:
+    """
+    Intervalos ocupados según el espejo (misma semántica que freebusy: eventos no
+    cancelados que no estén marcados como "disponible"). None si el espejo no está
+    al día. Requiere app context.
+    """
+    state = db.session.get(CalendarSyncState, calendar_id)
+    if state is None or state.last_sync is None \
+            or (datetime.utcnow() - state.last_sync).total_seconds() > MIRROR_MAX_AGE:
+        return None
+    lower = time_min.astimezone(LOCAL_TZ).replace(tzinfo=None)
+    upper = time_max.astimezone(LOCAL_TZ).replace(tzinfo=None)
+    rows = (
+        CalendarEvent.query
+        .filter(
+            CalendarEvent.calendar_id == calendar_id,
+            CalendarEvent.status != "cancelled",
+            CalendarEvent.transparent.is_(False),
+            CalendarEvent.start_at < upper,
+            CalendarEvent.end_at > lower,
+        )
+        .order_by(CalendarEvent.start_at)
+        .all()
+    )
+    return [(r.start_at.replace(tzinfo=LOCAL_TZ), r.end_at.replace(tzinfo=LOCAL_TZ)) for r in rows]
+
+
+def get_mirror_stats(calendar_id: str = CALENDAR_ID) -> Dict[str, Any]:
+    """Estado del espejo para /debug-cache. Requiere app context."""
+    state = db.session.get(CalendarSyncState, calendar_id)
+    return {
+        "events": CalendarEvent.query.filter_by(calendar_id=calendar_id).count(),
+        "has_sync_token": bool(state and state.sync_token),
+        "last_sync": state.last_sync.isoformat() if state and state.last_sync else None,
+        "last_full_sync": state.last_full_sync.isoformat() if state and state.last_full_sync else None,
+        "channel_expiration": (state.channel_expiration.isoformat()
+                               if state and state.channel_expiration else None),
+        "max_age_seconds": MIRROR_MAX_AGE,
+    }
+
+
+# ==================== NOTIFICACIONES PUSH ====================
+
+_last_push_sync = 0.0
+_push_lock = threading.Lock()
+_PUSH_DEBOUNCE_SECONDS = 5
+
+
+def _schedule_sync(app) -> str:
+    """Encola la sincronización en Celery; sin broker, la ejecuta en un hilo del proceso web."""
+    global _last_push_sync
+    with _push_lock:
+        if time.time() - _last_push_sync < _PUSH_DEBOUNCE_SECONDS:
+            return "debounced"
+        _last_push_sync = time.time()
+    try:
+        from tasks import sync_calendar_mirror as sync_task
+        sync_task.delay()
+        return "queued"
+    except Exception as e:
+        logger.warning(f"Celery no disponible para sincronizar el calendario, se ejecuta local: {e}")
+
+    def run():
+        with app.app_context():
+            sync_calendar_mirror()
+
+    threading.Thread(target=run, name="calendar-sync", daemon=True).start()
+    return "thread"
+
+
+def handle_push_notification(headers, app) -> Tuple[int, str]:
+    """
+    Procesa una notificación de events.watch. Retorna (status_http, acción).
+    Se verifica el token del canal (CALENDAR_WEBHOOK_TOKEN) y se ignora el
+    mensaje inicial "sync"; el resto dispara una sincronización incremental.
+    """
+    expected = os.getenv("CALENDAR_WEBHOOK_TOKEN")
+    if not expected or headers.get("X-Goog-Channel-Token") != expected:
+        return 403, "token inválido"
+    state = headers.get("X-Goog-Resource-State", "")
+    if state == "sync":
+        return 200, "sync"
+    return 200, _schedule_sync(app)
+
+
+def watch_calendar(address: str, service=None, calendar_id: str = CALENDAR_ID,
+                   ttl_seconds: int = 7 * 24 * 3600) -> Dict[str, Any]:
+    """
+    Abre (o renueva si vence en menos de un día) el canal push hacia `address`.
+    Requiere app context y CALENDAR_WEBHOOK_TOKEN.
+    """
+    if service is None:
+        with calendar_client() as client:
+            return _watch(address, client, calendar_id, ttl_seconds)
+    return _watch(address, service, calendar_id, ttl_seconds)
+
+
+def _watch(address: str, service, calendar_id: str, ttl_seconds: int) -> Dict[str, Any]:
+    token = os.getenv("CALENDAR_WEBHOOK_TOKEN")
+    if not token:
+        return {"ok": False, "error": "CALENDAR_WEBHOOK_TOKEN no configurado"}
+    if not service:
+        return {"ok": False, "error": "No hay servicio de calendario disponible"}
+
+    state = db.session.get(CalendarSyncState, calendar_id)
+    if state is None:
+        state = CalendarSyncState(calendar_id=calendar_id)
+        db.session.add(state)
+    if state.channel_expiration and state.channel_expiration - datetime.utcnow() > timedelta(days=1):
+        return {"ok": True, "renewed": False, "channel_id": state.channel_id}
+
+    try:
+        channel = service.events().watch(calendarId=calendar_id, body={
+            "id": uuid.uuid4().hex,
+            "type": "web_hook",
+            "address": address,
+            "token": token,
+            "params": {"ttl": str(ttl_seconds)},
+        }).execute()
+        if state.channel_id and state.channel_resource_id:
+            try:
+                service.channels().stop(body={"id": state.channel_id, "resourceId": state.channel_resource_id}).execute()
+            except HttpError as e:
+                logger.warning(f"No se pudo cerrar el canal anterior del calendario: {e}")
+        state.channel_id = channel["id"]
+        state.channel_resource_id = channel.get("resourceId")
+        expiration_ms = int(channel.get("expiration", 0) or 0)
+        state.channel_expiration = (datetime.utcfromtimestamp(expiration_ms / 1000) if expiration_ms
+                                    else datetime.utcnow() + timedelta(seconds=ttl_seconds))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error abriendo el canal push del calendario: {e}")
+        return {"ok": False, "error": str(e)}
+    logger.info(f"📡 Canal push del calendario activo hasta {state.channel_expiration:%Y-%m-%d %H:%M} UTC")
+    return {"ok": True, "renewed": True, "channel_id": state.channel_id}
@@ -0,0 +1,147 @@
+"""
+Operaciones de Google Calendar en lote (batch HTTP).
+
+Cada operación suelta sobre un evento es un round trip a Google. `CalendarBatch`
+agrupa get / patch / insert / delete en peticiones batch de hasta
+`BATCH_LIMIT` operaciones (el máximo que admite Calendar) y devuelve el
+resultado de cada una por su clave:
+
+    batch = CalendarBatch(service)
+    batch.patch("evt1", {"description": "..."}, key=12)
+    batch.delete("evt2", key=13)
+    resultados = batch.execute()   # {12: {"ok": True, ...}, 13: {...}}
+
+Cada resultado es un dict con ok, status (HTTP), result (cuerpo) y error.
+Borrar un evento que ya no existe (404/410) y crear uno con ID propio que ya
+existe (409) cuentan como éxito: las operaciones son idempotentes.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 50
+
+STATUS_LABELS = {"confirmed": "✅ CONFIRMADA", "completed": "✔️ COMPLETADA", "pending": "⏳ PENDIENTE"}
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "batches": 0,
+    "operations": 0,
+    "failed_operations": 0,
+    "batch_errors": 0,
+    "last_batch_ms": None,
+}
+
+
+def status_label(status: str) -> str:
+    return STATUS_LABELS.get(status, status.upper())
+
+
+def status_patch_body(status: str, description: str) -> Dict[str, Any]:
+    """
+    Cuerpo de `events.patch` para la etiqueta de estado: un solo patch, sin leer antes
+    el evento. `description` es la descripción base del evento (sin etiqueta).
+    """
+    return {
+        "description": f"{status_label(status)}\n{description.strip()}",
+        "extendedProperties": {"private": {"equilibraStatus": status}},
+    }
+
+
+def _tolerated(method: str, error: HttpError, explicit_id: bool) -> bool:
+    status = error.resp.status
+    if method == "delete":
+        return status in (404, 410)
+    return method == "insert" and explicit_id and status == 409
+
+
+class CalendarBatch:
+    """Acumula operaciones sobre eventos y las ejecuta en lotes de BATCH_LIMIT."""
+
+    def __init__(self, service, calendar_id: str = "primary"):
+        self.service = service
+        self.calendar_id = calendar_id
+        self._ops: List[Tuple[Hashable, str, Any, bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def _add(self, key: Optional[Hashable], method: str, request, explicit_id: bool = False) -> Hashable:
+        key = len(self._ops) if key is None else key
+        self._ops.append((key, method, request, explicit_id))
+        return key
+
+    def get(self, event_id: str, key: Optional[Hashable] = None) -> Hashable:
+        return self._add(key, "get", self.service.events().get(calendarId=self.calendar_id, eventId=event_id))
+
+    def patch(self, event_id: str, body: Dict[str, Any], key: Optional[Hashable] = None) -> Hashable:
+        return self._add(key, "patch", self.service.events().patch(
+            calendarId=self.calendar_id, eventId=event_id, body=body))
+
+    def insert(self, body: Dict[str, Any], key: Optional[Hashable] = None) -> Hashable:
+        return self._add(key, "insert", self.service.events().insert(calendarId=self.calendar_id, body=body),
+                         explicit_id="id" in body)
+
+    def delete(self, event_id: str, key: Optional[Hashable] = None) -> Hashable:
+        return self._add(key, "delete", self.service.events().delete(calendarId=self.calendar_id, eventId=event_id))
+
+    def execute(self) -> Dict[Hashable, Dict[str, Any]]:
+        """Ejecuta todas las operaciones pendientes (un round trip por lote). Retorna el resultado por clave."""
+        results: Dict[Hashable, Dict[str, Any]] = {}
+        ops, self._ops = self._ops, []
+        for start in range(0, len(ops), BATCH_LIMIT):
+            self._execute_chunk(ops[start:start + BATCH_LIMIT], results)
+        return results
+
+    def _execute_chunk(self, chunk: List[Tuple[Hashable, str, Any, bool]],
+                       results: Dict[Hashable, Dict[str, Any]]) -> None:
+        by_request_id = {str(i): op for i, op in enumerate(chunk)}
+
+        def callback(request_id, response, exception):
+            key, method, _, explicit_id = by_request_id[request_id]
+            if exception is None:
+                results[key] = {"ok": True, "status": 200, "result": response or None, "error": None}
+            elif isinstance(exception, HttpError):
+                results[key] = {"ok": _tolerated(method, exception, explicit_id),
+                                "status": exception.resp.status, "result": None, "error": str(exception)}
+            else:
+                results[key] = {"ok": False, "status": None, "result": None, "error": str(exception)}
+
+        started = time.perf_counter()
+        batch = self.service.new_batch_http_request(callback=callback)
+        for request_id, (_, _, request, _) in by_request_id.items():
+            batch.add(request, request_id=request_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            # La petición batch entera falló (red, auth): ninguna operación se aplicó con certeza
+            logger.warning(f"⚠️ Lote de {len(chunk)} operaciones de Calendar falló: {e}")
+            with _stats_lock:
+                _stats["batch_errors"] += 1
+            for key, _, _, _ in chunk:
+                results.setdefault(key, {"ok": False, "status": None, "result": None, "error": str(e)})
+
+        failed = sum(1 for key, _, _, _ in chunk if not results[key]["ok"])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            _stats["batches"] += 1
+            _stats["operations"] += len(chunk)
+            _stats["failed_operations"] += failed
+            _stats["last_batch_ms"] = round(elapsed_ms, 1)
+        logger.info(f"📦 Lote de Calendar: {len(chunk)} operaciones, {failed} fallidas, {elapsed_ms:.0f} ms")
+
+
+def get_calendar_ops_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        batches = _stats["batches"]
+        return {
+            "batch_limit": BATCH_LIMIT,
+            **_stats,
+            "ops_per_batch": round(_stats["operations"] / batches, 1) if batches else 0.0,
+        }
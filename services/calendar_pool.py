@@ -0,0 +1,219 @@
+"""
+Pool de clientes de Google Calendar.
+
+El transporte httplib2 de cada cliente de googleapiclient no es thread-safe:
+compartir uno entre los hilos de un worker mezcla o serializa las peticiones.
+El pool presta un cliente por hilo durante un bloque `with pool.lease()`:
+
+- Como máximo `size` clientes en uso a la vez; los demás hilos esperan hasta
+  `acquire_timeout` segundos y, si no hay cliente libre, reciben None (igual que
+  cuando el calendario no está disponible).
+- Los clientes se crean bajo demanda con `factory()` (todos comparten la misma
+  credencial y su token) y se descartan pasado `max_age`.
+- Préstamos anidados en el mismo hilo reutilizan el cliente ya prestado.
+- `stats()` expone el tiempo de espera para dimensionar el pool (/debug-cache).
+
+`TokenRefresher` renueva el token de esa credencial compartida en un hilo de
+fondo antes de que venza, así ninguna petición de usuario paga la renovación.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httplib2
+from google_auth_httplib2 import Request
+
+logger = logging.getLogger(__name__)
+
+
+class CalendarClientPool:
+    """Préstamo de clientes de Calendar, uno por hilo a la vez."""
+
+    def __init__(self, factory: Callable[[], Any], size: int = 4, acquire_timeout: float = 10.0,
+                 max_age: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.factory = factory
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.max_age = max_age
+        self.clock = clock
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: List[Tuple[Any, float]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._in_use = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._counters = {"leases": 0, "waits": 0, "timeouts": 0, "created": 0, "discarded": 0}
+
+    def _checkout(self) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            while self._idle:
+                client, created = self._idle.pop()
+                if self.clock() - created < self.max_age:
+                    return client, created
+                self._counters["discarded"] += 1
+        client = self.factory()
+        if client is None:
+            return None
+        with self._lock:
+            self._counters["created"] += 1
+        return client, self.clock()
+
+    def _record_wait(self, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            self._counters["timeouts" if timed_out else "leases"] += 1
+            if waited > 0:
+                self._counters["waits"] += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    @contextmanager
+    def lease(self) -> Iterator[Optional[Any]]:
+        """Presta un cliente durante el bloque; None si no hay credenciales o no hubo cliente a tiempo."""
+        held = getattr(self._local, "client", None)
+        if held is not None:
+            yield held
+            return
+
+        waited = 0.0
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            started = self.clock()
+            acquired = self._slots.acquire(timeout=self.acquire_timeout)
+            waited = self.clock() - started
+        self._record_wait(waited, timed_out=not acquired)
+        if not acquired:
+            logger.warning(f"⏳ Sin cliente de Calendar libre tras {waited:.1f}s (pool de {self.size})")
+            yield None
+            return
+
+        try:
+            entry = self._checkout()
+            if entry is None:
+                yield None
+                return
+            client, created = entry
+            with self._lock:
+                self._in_use += 1
+            self._local.client = client
+            healthy = True
+            try:
+                yield client
+            except (OSError, httplib2.HttpLib2Error):
+                # Fallo de red a mitad de una petición: la conexión del cliente queda en estado dudoso
+                healthy = False
+                raise
+            finally:
+                self._local.client = None
+                with self._lock:
+                    self._in_use -= 1
+                    if healthy:
+                        self._idle.append((client, created))
+                    else:
+                        self._counters["discarded"] += 1
+        finally:
+            self._slots.release()
+
+    def prefill(self, count: Optional[int] = None) -> int:
+        """Crea clientes libres por adelantado (arranque del worker). Retorna cuántos hay libres."""
+        count = min(count or self.size, self.size)
+        while len(self._idle) < count:
+            client = self.factory()
+            if client is None:
+                break
+            with self._lock:
+                self._counters["created"] += 1
+                self._idle.append((client, self.clock()))
+        return len(self._idle)
+
+    def reset(self) -> None:
+        """Descarta los clientes libres (se recrean en el siguiente préstamo)."""
+        with self._lock:
+            self._counters["discarded"] += len(self._idle)
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self._counters["leases"] + self._counters["timeouts"]
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._counters,
+                "wait_avg_ms": round(self._wait_total / attempts * 1000, 2) if attempts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+
+class TokenRefresher:
+    """Renueva el token de `credentials` `margin` segundos antes de que venza, en un hilo daemon."""
+
+    def __init__(self, credentials, margin: float = 300, retry_after: float = 30,
+                 request_factory: Callable[[], Any] = lambda: Request(httplib2.Http(timeout=30))):
+        self.credentials = credentials
+        self.margin = margin
+        self.retry_after = retry_after
+        self.request_factory = request_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {"refreshes": 0, "errors": 0}
+        self._last_error: Optional[str] = None
+
+    def seconds_until_due(self) -> float:
+        """Segundos hasta la próxima renovación (0 si no hay token o ya toca)."""
+        expiry = getattr(self.credentials, "expiry", None)
+        if not getattr(self.credentials, "token", None) or expiry is None:
+            return 0.0
+        # google-auth guarda `expiry` como UTC sin zona
+        return max(0.0, (expiry - datetime.utcnow()).total_seconds() - self.margin)
+
+    def refresh_now(self) -> bool:
+        try:
+            self.credentials.refresh(self.request_factory())
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                self._last_error = str(e)
+            logger.warning(f"No se pudo renovar el token de Google Calendar: {e}")
+            return False
+        with self._lock:
+            self._counters["refreshes"] += 1
+            self._last_error = None
+        logger.debug("🔑 Token de Google Calendar renovado (vence %s UTC)", self.credentials.expiry)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            wait = self.seconds_until_due()
+            if wait > 0 and self._stop.wait(wait):
+                return
+            if not self.refresh_now():
+                self._stop.wait(self.retry_after)
+
+    def start(self) -> None:
+        """Arranca el hilo una sola vez por proceso."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="calendar-token", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        expiry = getattr(self.credentials, "expiry", None)
+        with self._lock:
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "expiry": expiry.isoformat() if expiry else None,
+                "margin_seconds": self.margin,
+                "last_error": self._last_error,
+                **self._counters,
+            }
@@ -1,53 +1,54 @@
 import logging
 from datetime import datetime
-from dateutil import parser as dateutil_parser
-from models import db, Appointment, Patient
-from services.appointment_service import get_calendar_service
+from typing import Any, Dict, Hashable, List, Optional
+from models import db, Appointment, CalendarEvent, Patient
+from services import outbox
+from services.appointment_service import busy_index, calendar_client
+from services.calendar_ops import STATUS_LABELS, CalendarBatch, status_label, status_patch_body
+from services.busy_index import LOCAL_TZ
+from services.calendar_mirror import sync_calendar_mirror
 
 logger = logging.getLogger(__name__)
 
 
-def sync_from_calendar() -> dict:
-    """Pull events from Google Calendar and reconcile with DB."""
-    service = get_calendar_service()
-    if not service:
-        return {"ok": False, "error": "No hay servicio de calendario disponible"}
+def sync_from_calendar(service=None) -> dict:
+    """Refresh the local calendar mirror and create appointments for future events missing in DB."""
+    mirror = sync_calendar_mirror(service)
+    if not mirror.get("ok"):
+        return mirror
 
     try:
-        now_iso = datetime.utcnow().isoformat() + "Z"
-        result = (
-            service.events()
-            .list(
-                calendarId="primary",
-                timeMin=now_iso,
-                maxResults=100,
-                singleEvents=True,
-                orderBy="startTime",
+        now_local = datetime.now(LOCAL_TZ).replace(tzinfo=None)
+        events = (
+            CalendarEvent.query
+            .filter(
+                CalendarEvent.calendar_id == "primary",
+                CalendarEvent.status != "cancelled",
+                CalendarEvent.all_day.is_(False),
+                CalendarEvent.start_at >= now_local,
             )
-            .execute()
+            .order_by(CalendarEvent.start_at)
+            .all()
         )
-        events = result.get("items", [])
+        known = {
+            event_id for (event_id,) in
+            db.session.query(Appointment.calendar_event_id).filter(Appointment.calendar_event_id.isnot(None))
+        }
+        # Reservas cuyo evento aún está creando el worker (sin calendar_event_id todavía)
+        booked = {
+            scheduled_at for (scheduled_at,) in
+            db.session.query(Appointment.scheduled_at).filter(Appointment.scheduled_at >= now_local)
+        }
         created = 0
         skipped = 0
 
         for event in events:
-            event_id = event.get("id")
-            if Appointment.query.filter_by(calendar_event_id=event_id).first():
+            if event.event_id in known or event.start_at in booked:
                 skipped += 1
                 continue
 
-            summary = event.get("summary", "")
-            description = event.get("description", "")
-            start_raw = event.get("start", {}).get("dateTime") or event.get("start", {}).get("date")
-            if not start_raw:
-                continue
-
-            try:
-                scheduled_at = dateutil_parser.isoparse(start_raw)
-            except (ValueError, TypeError):
-                logger.warning(f"No se pudo parsear la fecha del evento: {start_raw}")
-                continue
-
+            summary = event.summary or ""
+            description = event.description or ""
             phone = _extract_phone(description)
             patient_name = _extract_patient_name(summary)
             symptom = _extract_symptom(description)
@@ -61,16 +62,16 @@ def sync_from_calendar() -> dict:
             if patient:
                 appt = Appointment(
                     patient_id=patient.id,
-                    scheduled_at=scheduled_at,
+                    scheduled_at=event.start_at,
                     symptom=symptom,
                     status="pending",
-                    calendar_event_id=event_id,
+                    calendar_event_id=event.event_id,
                 )
                 db.session.add(appt)
                 created += 1
 
         db.session.commit()
-        return {"ok": True, "created": created, "skipped": skipped}
+        return {"ok": True, "created": created, "skipped": skipped, "mirror": mirror}
 
     except Exception as e:
         db.session.rollback()
@@ -78,37 +79,160 @@ def sync_from_calendar() -> dict:
         return {"ok": False, "error": str(e)}
 
 
-def update_calendar_event_status(appointment: Appointment, new_status: str) -> bool:
-    """Update or delete a Google Calendar event when admin changes appointment status."""
+def queue_calendar_status_change(appointment: Appointment, new_status: str) -> bool:
+    """Queue the Calendar side effect of a status change in the current transaction (outbox)."""
     if not appointment.calendar_event_id:
-        return True
-
-    service = get_calendar_service()
-    if not service:
+        # Sin evento todavía: el handler de calendar.create aplica el estado al crearlo
         return False
+    if new_status == "cancelled":
+        outbox.enqueue("calendar.delete", {
+            "event_id": appointment.calendar_event_id,
+            "scheduled_at": appointment.scheduled_at.isoformat() if appointment.scheduled_at else None,
+        }, appointment.id)
+    else:
+        outbox.enqueue("calendar.patch", {
+            "event_id": appointment.calendar_event_id,
+            "status": new_status,
+        }, appointment.id)
+    return True
 
-    try:
-        event = service.events().get(calendarId="primary", eventId=appointment.calendar_event_id).execute()
 
-        if new_status == "cancelled":
-            service.events().delete(calendarId="primary", eventId=appointment.calendar_event_id).execute()
-            return True
+def _strip_status_label(description: Optional[str]) -> str:
+    lines = (description or "").splitlines()
+    if lines and lines[0].strip() in STATUS_LABELS.values():
+        lines = lines[1:]
+    return "\n".join(lines)
 
-        status_emojis = {"confirmed": "✅ CONFIRMADA", "completed": "✔️ COMPLETADA", "pending": "⏳ PENDIENTE"}
-        label = status_emojis.get(new_status, new_status.upper())
 
-        desc = event.get("description", "")
-        for emoji in ["✅", "✔️", "⏳"]:
-            desc = desc.replace(emoji, "")
-        desc = f"{label}\n{desc.strip()}"
+def _mirror_descriptions(event_ids: List[str]) -> Dict[str, str]:
+    """Base descriptions (without status label) of the events present in the local mirror."""
+    if not event_ids:
+        return {}
+    return {
+        event.event_id: _strip_status_label(event.description) for event in
+        CalendarEvent.query.filter(CalendarEvent.calendar_id == "primary", CalendarEvent.event_id.in_(event_ids))
+    }
 
-        event["description"] = desc
-        service.events().update(calendarId="primary", eventId=appointment.calendar_event_id, body=event).execute()
-        return True
 
+def apply_calendar_changes(changes: List[Dict[str, Any]]) -> Dict[Hashable, Dict[str, Any]]:
+    """
+    Apply status patches and deletes in Google batch requests (one round trip per 50).
+
+    Each change is {"key", "action": "patch"|"delete", "event_id", plus "status" and
+    "appointment_id" for patches or "scheduled_at" for deletes}. When several changes
+    target the same event only the last one is sent; the earlier ones report ok
+    with status None. Patched events missing from the local mirror are read first
+    in one extra batch. Returns the per-key result from CalendarBatch.
+    """
+    last_for_event = {change["event_id"]: change["key"] for change in changes}
+    results: Dict[Hashable, Dict[str, Any]] = {}
+    patches = []
+    for change in changes:
+        if last_for_event[change["event_id"]] != change["key"]:
+            results[change["key"]] = {"ok": True, "status": None, "result": None, "error": "superseded"}
+        elif change["action"] == "patch":
+            if db.session.get(Appointment, change["appointment_id"]) is None:
+                results[change["key"]] = {"ok": True, "status": None, "result": None,
+                                          "error": "appointment not found"}
+            else:
+                patches.append(change)
+    descriptions = _mirror_descriptions([change["event_id"] for change in patches])
+
+    with calendar_client() as service:
+        if not service:
+            raise RuntimeError("No hay servicio de calendario disponible")
+        # Events missing from the mirror are read first (one batch), so the PATCH keeps
+        # whatever the psychologist wrote in the description
+        lookup = CalendarBatch(service)
+        for change in patches:
+            if change["event_id"] not in descriptions:
+                lookup.get(change["event_id"], key=change["key"])
+        fetched = lookup.execute()
+        for change in patches:
+            result = fetched.get(change["key"])
+            if result is None:
+                continue
+            if result["ok"]:
+                descriptions[change["event_id"]] = _strip_status_label((result["result"] or {}).get("description"))
+            else:
+                results[change["key"]] = result
+
+        batch = CalendarBatch(service)
+        for change in changes:
+            if change["key"] in results:
+                continue
+            if change["action"] == "delete":
+                batch.delete(change["event_id"], key=change["key"])
+            else:
+                batch.patch(change["event_id"], status_patch_body(change["status"], descriptions[change["event_id"]]),
+                            key=change["key"])
+        results.update(batch.execute())
+
+    # Freed slots: re-read those days on the next availability lookup
+    for change in changes:
+        if change["action"] == "delete" and results[change["key"]]["ok"] and change.get("scheduled_at"):
+            busy_index.invalidate(_local_date(change["scheduled_at"]))
+    return results
+
+
+def repair_calendar_events() -> dict:
+    """
+    Bring Calendar in line with the DB using the local mirror, in batch requests:
+    delete events of cancelled appointments that still exist and fix status labels
+    that do not match. Events missing from Calendar are only reported.
+    """
+    appointments = (
+        Appointment.query
+        .filter(Appointment.calendar_event_id.isnot(None))
+        .all()
+    )
+    events = {
+        event.event_id: event for event in
+        CalendarEvent.query.filter(
+            CalendarEvent.calendar_id == "primary",
+            CalendarEvent.event_id.in_([a.calendar_event_id for a in appointments]),
+        )
+    }
+    changes = []
+    missing = 0
+    for appointment in appointments:
+        event = events.get(appointment.calendar_event_id)
+        if event is None or event.status == "cancelled":
+            if appointment.status != "cancelled":
+                missing += 1
+            continue
+        if appointment.status == "cancelled":
+            changes.append({"key": appointment.id, "action": "delete", "event_id": event.event_id,
+                            "scheduled_at": appointment.scheduled_at})
+            continue
+        first_line = (event.description or "").splitlines()[0].strip() if event.description else ""
+        if appointment.status != "pending" and first_line != status_label(appointment.status):
+            changes.append({"key": appointment.id, "action": "patch", "event_id": event.event_id,
+                            "status": appointment.status, "appointment_id": appointment.id})
+
+    if not changes:
+        return {"ok": True, "patched": 0, "deleted": 0, "failed": 0, "missing": missing}
+    try:
+        results = apply_calendar_changes(changes)
     except Exception as e:
-        logger.error(f"Error actualizando evento de calendario: {e}")
-        return False
+        logger.error(f"Error reparando eventos de Calendar: {e}")
+        return {"ok": False, "error": str(e), "missing": missing}
+
+    failed = [key for key, result in results.items() if not result["ok"]]
+    return {
+        "ok": not failed,
+        "patched": sum(1 for c in changes if c["action"] == "patch" and results[c["key"]]["ok"]),
+        "deleted": sum(1 for c in changes if c["action"] == "delete" and results[c["key"]]["ok"]),
+        "failed": len(failed),
+        "missing": missing,
+    }
+
+
+def _local_date(scheduled_at: datetime):
+    """Día local (America/Guayaquil) de una cita; las fechas sin zona ya son locales."""
+    if scheduled_at.tzinfo is None:
+        return scheduled_at.date()
+    return scheduled_at.astimezone(LOCAL_TZ).date()
 
 
 def _extract_phone(text: str) -> str:
@@ -0,0 +1,118 @@
+"""
+Contexto acotado de conversación para los prompts de IA.
+
+El prompt incluye los últimos `window` mensajes del historial y un resumen
+acumulado de todo lo anterior, así su tamaño se mantiene constante por turno
+aunque la conversación crezca:
+
+- Cuando quedan `summary_every` mensajes nuevos fuera de la ventana, el resumen
+  se actualiza de forma incremental (resumen previo + mensajes salientes) en un
+  hilo de fondo, fuera del request.
+- El resumen se guarda por sesión en una caché de respuestas (compartida entre
+  workers vía Redis si está configurado) junto con cuántos mensajes cubre.
+- Mientras se actualiza, el prompt usa el resumen anterior.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .response_cache import create_response_cache, register_cache
+
+logger = logging.getLogger(__name__)
+
+_ROLES = {"user": "Usuario", "bot": "Psicólogo"}
+
+# Actualizaciones de resumen fuera del request
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ctx-summary")
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 3].rstrip() + "..."
+
+
+class ConversationContextBuilder:
+    """Construye el bloque de contexto (resumen + últimos mensajes) de una sesión."""
+
+    def __init__(self, summarizer: Callable[[str, List[Tuple[str, str]]], str],
+                 window: int = 6, summary_every: int = 4, max_chars_per_turn: int = 400,
+                 cache=None, executor: Optional[ThreadPoolExecutor] = None):
+        self.summarizer = summarizer
+        self.window = window
+        self.summary_every = summary_every
+        self.max_chars_per_turn = max_chars_per_turn
+        self.cache = cache or register_cache(
+            create_response_cache("conversation_summary", max_entries=500, ttl=6 * 3600)
+        )
+        self.executor = executor or _executor
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _turns(interacciones: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        return [(i.get("tipo", "bot"), i.get("mensaje", "")) for i in interacciones if i.get("mensaje")]
+
+    def get_summary(self, conversation_id: str) -> Tuple[int, str]:
+        """Retorna (mensajes cubiertos, resumen) guardados para la sesión."""
+        raw = self.cache.get(conversation_id)
+        if not raw:
+            return 0, ""
+        try:
+            data = json.loads(raw)
+            return int(data["upto"]), data["summary"]
+        except (ValueError, KeyError, TypeError):
+            return 0, ""
+
+    def build(self, conversation_id: str, interacciones: List[Dict[str, Any]]) -> str:
+        """
+        Bloque de contexto para el prompt. Programa la actualización del resumen
+        si hay suficientes mensajes nuevos fuera de la ventana.
+        """
+        turns = self._turns(interacciones)
+        recent = turns[-self.window:] if self.window else []
+        evicted = turns[:-self.window] if self.window else turns
+
+        covered, summary = self.get_summary(conversation_id)
+        if covered > len(evicted):
+            # El historial se reinició con el mismo id: el resumen ya no aplica
+            covered, summary = 0, ""
+        if len(evicted) - covered >= self.summary_every:
+            self._schedule(conversation_id, summary, covered, evicted)
+
+        partes = []
+        if summary:
+            partes.append(f"Resumen de la conversación previa: {summary}")
+        if recent:
+            partes.append("Últimos intercambios:")
+            partes.extend(
+                f"{_ROLES.get(tipo, 'Psicólogo')}: {_truncate(mensaje, self.max_chars_per_turn)}"
+                for tipo, mensaje in recent
+            )
+        return "\n".join(partes)
+
+    def _schedule(self, conversation_id: str, summary: str, covered: int,
+                  evicted: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        nuevos = [(tipo, _truncate(m, self.max_chars_per_turn)) for tipo, m in evicted[covered:]]
+        self.executor.submit(self._update, conversation_id, summary, len(evicted), nuevos)
+
+    def _update(self, conversation_id: str, summary: str, upto: int,
+                nuevos: List[Tuple[str, str]]) -> None:
+        try:
+            nuevo_resumen = self.summarizer(summary, nuevos)
+            if nuevo_resumen:
+                self.cache.set(conversation_id, json.dumps(
+                    {"upto": upto, "summary": nuevo_resumen}, ensure_ascii=False
+                ))
+                logger.debug(f"🧾 Resumen de conversación actualizado ({upto} mensajes)")
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el resumen de conversación: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
@@ -5,16 +5,131 @@ Implementa State Pattern para manejar los diferentes estados del flujo de conver
 
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, Any, Optional, Tuple
+import threading
+import time
+import uuid
+from typing import Dict, Any, Iterator, Optional, Tuple
 from flask import session, request
 from models import db as _db, Conversation as _ConvModel, Patient as _Patient
-from .ai_service import AIServiceFactory
-from .appointment_service import agendar_cita_completa as _agendar_cita_completa
+from .ai_service import AIServiceFactory, UncachedResponse
+from .context_builder import ConversationContextBuilder
+from .llm_executor import ExecutorBusy, get_llm_executor
+from .opening_pool import OpeningPool, warm_openings
+from .rate_governor import BACKGROUND, call_priority
+from .shared_redis import shared_redis_client
+from .appointment_service import agendar_cita_idempotente as _agendar_cita_idempotente
+from .idempotency import IdempotencyInProgress, IdempotencyKeyReused, valid_idempotency_key
 from .validation_service import ValidationService
 from constants import SINTOMAS_DISPONIBLES, detectar_crisis, CRISIS_RESPONSE
 
 logger = logging.getLogger(__name__)
 
+_RESPUESTA_POR_DEFECTO = (
+    "Entiendo que estás pasando por un momento difícil. "
+    "¿Te gustaría contarme más sobre cómo te sientes?"
+)
+
+RESPUESTA_OCUPADO = (
+    "En este momento estoy atendiendo a muchas personas. "
+    "Por favor, vuelve a enviar tu mensaje en unos segundos."
+)
+
+# ==================== RESPUESTAS EN STREAMING ====================
+# La sesión se guarda al enviar las cabeceras, antes del cuerpo del stream.
+# Por eso el texto final de cada stream (el que vio el usuario) se guarda al
+# terminar el stream y se incorpora al historial en el siguiente request (ver
+# ConversationService.resolve_pending_response). Con REDIS_URL se guarda en
+# Redis, así lo encuentra cualquier worker; sin Redis, en memoria del proceso.
+# La respuesta nunca se regenera: sería otro texto distinto del que se mostró.
+
+_STREAM_RESULT_TTL = 600  # segundos
+_STREAM_RESULT_PREFIX = "equilibra:stream:"
+_stream_results: Dict[str, Tuple[float, str]] = {}
+_stream_results_lock = threading.Lock()
+_stream_redis = shared_redis_client("las respuestas en streaming")
+
+
+def _guardar_respuesta_stream(pendiente_id: str, respuesta: str) -> None:
+    if _stream_redis is not None:
+        try:
+            _stream_redis.set(_STREAM_RESULT_PREFIX + pendiente_id, respuesta.encode("utf-8"),
+                              ex=_STREAM_RESULT_TTL)
+            return
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la respuesta en streaming en Redis: {e}")
+    now = time.time()
+    with _stream_results_lock:
+        for key in [k for k, (ts, _) in _stream_results.items() if now - ts > _STREAM_RESULT_TTL]:
+            del _stream_results[key]
+        _stream_results[pendiente_id] = (now, respuesta)
+
+
+def _tomar_respuesta_stream(pendiente_id: str) -> Optional[str]:
+    with _stream_results_lock:
+        entry = _stream_results.pop(pendiente_id, None)
+    if entry and time.time() - entry[0] <= _STREAM_RESULT_TTL:
+        return entry[1]
+    if _stream_redis is not None:
+        try:
+            pipe = _stream_redis.pipeline()
+            pipe.get(_STREAM_RESULT_PREFIX + pendiente_id)
+            pipe.delete(_STREAM_RESULT_PREFIX + pendiente_id)
+            raw, _ = pipe.execute()
+        except Exception as e:
+            logger.warning(f"No se pudo leer la respuesta en streaming de Redis: {e}")
+            return None
+        if raw is not None:
+            return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+    return None
+
+
+# ==================== CONTEXTO MULTI-TURNO ====================
+# ConversationService se instancia por request; el constructor de contexto
+# (y su caché de resúmenes) se comparte a nivel de proceso.
+
+_context_builder: Optional[ConversationContextBuilder] = None
+_context_builder_lock = threading.Lock()
+
+
+def _get_context_builder(ai_service) -> ConversationContextBuilder:
+    global _context_builder
+    if _context_builder is None:
+        with _context_builder_lock:
+            if _context_builder is None:
+                _context_builder = ConversationContextBuilder(ai_service.summarize)
+    return _context_builder
+
+
+# ==================== APERTURAS PRECALCULADAS ====================
+
+opening_pool = OpeningPool()
+
+
+def warm_symptom_openings(rotate: bool = False) -> Dict[str, int]:
+    """
+    Precalcula aperturas para cada síntoma de SINTOMAS_DISPONIBLES.
+    Se ejecuta al arrancar (rellena los vacíos) y desde Celery (rota el pool).
+    """
+    ai_service = AIServiceFactory.get_instance()
+    uncached = getattr(ai_service.generate_response, "uncached", None)
+    if uncached is None:
+        logger.info("Servicio de IA sin generación remota: no hay aperturas que calentar")
+        return {"generated": 0, "skipped": 0, "failed": 0}
+    builder = ConversationService()
+
+    def generate(sintoma: str) -> Optional[str]:
+        prompt = builder._build_prompt(sintoma, "")
+        respuesta = uncached(ai_service, prompt, sintoma)
+        if not respuesta or isinstance(respuesta, UncachedResponse):
+            return None
+        # También queda en la caché de respuestas como la apertura "canónica"
+        ai_service.generate_response.cache_store(respuesta, ai_service, prompt, sintoma)
+        return respuesta
+
+    # Prioridad baja ante los límites de Groq: no compite con los turnos de los usuarios
+    with call_priority(BACKGROUND):
+        return warm_openings(opening_pool, SINTOMAS_DISPONIBLES, generate, rotate=rotate)
+
 
 class ConversationState:
     """Clase base para estados de conversación (State Pattern)"""
@@ -63,6 +178,12 @@ class EvaluationState(ConversationState):
             return False, "Por favor ingresa la fecha de inicio del síntoma"
         
         duracion = self.conversation_service.calculate_duration_days(fecha)
+        
+        # Obtener respuesta del sistema conversacional
+        respuesta = self.conversation_service.get_conversation_response("")
+        if respuesta == RESPUESTA_OCUPADO:
+            # Saturado: se queda en evaluación y no se guarda nada en el historial
+            return False, RESPUESTA_OCUPADO
         session["estado"] = "profundizacion"
         
         # Determinar comentario basado en duración
@@ -73,8 +194,6 @@ class EvaluationState(ConversationState):
         else:
             comentario = "Tu perseverancia es admirable."
         
-        # Obtener respuesta del sistema conversacional
-        respuesta = self.conversation_service.get_conversation_response("")
         self.conversation_service.add_bot_interaction(
             f"{comentario} {respuesta}",
             session.get("sintoma_actual")
@@ -108,10 +227,13 @@ class DeepeningState(ConversationState):
             logger.info("Usuario solicitó cita mediante botón - Saltando a agendamiento")
             return True, None
         
-        # Conversación normal
+        # Conversación normal (el contexto excluye el mensaje actual: se registra después)
         if user_input:
-            self.conversation_service.add_user_interaction(user_input)
             respuesta = self.conversation_service.get_conversation_response(user_input)
+            if respuesta == RESPUESTA_OCUPADO:
+                # Saturado: ni el mensaje ni la respuesta de ocupado entran al historial
+                return False, RESPUESTA_OCUPADO
+            self.conversation_service.add_user_interaction(user_input)
             self.conversation_service.add_bot_interaction(respuesta, session.get("sintoma_actual"))
         
         return True, None
@@ -170,7 +292,10 @@ class AppointmentState(ConversationState):
             return False, mensaje_validacion
         
         # Intentar agendar cita
-        success, message = self.conversation_service.schedule_appointment(fecha, hora, telefono)
+        clave = request_data.get('idempotency_key')
+        success, message = self.conversation_service.schedule_appointment(
+            fecha, hora, telefono, clave if valid_idempotency_key(clave) else None
+        )
         
         if success:
             session["estado"] = "fin"
@@ -273,6 +398,36 @@ class ConversationService:
             conversacion_data.setdefault("interacciones", []).append(interaccion)
             session["conversacion_data"] = conversacion_data
     
+    def _build_context(self, user_input: str) -> str:
+        """
+        Resumen + últimos mensajes de la sesión (sin el mensaje actual).
+        La apertura (sin mensaje del usuario) va sin contexto para que sea cacheable.
+        """
+        if not user_input:
+            return ""
+        interacciones = list(session.get("conversacion_data", {}).get("interacciones", []))
+        if interacciones and interacciones[-1].get("tipo") == "user" \
+                and interacciones[-1].get("mensaje") == user_input:
+            interacciones.pop()
+        if not interacciones:
+            return ""
+        conversacion_id = session.setdefault("conversacion_id", uuid.uuid4().hex)
+        try:
+            return _get_context_builder(self.ai_service).build(conversacion_id, interacciones)
+        except Exception as e:
+            logger.warning(f"No se pudo construir el contexto de conversación: {e}")
+            return ""
+
+    def _build_prompt(self, sintoma: Optional[str], user_input: str) -> str:
+        """Construye el prompt enviado al servicio de IA (con contexto acotado)."""
+        contexto = self._build_context(user_input)
+        return (
+            f"El usuario está experimentando: {sintoma}.\n"
+            + (f"{contexto}\n" if contexto else "")
+            + f'Último mensaje del usuario: "{user_input}"\n\n'
+            "Responde de manera empática, profesional y estructurada."
+        )
+
     def get_conversation_response(self, user_input: str) -> str:
         """Obtiene una respuesta del sistema conversacional usando Groq API"""
         if detectar_crisis(user_input):
@@ -280,20 +435,101 @@ class ConversationService:
 
         sintoma = session.get("sintoma_actual")
 
+        if not user_input:
+            apertura = opening_pool.pick(sintoma)
+            if apertura:
+                return apertura
+
         try:
             if self.ai_service:
-                prompt = (
-                    f"El usuario está experimentando: {sintoma}.\n"
-                    f'Último mensaje del usuario: "{user_input}"\n\n'
-                    "Responde de manera empática, profesional y estructurada."
-                )
-                response = self.ai_service.generate_response(prompt, sintoma)
+                prompt = self._build_prompt(sintoma, user_input)
+                # Acotado por el ejecutor de LLM: si está saturado se responde "ocupado"
+                # en lugar de retener otro hilo web durante la llamada a Groq
+                response = get_llm_executor().run(self.ai_service.generate_response, prompt, sintoma, user_input)
                 logger.debug("Respuesta Groq recibida correctamente")
                 return response
+        except ExecutorBusy as e:
+            logger.warning(f"⏳ Ejecutor de LLM saturado, respuesta de ocupado: {e}")
+            return RESPUESTA_OCUPADO
         except Exception as e:
             logger.error(f"Error usando Groq: {e}")
 
-        return "Entiendo que estás pasando por un momento difícil. ¿Te gustaría contarme más sobre cómo te sientes?"
+        return _RESPUESTA_POR_DEFECTO
+
+    def start_streaming_response(
+        self, user_input: str
+    ) -> Tuple[bool, Optional[str], Optional[Iterator[Tuple[str, str]]]]:
+        """
+        Registra el mensaje del usuario y prepara la respuesta en streaming.
+        Retorna (success, error_message, eventos); eventos es un generador de
+        tuplas ("token", fragmento) que termina con ("done", respuesta_final).
+        Lanza ExecutorBusy (sin registrar el mensaje) si el ejecutor de LLM está saturado.
+        """
+        if session.get("estado") not in ("profundizacion", "derivacion"):
+            return False, "Estado de conversación no válido", None
+
+        user_input = (user_input or "").strip()[:_MAX_USER_INPUT]
+        if not user_input:
+            return False, "Mensaje vacío", None
+
+        self.resolve_pending_response()
+        sintoma = session.get("sintoma_actual")
+
+        if detectar_crisis(user_input):
+            self.add_user_interaction(user_input)
+            self.add_bot_interaction(CRISIS_RESPONSE, sintoma)
+            return True, None, iter([("token", CRISIS_RESPONSE), ("done", CRISIS_RESPONSE)])
+
+        # El contexto excluye el mensaje actual, así que el prompt puede construirse
+        # antes de registrarlo; la capacidad se reserva antes de tocar el historial
+        prompt = self._build_prompt(sintoma, user_input)
+        stream = get_llm_executor().stream(lambda: self.ai_service.stream_response(prompt, sintoma, user_input))
+
+        self.add_user_interaction(user_input)
+        pendiente_id = uuid.uuid4().hex
+        session["respuesta_pendiente"] = {"id": pendiente_id, "user_input": user_input}
+        return True, None, self._stream_events(pendiente_id, stream)
+
+    def _stream_events(self, pendiente_id: str,
+                       stream: Iterator[str]) -> Iterator[Tuple[str, str]]:
+        """
+        Reemite los fragmentos del servicio de IA y guarda el texto final al terminar.
+        Si el cliente corta el stream se guarda lo que alcanzó a recibir.
+        """
+        partes = []
+        respuesta = None
+        try:
+            while True:
+                try:
+                    fragmento = next(stream)
+                except StopIteration as fin:
+                    respuesta = fin.value
+                    break
+                partes.append(fragmento)
+                yield "token", fragmento
+        except Exception as e:
+            logger.error(f"Error en streaming de respuesta: {e}")
+        finally:
+            stream.close()
+            respuesta = respuesta or "".join(partes).strip() or _RESPUESTA_POR_DEFECTO
+            _guardar_respuesta_stream(pendiente_id, respuesta)
+
+        yield "done", respuesta
+
+    def resolve_pending_response(self) -> None:
+        """
+        Incorpora al historial la respuesta de un stream anterior.
+        Si el texto ya no está (caducó, o el stream se atendió en otro worker sin
+        Redis) el turno queda sin respuesta en el historial: no se regenera.
+        """
+        pendiente = session.pop("respuesta_pendiente", None)
+        if not pendiente:
+            return
+        respuesta = _tomar_respuesta_stream(pendiente.get("id", ""))
+        if respuesta is None:
+            logger.warning("Respuesta en streaming no disponible; el turno queda sin respuesta en el historial")
+            return
+        self.add_bot_interaction(respuesta, session.get("sintoma_actual"))
     
     def calculate_duration_days(self, fecha_str: str) -> int:
         """Calcula la duración en días desde una fecha"""
@@ -305,39 +541,25 @@ class ConversationService:
         except ValueError:
             return 0
     
-    def schedule_appointment(self, fecha: str, hora: str, telefono: str) -> Tuple[bool, str]:
-        """Agenda una cita: Calendar + email + persistencia en DB."""
+    def schedule_appointment(self, fecha: str, hora: str, telefono: str,
+                             idempotency_key: Optional[str] = None) -> Tuple[bool, str]:
+        """
+        Agenda una cita: reserva en DB; Calendar y el email los procesa un worker.
+        Un reenvío del formulario con la misma `idempotency_key` no vuelve a reservar.
+        """
         try:
             sintoma = session.get("sintoma_actual", "Consulta psicológica")
-            success, message, calendar_event_id = _agendar_cita_completa(
-                fecha, hora, telefono, sintoma
-            )
+            try:
+                success, message, appointment_id, _ = _agendar_cita_idempotente(
+                    idempotency_key, fecha, hora, telefono, sintoma
+                )
+            except (IdempotencyKeyReused, IdempotencyInProgress):
+                return False, "La reserva ya se está procesando. Recarga la página en unos segundos."
 
             if not success:
                 logger.error(f"Error al agendar cita: {message}")
                 return False, message
 
-            # Persistir en la base de datos
-            try:
-                from services.admin_service import find_or_create_patient
-                from models import Appointment as _Appointment
-                patient = find_or_create_patient(
-                    name="Paciente", phone=telefono, symptom=sintoma
-                )
-                scheduled_dt = datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M")
-                appt = _Appointment(
-                    patient_id=patient.id,
-                    scheduled_at=scheduled_dt,
-                    symptom=sintoma,
-                    status="pending",
-                    calendar_event_id=calendar_event_id,
-                )
-                _db.session.add(appt)
-                _db.session.commit()
-                logger.info(f"Cita guardada en DB: id={appt.id} {fecha} {hora}")
-            except Exception as db_err:
-                logger.warning(f"Cita creada en Calendar pero no en DB: {db_err}")
-
             self.add_bot_interaction(
                 f"✅ **Cita confirmada**\n\n"
                 f"📅 **Fecha:** {fecha}\n"
@@ -352,7 +574,7 @@ class ConversationService:
                 "Gracias por confiar en este espacio.",
                 None,
             )
-            logger.info(f"Cita agendada exitosamente: {fecha} {hora} para {telefono}")
+            logger.info(f"Cita agendada exitosamente: id={appointment_id} {fecha} {hora} para {telefono}")
             return True, "Cita agendada exitosamente"
 
         except Exception as e:
@@ -416,5 +638,7 @@ class ConversationService:
             "sintomas": SINTOMAS_DISPONIBLES,
             "conversacion": conversacion_obj,  # Objeto con atributo historial
             "sintoma_actual": session.get("sintoma_actual"),
-            "fechas_validas": session.get("fechas_validas", {})
+            "fechas_validas": session.get("fechas_validas", {}),
+            # Una clave por formulario renderizado; sus reenvíos la repiten
+            "idempotency_key": uuid.uuid4().hex,
         }
\ No newline at end of file
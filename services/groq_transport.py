@@ -0,0 +1,158 @@
+"""
+Transporte HTTP compartido para el cliente de Groq.
+
+El cliente por defecto de Groq abre conexiones bajo demanda: la primera llamada
+de cada worker paga DNS + TCP + TLS. Aquí se construye un `httpx.Client` con:
+
+- Límites de pool acordes a los hilos del proceso (turnos + respaldos de hedging).
+- Keep-alive configurable, para reutilizar conexiones entre turnos.
+- HTTP/2 si el paquete `h2` está instalado (varias llamadas por una conexión).
+- Contadores de conexiones nuevas vs. reutilizadas (vía la extensión `trace`
+  de httpcore) y un ping de calentamiento opcional al arrancar el worker.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, NamedTuple, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() not in ("0", "false", "no")
+
+
+class TransportConfig(NamedTuple):
+    max_connections: int = 10
+    max_keepalive: int = 10
+    keepalive_expiry: float = 120.0
+    http2: bool = True
+    warmup: bool = True
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        """GROQ_POOL_MAX_CONNECTIONS, GROQ_POOL_KEEPALIVE, GROQ_KEEPALIVE_EXPIRY, GROQ_HTTP2, GROQ_WARMUP."""
+        default = cls()
+        try:
+            return cls(
+                max_connections=int(os.getenv("GROQ_POOL_MAX_CONNECTIONS", default.max_connections)),
+                max_keepalive=int(os.getenv("GROQ_POOL_KEEPALIVE", default.max_keepalive)),
+                keepalive_expiry=float(os.getenv("GROQ_KEEPALIVE_EXPIRY", default.keepalive_expiry)),
+                http2=_env_bool("GROQ_HTTP2", default.http2),
+                warmup=_env_bool("GROQ_WARMUP", default.warmup),
+            )
+        except ValueError as e:
+            logger.warning(f"Configuración del pool HTTP de Groq inválida, usando valores por defecto: {e}")
+            return default
+
+
+class TransportStats:
+    """Contadores de uso del pool (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "new_connections": 0, "reused_connections": 0, "errors": 0}
+        self._connect_seconds = 0.0
+        self._http_versions: Counter = Counter()
+        self.warmup: Optional[Dict[str, Any]] = None
+
+    def record(self, new_connection: bool, connect_seconds: float, http_version: Optional[str]) -> None:
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["new_connections" if new_connection else "reused_connections"] += 1
+            self._connect_seconds += connect_seconds
+            if http_version:
+                self._http_versions[http_version] += 1
+
+    def record_error(self) -> None:
+        with self._lock:
+            self._counters["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            new = counters["new_connections"]
+            requests = counters["requests"]
+            return {
+                **counters,
+                "reuse_ratio": round(counters["reused_connections"] / requests, 3) if requests else 0.0,
+                "avg_connect_ms": round(self._connect_seconds / new * 1000, 1) if new else 0.0,
+                "http_versions": dict(self._http_versions),
+                "warmup": self.warmup,
+            }
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTPTransport que distingue conexiones nuevas de reutilizadas en cada request."""
+
+    def __init__(self, stats: TransportStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        previous_trace = request.extensions.get("trace")
+        connect = {"new": False, "started": None, "seconds": 0.0}
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # Solo las conexiones nuevas emiten eventos connect_tcp / start_tls
+            if event_name == "connection.connect_tcp.started":
+                connect["new"] = True
+                connect["started"] = time.monotonic()
+            elif event_name in ("connection.start_tls.complete", "connection.connect_tcp.complete") \
+                    and connect["started"] is not None:
+                connect["seconds"] = time.monotonic() - connect["started"]
+            if previous_trace is not None:
+                previous_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.stats.record_error()
+            raise
+        self.stats.record(connect["new"], connect["seconds"], response.extensions.get("http_version", b"").decode() or None)
+        return response
+
+
+def build_http_client(config: Optional[TransportConfig] = None, timeout: float = 25.0,
+                      stats: Optional[TransportStats] = None) -> httpx.Client:
+    """Cliente httpx con pool, keep-alive y HTTP/2 (si hay `h2`) para pasar a Groq(http_client=...)."""
+    config = config or TransportConfig.from_env()
+    http2 = config.http2 and HTTP2_AVAILABLE
+    if config.http2 and not HTTP2_AVAILABLE:
+        logger.info("Paquete h2 no instalado: cliente de Groq en HTTP/1.1")
+    limits = httpx.Limits(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    transport = InstrumentedTransport(stats or TransportStats(), limits=limits, http2=http2)
+    return httpx.Client(transport=transport, timeout=timeout, follow_redirects=True)
+
+
+def transport_stats(client: httpx.Client) -> Optional[TransportStats]:
+    transport = getattr(client, "_transport", None)
+    return transport.stats if isinstance(transport, InstrumentedTransport) else None
+
+
+_transports: Dict[str, TransportStats] = {}
+
+
+def register_transport(name: str, stats: TransportStats) -> TransportStats:
+    _transports[name] = stats
+    return stats
+
+
+def get_transport_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: stats.snapshot() for name, stats in _transports.items()}
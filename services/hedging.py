@@ -0,0 +1,154 @@
+"""
+Generación con presupuesto de latencia y "hedging" para llamadas a Groq.
+
+- La llamada principal corre en un pool de hilos para que el hilo del request
+  pueda esperar con límite de tiempo.
+- Si no responde dentro de `hedge_after` (presupuesto p95), se lanza en paralelo
+  la llamada de respaldo (modelo rápido) y gana la primera que termine bien.
+- Al vencer `deadline` se devuelve el control sin respuesta; el llamador usa
+  su respuesta de fallback. Las llamadas en curso terminan por el timeout del
+  cliente de Groq, que se configura igual al plazo duro.
+
+Cada resultado se registra (ganador y latencia) para ajustar los presupuestos.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ("primary", "hedge", "deadline", "error")
+
+
+class HedgePolicy(NamedTuple):
+    """Presupuestos de latencia (segundos) para una generación."""
+    hedge_after: float = 8.0
+    deadline: float = 25.0
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        """Lee AI_HEDGE_AFTER_SECONDS y AI_DEADLINE_SECONDS (con valores por defecto)."""
+        default = cls()
+        try:
+            hedge_after = float(os.getenv("AI_HEDGE_AFTER_SECONDS", default.hedge_after))
+            deadline = float(os.getenv("AI_DEADLINE_SECONDS", default.deadline))
+        except ValueError:
+            logger.warning("Presupuestos de latencia de IA inválidos, usando valores por defecto")
+            return default
+        return cls(hedge_after=min(hedge_after, deadline), deadline=deadline)
+
+
+class HedgeResult(NamedTuple):
+    value: Optional[Any]
+    outcome: str
+    elapsed: float
+
+
+class HedgeStats:
+    """Contadores por resultado y ventana de latencias para ajustar el presupuesto p95."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._outcomes = {name: 0 for name in OUTCOMES}
+        self._hedges_launched = 0
+        self._latencies = deque(maxlen=window)
+        self._primary_latencies = deque(maxlen=window)
+
+    def record(self, result: HedgeResult, hedged: bool) -> None:
+        with self._lock:
+            self._outcomes[result.outcome] += 1
+            self._hedges_launched += int(hedged)
+            self._latencies.append(result.elapsed)
+            if result.outcome == "primary":
+                self._primary_latencies.append(result.elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+            primary = list(self._primary_latencies)
+            outcomes = dict(self._outcomes)
+            hedges = self._hedges_launched
+        return {
+            "outcomes": outcomes,
+            "hedges_launched": hedges,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            # p95 observado del modelo principal: referencia para AI_HEDGE_AFTER_SECONDS
+            "primary_latency_p95": percentile(primary, 95),
+        }
+
+
+class HedgedExecutor:
+    """Ejecuta una llamada principal con respaldo diferido y plazo duro."""
+
+    def __init__(self, policy: Optional[HedgePolicy] = None, max_workers: int = 8):
+        self.policy = policy or HedgePolicy.from_env()
+        self.stats = HedgeStats()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-hedge")
+
+    def run(self, primary: Callable[[], Any], hedge: Optional[Callable[[], Any]] = None) -> HedgeResult:
+        """
+        Retorna HedgeResult(valor, resultado, segundos). `valor` es None cuando
+        vence el plazo duro o fallan todas las llamadas.
+        """
+        start = time.monotonic()
+        deadline = start + self.policy.deadline
+        pending = {self._pool.submit(primary): "primary"}
+        hedged = False
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait_until = deadline
+            if hedge is not None and not hedged:
+                wait_until = min(deadline, start + self.policy.hedge_after)
+            done, _ = wait(pending, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                label = pending.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"⚠️ Llamada {label} a Groq falló: {e}")
+                    continue
+                return self._finish(HedgeResult(value, label, time.monotonic() - start), hedged)
+
+            # Sin ganador al agotar el presupuesto p95 (o si la principal falló): lanzar respaldo
+            if hedge is not None and not hedged and (not pending or time.monotonic() >= start + self.policy.hedge_after):
+                hedged = True
+                logger.info(f"🏁 Presupuesto de {self.policy.hedge_after}s agotado, lanzando modelo de respaldo")
+                pending[self._pool.submit(hedge)] = "hedge"
+
+        outcome = "deadline" if pending else "error"
+        if outcome == "deadline":
+            logger.warning(f"⏰ Plazo duro de {self.policy.deadline}s vencido sin respuesta de Groq")
+        else:
+            logger.error(f"❌ Todas las llamadas a Groq fallaron: {last_error}")
+        return self._finish(HedgeResult(None, outcome, time.monotonic() - start), hedged)
+
+    def _finish(self, result: HedgeResult, hedged: bool) -> HedgeResult:
+        self.stats.record(result, hedged)
+        return result
+
+
+_stats_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_hedging(name: str, executor: HedgedExecutor) -> HedgedExecutor:
+    """Registra un ejecutor para exponer sus estadísticas en get_hedging_stats()."""
+    _stats_providers[name] = lambda: {"policy": executor.policy._asdict(), **executor.stats.snapshot()}
+    return executor
+
+
+def get_hedging_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: provider() for name, provider in _stats_providers.items()}
@@ -0,0 +1,249 @@
+"""
+Claves de idempotencia para las operaciones que no deben repetirse (reservas).
+
+El cliente manda una clave por intento lógico (header `Idempotency-Key` o campo
+`idempotency_key`) y la reutiliza en sus reintentos. `IdempotencyStore.execute()`:
+
+- Primera vez: reclama la clave (marca "pendiente" con TTL corto), ejecuta la
+  operación y guarda su resultado durante `ttl` segundos.
+- Repetición: devuelve el resultado guardado sin ejecutar nada.
+- Repetición mientras el original sigue en curso (doble clic): espera hasta
+  `wait_timeout` a que termine y devuelve su resultado.
+- Misma clave con otros datos: IdempotencyKeyReused (el cliente reutilizó la clave).
+
+Con REDIS_URL la clave se comparte entre workers (`SET NX`); sin Redis, o si
+falla, cada worker guarda sus claves en memoria.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .shared_redis import shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{8,100}$")
+_PENDING = "pending"
+
+
+class IdempotencyKeyReused(Exception):
+    """La clave ya se usó con una petición distinta."""
+
+
+class IdempotencyInProgress(Exception):
+    """La petición original con esta clave sigue en curso tras la espera."""
+
+
+def valid_idempotency_key(key: Optional[str]) -> bool:
+    return bool(key) and bool(_KEY_PATTERN.match(key))
+
+
+def request_fingerprint(data: Dict[str, Any]) -> str:
+    """Huella de los datos de la petición, para detectar claves reutilizadas."""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LocalIdempotencyBackend:
+    """Registros en memoria del worker, con caducidad."""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float) -> None:
+        for key in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+    def claim(self, key: str, record: str, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = (record, now + ttl)
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: str, record: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (record, time.monotonic() + ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge(time.monotonic())
+            return len(self._entries)
+
+
+class RedisIdempotencyBackend:
+    """
+    Registros compartidos en Redis. Ante un error de Redis se desactiva durante
+    `retry_after` segundos y se usa el respaldo en memoria.
+    """
+
+    def __init__(self, client, fallback: LocalIdempotencyBackend,
+                 prefix: str = "equilibra:idem:", retry_after: int = 30):
+        self.client = client
+        self.fallback = fallback
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+
+    def _available(self) -> bool:
+        return time.time() >= self._disabled_until
+
+    def _fail(self, operation: str, error: Exception) -> None:
+        self._disabled_until = time.time() + self.retry_after
+        logger.warning(f"Claves de idempotencia en Redis no disponibles en {operation}: {error}")
+
+    def claim(self, key: str, record: str, ttl: float) -> bool:
+        if self._available():
+            try:
+                return bool(self.client.set(self.prefix + key, record, nx=True, px=int(ttl * 1000)))
+            except Exception as e:
+                self._fail("claim", e)
+        return self.fallback.claim(key, record, ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        if self._available():
+            try:
+                raw = self.client.get(self.prefix + key)
+                return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+            except Exception as e:
+                self._fail("get", e)
+        return self.fallback.get(key)
+
+    def set(self, key: str, record: str, ttl: float) -> None:
+        if self._available():
+            try:
+                self.client.set(self.prefix + key, record, px=int(ttl * 1000))
+                return
+            except Exception as e:
+                self._fail("set", e)
+        self.fallback.set(key, record, ttl)
+
+    def delete(self, key: str) -> None:
+        self.fallback.delete(key)
+        if self._available():
+            try:
+                self.client.delete(self.prefix + key)
+            except Exception as e:
+                self._fail("delete", e)
+
+
+class IdempotencyStore:
+    """
+    Resultados de operaciones por clave de idempotencia.
+
+    `execute(key, fingerprint, fn, should_store)` retorna (resultado, repetido).
+    El resultado debe ser serializable a JSON. Si `fn` lanza una excepción o
+    `should_store(resultado)` es falso, la clave se libera y un reintento vuelve
+    a ejecutar la operación.
+    """
+
+    def __init__(self, name: str, backend=None, ttl: float = 86400, pending_ttl: float = 60,
+                 wait_timeout: float = 10.0, poll_interval: float = 0.1):
+        self.name = name
+        self.backend = backend or LocalIdempotencyBackend()
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._counters = {"executed": 0, "stored": 0, "replayed": 0, "waited": 0,
+                          "reused": 0, "in_progress": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _stored_result(self, key: str, fingerprint: str, record: Optional[str]) -> Tuple[bool, Any]:
+        """(terminado, resultado) del registro; lanza IdempotencyKeyReused si la huella no coincide."""
+        if record is None:
+            return False, None
+        state, _, payload = record.partition(":")
+        if state == _PENDING:
+            if payload != fingerprint:
+                self._count("reused")
+                raise IdempotencyKeyReused(key)
+            return False, None
+        stored = json.loads(record)
+        if stored["fingerprint"] != fingerprint:
+            self._count("reused")
+            raise IdempotencyKeyReused(key)
+        return True, stored["result"]
+
+    def _await(self, key: str, fingerprint: str) -> Tuple[bool, Any]:
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            record = self.backend.get(key)
+            if record is None:
+                # El original falló y liberó la clave
+                return False, None
+            done, result = self._stored_result(key, fingerprint, record)
+            if done:
+                return True, result
+        self._count("in_progress")
+        raise IdempotencyInProgress(key)
+
+    def execute(self, key: str, fingerprint: str, fn: Callable[[], Any],
+                should_store: Callable[[Any], bool] = lambda result: True) -> Tuple[Any, bool]:
+        for _ in range(2):
+            if self.backend.claim(key, f"{_PENDING}:{fingerprint}", self.pending_ttl):
+                break
+            done, result = self._stored_result(key, fingerprint, self.backend.get(key))
+            if not done:
+                self._count("waited")
+                done, result = self._await(key, fingerprint)
+            if done:
+                self._count("replayed")
+                logger.info(f"🔁 Petición repetida en {self.name} ({key[:12]}...): se devuelve el resultado guardado")
+                return result, True
+        else:
+            # El original liberó la clave y otra petición la volvió a reclamar
+            self._count("in_progress")
+            raise IdempotencyInProgress(key)
+
+        self._count("executed")
+        try:
+            result = fn()
+        except BaseException:
+            self.backend.delete(key)
+            raise
+        if should_store(result):
+            self.backend.set(key, json.dumps({"fingerprint": fingerprint, "result": result}), self.ttl)
+            self._count("stored")
+        else:
+            self.backend.delete(key)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        shared = isinstance(self.backend, RedisIdempotencyBackend)
+        local = self.backend.fallback if shared else self.backend
+        return {"shared": shared, "ttl_seconds": self.ttl, "local_keys": len(local), **counters}
+
+
+def create_idempotency_store(name: str, ttl: float = 86400) -> IdempotencyStore:
+    """IdempotencyStore para `name`, compartido entre workers si hay Redis."""
+    local = LocalIdempotencyBackend()
+    client = shared_redis_client(f"las claves de idempotencia de {name}")
+    backend = RedisIdempotencyBackend(client, local, prefix=f"equilibra:idem:{name}:") if client else local
+    return IdempotencyStore(name, backend=backend, ttl=ttl)
@@ -0,0 +1,193 @@
+"""
+Ejecutor acotado para la generación con LLM.
+
+Con gunicorn `--threads` cada turno de chat retiene un hilo web durante toda la
+llamada a Groq. Este ejecutor limita cuántos turnos pueden estar generando (o
+esperando) a la vez en cada proceso, de modo que siempre queden hilos libres
+para el panel, /health y la agenda:
+
+- `max_workers` generaciones simultáneas y `max_queue` en espera.
+- Si no hay hueco, `submit`/`stream` lanzan ExecutorBusy de inmediato y la
+  ruta responde con un mensaje de "ocupado" en lugar de encolar sin límite.
+- Métricas de saturación (en uso, pico, rechazos, espera en cola y duración)
+  para planificar capacidad.
+"""
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class ExecutorBusy(RuntimeError):
+    """No hay capacidad en el ejecutor de LLM: la solicitud se rechaza sin esperar."""
+
+
+class LLMExecutor:
+    """Pool de hilos con capacidad total acotada (en ejecución + en cola)."""
+
+    def __init__(self, name: str = "llm", max_workers: int = 2, max_queue: int = 1):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.capacity = max_workers + max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-exec")
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._running = 0
+        self._peak = 0
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._queue_waits = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+
+    @classmethod
+    def from_env(cls, name: str = "llm") -> "LLMExecutor":
+        """LLM_EXECUTOR_WORKERS y LLM_EXECUTOR_QUEUE (por proceso)."""
+        try:
+            workers = max(1, int(os.getenv("LLM_EXECUTOR_WORKERS", 2)))
+            max_queue = max(0, int(os.getenv("LLM_EXECUTOR_QUEUE", 1)))
+        except ValueError:
+            logger.warning("LLM_EXECUTOR_WORKERS/LLM_EXECUTOR_QUEUE inválidos, usando valores por defecto")
+            workers, max_queue = 2, 1
+        return cls(name, max_workers=workers, max_queue=max_queue)
+
+    def _reserve(self) -> None:
+        with self._lock:
+            if self._in_use >= self.capacity:
+                self._counters["rejected"] += 1
+                raise ExecutorBusy(f"{self.name}: {self._in_use}/{self.capacity} en uso")
+            self._in_use += 1
+            self._counters["submitted"] += 1
+            self._peak = max(self._peak, self._in_use)
+
+    def _release(self, future: Future) -> None:
+        with self._lock:
+            self._in_use -= 1
+            self._counters["failed" if future.exception() else "completed"] += 1
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Encola `fn` si hay capacidad; si no, lanza ExecutorBusy sin esperar."""
+        self._reserve()
+        submitted_at = time.monotonic()
+        context = contextvars.copy_context()
+
+        def task():
+            started = time.monotonic()
+            with self._lock:
+                self._running += 1
+                self._queue_waits.append(started - submitted_at)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._run_times.append(time.monotonic() - started)
+
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Ejecuta `fn` en el pool y espera su resultado (ExecutorBusy si no hay capacidad)."""
+        return self.submit(fn, *args, **kwargs).result(timeout=timeout)
+
+    def stream(self, generator_factory: Callable[[], Iterator[Any]],
+               item_timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Consume en el pool el generador creado por `generator_factory` y reemite sus
+        elementos en el hilo llamador; el valor de retorno del generador se conserva.
+        La capacidad se reserva al llamar (ExecutorBusy inmediato si no hay hueco).
+        Cerrar el iterador devuelto detiene el generador en el pool.
+        """
+        items: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            generator = generator_factory()
+            try:
+                while not cancelled.is_set():
+                    try:
+                        items.put(("item", next(generator)))
+                    except StopIteration as stop:
+                        items.put((_DONE, stop.value))
+                        return
+            except Exception as e:
+                items.put(("error", e))
+            finally:
+                generator.close()
+
+        self.submit(produce)
+        return self._drain(items, cancelled, item_timeout)
+
+    @staticmethod
+    def _drain(items: "queue.Queue", cancelled: threading.Event,
+               item_timeout: Optional[float]) -> Iterator[Any]:
+        try:
+            while True:
+                kind, value = items.get(timeout=item_timeout)
+                if kind is _DONE:
+                    return value
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            cancelled.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_use, running, peak = self._in_use, self._running, self._peak
+            counters = dict(self._counters)
+            queue_waits = list(self._queue_waits)
+            run_times = list(self._run_times)
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": max(0, in_use - running),
+            "saturation": round(in_use / self.capacity, 3),
+            "peak_in_use": peak,
+            **counters,
+            "queue_wait_p95": percentile(queue_waits, 95),
+            "run_time_p50": percentile(run_times, 50),
+            "run_time_p95": percentile(run_times, 95),
+        }
+
+
+_executors: Dict[str, LLMExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def register_executor(name: str, executor: LLMExecutor) -> LLMExecutor:
+    _executors[name] = executor
+    return executor
+
+
+def get_llm_executor(name: str = "llm") -> LLMExecutor:
+    """Ejecutor de LLM compartido por el proceso (configurado desde el entorno)."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = register_executor(name, LLMExecutor.from_env(name))
+    return executor
+
+
+def get_executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: executor.stats() for name, executor in _executors.items()}
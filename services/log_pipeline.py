@@ -0,0 +1,219 @@
+"""
+Pipeline de logging asíncrono.
+
+Los hilos de request solo encolan el LogRecord (QueueHandler); un hilo
+QueueListener por proceso se encarga del formateo y de la escritura en stdout
+y en archivo. Además:
+
+- Registros JSON de una línea (LOG_FORMAT=json) con los campos `extra`.
+- Formateo perezoso: el mensaje (`msg % args`) se construye en el listener,
+  no en el hilo que llama.
+- Nivel global (LOG_LEVEL) y por módulo (LOG_LEVELS="services.ai_service=DEBUG,...").
+- Muestreo de las líneas DEBUG más ruidosas: 1 de cada LOG_DEBUG_SAMPLE_EVERY
+  por punto de llamada.
+- Rotación segura con varios workers de gunicorn escribiendo el mismo archivo:
+  bloqueo entre procesos (flock) y reapertura si otro proceso ya rotó.
+- Si la cola se llena, se descartan registros en lugar de bloquear el request.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Atributos estándar de LogRecord: el resto son campos `extra` del registro
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar 1 de cada `every` registros DEBUG por punto de llamada; el resto, siempre."""
+
+    def __init__(self, every: int = 10):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._seen.get(site, 0)
+            self._seen[site] = count + 1
+            if count % self.every == 0:
+                return True
+            self.sampled_out += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Encola el registro sin formatearlo (la cola es en proceso, no hay que serializar)
+    y lo descarta si la cola está llena en lugar de bloquear al llamador.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ProcessSafeRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler para varios procesos sobre el mismo archivo: cada escritura
+    (y la rotación) ocurre bajo un flock, y si otro proceso ya rotó el archivo se
+    reabre antes de escribir. Solo se usa desde el hilo del QueueListener.
+    """
+
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_file = open(f"{self.baseFilename}.lock", "a") if fcntl else None
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._lock_file is None:
+            return super().emit(record)
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def parse_level(level: str) -> Optional[int]:
+    """'debug' -> logging.DEBUG; None si no es un nivel válido."""
+    value = logging.getLevelName((level or "").strip().upper())
+    return value if isinstance(value, int) else None
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """'services.ai_service=DEBUG,googleapiclient=WARNING' -> {nombre: nivel}; ignora entradas inválidas."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, level = item.partition("=")
+        value = parse_level(level)
+        if name.strip() and value is not None:
+            levels[name.strip()] = value
+    return levels
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_sampler: Optional[SamplingFilter] = None
+_log_queue: Optional[queue.Queue] = None
+
+
+def setup_logging(log_file: Optional[str] = "logs/app.log") -> QueueListener:
+    """
+    Configura el logger raíz con la cola y arranca el listener (una vez por proceso).
+    Entorno: LOG_LEVEL, LOG_LEVELS, LOG_FORMAT (json|text), LOG_FILE (vacío = solo stdout),
+    LOG_DEBUG_SAMPLE_EVERY, LOG_QUEUE_SIZE.
+    """
+    global _listener, _queue_handler, _sampler, _log_queue
+    if _listener is not None:
+        return _listener
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = os.getenv("LOG_FILE", log_file)
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handlers.append(ProcessSafeRotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    _queue_handler = NonBlockingQueueHandler(_log_queue)
+    _sampler = SamplingFilter(int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", 10)))
+    _queue_handler.addFilter(_sampler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if not type(handler).__module__.startswith("_pytest"):
+            root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root_level = parse_level(os.getenv("LOG_LEVEL", "INFO"))
+    root.setLevel(logging.INFO if root_level is None else root_level)
+    for name, level in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    if root_level is None:
+        logging.getLogger(__name__).warning(f"LOG_LEVEL inválido: {os.getenv('LOG_LEVEL')!r}, usando INFO")
+    return _listener
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    if _listener is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queue_size": _log_queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": _sampler.sampled_out,
+        "root_level": logging.getLevelName(logging.getLogger().level),
+    }
@@ -0,0 +1,14 @@
+"""
+Utilidades comunes para las métricas en memoria (ventanas de latencia y
+tiempos de espera) que exponen el ejecutor de LLM, el hedging y el enrutador.
+"""
+
+from typing import Iterable, Optional
+
+
+def percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    """Percentil `pct` (0-100) por rango más cercano, redondeado a milisegundos; None si no hay datos."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 3)
@@ -0,0 +1,209 @@
+"""
+Enrutador de modelos de Groq según latencia y carga observadas.
+
+Sustituye la elección estática por longitud/complejidad de `select_model`:
+
+- Cada modelo lleva un registro móvil (últimas N llamadas dentro de una ventana
+  de tiempo) de latencia, errores, respuestas 429 y tokens/segundo de `usage`.
+- Cada clase de complejidad tiene una lista de modelos admitidos, del más barato
+  al más caro, y un SLO de latencia p95. Se elige el más barato que lo cumple.
+- Un modelo que recibió un 429 queda en enfriamiento durante `cooldown` segundos.
+- Las crisis van siempre al modelo de mayor calidad.
+
+Las decisiones recientes y las estadísticas que las justifican se exponen con
+`snapshot()` (ruta /debug-ai).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Clases de complejidad -> niveles admitidos (de más barato a más caro)
+ROUTES: Dict[str, List[str]] = {
+    "normal": ["fast", "balanced", "high_quality"],
+    "complejo": ["balanced", "high_quality"],
+    "crisis": ["high_quality"],
+}
+
+DEFAULT_SLO_SECONDS = {"normal": 4.0, "complejo": 8.0, "crisis": 20.0}
+
+
+class _Sample(NamedTuple):
+    at: float
+    latency: Optional[float]
+    ok: bool
+    rate_limited: bool
+    tokens_per_second: Optional[float]
+
+
+class RouteDecision(NamedTuple):
+    model: str
+    tier: str
+    route: str
+    reason: str
+
+
+def _usage_field(usage: Any, name: str) -> Any:
+    if isinstance(usage, dict):
+        return usage.get(name)
+    return getattr(usage, name, None)
+
+
+class ModelStats:
+    """Registro móvil de un modelo: últimas `max_samples` llamadas dentro de `window` segundos."""
+
+    def __init__(self, max_samples: int = 50, window: float = 600.0):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)
+        self._last_rate_limited = 0.0
+
+    def add(self, sample: _Sample) -> None:
+        self._samples.append(sample)
+        if sample.rate_limited:
+            self._last_rate_limited = sample.at
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        recent = [s for s in self._samples if now - s.at <= self.window]
+        latencies = [s.latency for s in recent if s.ok and s.latency is not None]
+        throughput = [s.tokens_per_second for s in recent if s.tokens_per_second]
+        errors = sum(1 for s in recent if not s.ok)
+        return {
+            "samples": len(recent),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "error_rate": round(errors / len(recent), 3) if recent else 0.0,
+            "rate_limited": sum(1 for s in recent if s.rate_limited),
+            "tokens_per_second": round(sum(throughput) / len(throughput), 1) if throughput else None,
+            "seconds_since_429": round(now - self._last_rate_limited, 1) if self._last_rate_limited else None,
+        }
+
+
+class ModelRouter:
+    """Elige el modelo más barato que cumple el SLO de la clase de complejidad."""
+
+    def __init__(self, models: Dict[str, str], slo_seconds: Optional[Dict[str, float]] = None,
+                 max_error_rate: float = 0.2, cooldown: float = 30.0, min_samples: int = 5,
+                 history: int = 50):
+        self.models = models
+        self.slo_seconds = {**DEFAULT_SLO_SECONDS, **(slo_seconds or {})}
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self._stats: Dict[str, ModelStats] = {model: ModelStats() for model in models.values()}
+        self._decisions = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, models: Dict[str, str]) -> "ModelRouter":
+        """SLO por clase desde AI_SLO_<CLASE>_SECONDS (p. ej. AI_SLO_NORMAL_SECONDS=4)."""
+        slo = {}
+        for route in ROUTES:
+            value = os.getenv(f"AI_SLO_{route.upper()}_SECONDS")
+            if value:
+                try:
+                    slo[route] = float(value)
+                except ValueError:
+                    logger.warning(f"AI_SLO_{route.upper()}_SECONDS inválido: {value}")
+        return cls(models, slo_seconds=slo)
+
+    @staticmethod
+    def classify(text_length: int, complexity: str) -> str:
+        """`text_length` es la longitud del mensaje del usuario, no del prompt con plantilla y contexto."""
+        if complexity == "crisis":
+            return "crisis"
+        if complexity == "complejo" or text_length > 100:
+            return "complejo"
+        return "normal"
+
+    def record(self, model: str, latency: Optional[float], ok: bool = True,
+               rate_limited: bool = False, usage: Any = None) -> None:
+        """
+        Registra el resultado de una llamada (latencia en segundos, `usage` de Groq si lo hay:
+        objeto en las respuestas completas, dict en x_groq del streaming).
+        """
+        tokens_per_second = None
+        completion_tokens = _usage_field(usage, "completion_tokens")
+        if ok and completion_tokens:
+            seconds = _usage_field(usage, "completion_time") or latency
+            if seconds:
+                tokens_per_second = completion_tokens / seconds
+        sample = _Sample(time.time(), latency, ok, rate_limited, tokens_per_second)
+        with self._lock:
+            self._stats.setdefault(model, ModelStats()).add(sample)
+
+    def _rejection(self, route: str, summary: Dict[str, Any]) -> Optional[str]:
+        """Motivo por el que un modelo no sirve ahora para `route`, o None si sirve."""
+        since_429 = summary["seconds_since_429"]
+        if since_429 is not None and since_429 < self.cooldown:
+            return "429 reciente"
+        if summary["samples"] < self.min_samples:
+            return None  # sin datos suficientes: se le da tráfico para medirlo
+        if summary["error_rate"] > self.max_error_rate:
+            return f"error_rate {summary['error_rate']}"
+        p95 = summary["latency_p95"]
+        if p95 is not None and p95 > self.slo_seconds[route]:
+            return f"p95 {p95}s > SLO {self.slo_seconds[route]}s"
+        return None
+
+    def choose(self, text_length: int, complexity: str) -> RouteDecision:
+        route = self.classify(text_length, complexity)
+        tiers = ROUTES[route]
+        now = time.time()
+        with self._lock:
+            summaries = {tier: self._stats.setdefault(self.models[tier], ModelStats()).summary(now)
+                         for tier in tiers}
+
+        decision = None
+        rejected = []
+        if route == "crisis":
+            decision = RouteDecision(self.models["high_quality"], "high_quality", route, "crisis fijada a calidad")
+        else:
+            for tier in tiers:
+                reason = self._rejection(route, summaries[tier])
+                if reason is None:
+                    motivo = "cumple SLO" if not rejected else "cumple SLO; descartados: " + ", ".join(rejected)
+                    decision = RouteDecision(self.models[tier], tier, route, motivo)
+                    break
+                rejected.append(f"{tier} ({reason})")
+
+        if decision is None:
+            # Ninguno cumple: el de menor p95 que no esté en enfriamiento por 429
+            usable = [t for t in tiers if "429" not in (self._rejection(route, summaries[t]) or "")] or tiers
+            tier = min(usable, key=lambda t: summaries[t]["latency_p95"] or float("inf"))
+            decision = RouteDecision(self.models[tier], tier, route,
+                                     "ninguno cumple SLO; menor p95: " + ", ".join(rejected))
+
+        with self._lock:
+            self._decisions.append({"at": round(now, 3), **decision._asdict()})
+        return decision
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            models = {model: stats.summary(now) for model, stats in self._stats.items()}
+            decisions = list(self._decisions)
+        return {
+            "slo_seconds": dict(self.slo_seconds),
+            "routes": {route: [self.models[t] for t in tiers] for route, tiers in ROUTES.items()},
+            "models": models,
+            "recent_decisions": decisions[-20:],
+        }
+
+
+_routers: Dict[str, ModelRouter] = {}
+
+
+def register_router(name: str, router: ModelRouter) -> ModelRouter:
+    _routers[name] = router
+    return router
+
+
+def get_routing_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: router.snapshot() for name, router in _routers.items()}
@@ -0,0 +1,113 @@
+"""
+Pool de aperturas precalculadas por síntoma.
+
+En la etapa de evaluación el prompt depende solo del síntoma (uno de
+SINTOMAS_DISPONIBLES), así que cada primera respuesta es la misma llamada a Groq.
+Un calentamiento (al arrancar o programado en Celery) genera un pequeño pool
+rotativo de aperturas por síntoma; la evaluación responde eligiendo una al azar.
+
+- Al arrancar solo se rellenan los síntomas sin apertura (una llamada por síntoma).
+- En la ejecución programada (`rotate=True`) se añade una apertura nueva por
+  síntoma y se descarta la más antigua cuando el pool está lleno.
+- El pool vive en una caché de respuestas (compartida vía Redis si está
+  configurado), y con Redis solo un worker calienta a la vez.
+"""
+
+import json
+import logging
+import random
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .prompt_normalizer import scope_slug
+from .response_cache import create_response_cache, register_cache
+from .shared_redis import shared_redis_client
+from .single_flight import RedisFlightLock
+
+logger = logging.getLogger(__name__)
+
+
+class OpeningPool:
+    """Aperturas por síntoma: lista acotada (más reciente al final)."""
+
+    def __init__(self, size: int = 3, cache=None, ttl: int = 24 * 3600):
+        self.size = size
+        self.cache = cache or create_response_cache("symptom_openings", max_entries=64, ttl=ttl)
+        self._lock = threading.Lock()
+        self._counters = {"served": 0, "empty": 0, "added": 0}
+        register_cache(self.cache, openings=self.stats)
+
+    def get_all(self, sintoma: Optional[str]) -> List[str]:
+        raw = self.cache.get(scope_slug(sintoma))
+        if not raw:
+            return []
+        try:
+            openings = json.loads(raw)
+        except ValueError:
+            return []
+        return [o for o in openings if isinstance(o, str) and o]
+
+    def pick(self, sintoma: Optional[str]) -> Optional[str]:
+        """Una apertura al azar del pool, o None si aún no se ha calentado."""
+        openings = self.get_all(sintoma)
+        with self._lock:
+            self._counters["served" if openings else "empty"] += 1
+        return random.choice(openings) if openings else None
+
+    def add(self, sintoma: Optional[str], opening: str) -> int:
+        """Añade una apertura (rotando la más antigua). Retorna el tamaño del pool."""
+        openings = [o for o in self.get_all(sintoma) if o != opening]
+        openings.append(opening)
+        openings = openings[-self.size:]
+        self.cache.set(scope_slug(sintoma), json.dumps(openings, ensure_ascii=False))
+        with self._lock:
+            self._counters["added"] += 1
+        return len(openings)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": self.size, **self._counters}
+
+
+def warm_openings(pool: OpeningPool, sintomas: Iterable[str], generate: Callable[[str], Optional[str]],
+                  rotate: bool = False, max_consecutive_failures: int = 3) -> Dict[str, int]:
+    """
+    Genera aperturas con `generate(sintoma)` (que retorna None si no hay respuesta válida).
+    Sin `rotate` solo rellena síntomas vacíos. Se detiene si Groq falla varias veces seguidas.
+    """
+    result = {"generated": 0, "skipped": 0, "failed": 0}
+
+    client = shared_redis_client("el calentamiento de aperturas")
+    lock = RedisFlightLock(client, prefix="equilibra:warmup:", lock_ttl=900) if client else None
+    token = lock.try_acquire("symptom_openings") if lock else None
+    if lock and token is None:
+        logger.info("Otro worker ya está calentando las aperturas por síntoma")
+        return result
+
+    consecutive_failures = 0
+    try:
+        for sintoma in sintomas:
+            if not rotate and pool.get_all(sintoma):
+                result["skipped"] += 1
+                continue
+            try:
+                opening = generate(sintoma)
+            except Exception as e:
+                logger.warning(f"Error generando apertura para {sintoma}: {e}")
+                opening = None
+            if not opening:
+                result["failed"] += 1
+                consecutive_failures += 1
+                if consecutive_failures >= max_consecutive_failures:
+                    logger.warning("Calentamiento de aperturas interrumpido: la IA no responde")
+                    break
+                continue
+            consecutive_failures = 0
+            pool.add(sintoma, opening)
+            result["generated"] += 1
+    finally:
+        if lock and token:
+            lock.release("symptom_openings", token)
+
+    logger.info(f"🔥 Aperturas por síntoma calentadas: {result}")
+    return result
@@ -0,0 +1,248 @@
+"""
+Outbox transaccional para los efectos externos de las citas (Google Calendar, email).
+
+- `enqueue()` añade el mensaje a la sesión de SQLAlchemy del llamador: se guarda
+  en la misma transacción que el cambio de la cita, o no se guarda.
+- `kick()` (después del commit) pide un drenado: tarea de Celery si hay broker,
+  si no un hilo del proceso web. Celery beat drena además cada
+  OUTBOX_DRAIN_INTERVAL segundos por si un aviso se perdió.
+- `drain()` reclama un lote (lo oculta `_CLAIM_SECONDS` a otros drenadores) y
+  ejecuta el handler de cada mensaje. Los handlers son idempotentes: un mensaje
+  puede ejecutarse más de una vez si un worker muere a mitad del lote.
+- Los fallos se reintentan con espera exponencial hasta `max_attempts`; después
+  el mensaje queda en estado "failed" para revisarlo a mano.
+- Los tipos con handler de lote (`register_batch_handler`) se ejecutan juntos:
+  una sola llamada con todos los mensajes reclamados de esos tipos, que devuelve
+  el error (o None) de cada uno. Así N cambios en Calendar cuestan un batch HTTP.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from models import db, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], None]
+# Recibe [(mensaje, payload)] y retorna {message.id: error o None}
+BatchHandler = Callable[[List[Tuple[OutboxMessage, Dict[str, Any]]]], Dict[int, Optional[str]]]
+
+_handlers: Dict[str, Handler] = {}
+_batch_handlers: Dict[str, BatchHandler] = {}
+_CLAIM_SECONDS = 120
+_MAX_BACKOFF_SECONDS = 3600
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "drains": 0,
+    "processed": 0,
+    "errors": 0,
+    "dead": 0,
+    "lag_total_ms": 0.0,
+    "lag_max_ms": 0.0,
+    "last_drain_at": None,
+    "last_drain_ms": None,
+}
+
+
+def register_handler(kind: str) -> Callable[[Handler], Handler]:
+    """Registra el handler (idempotente) de un tipo de mensaje."""
+    def decorator(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def register_batch_handler(*kinds: str) -> Callable[[BatchHandler], BatchHandler]:
+    """Registra un handler de lote (idempotente) compartido por uno o más tipos de mensaje."""
+    def decorator(fn: BatchHandler) -> BatchHandler:
+        for kind in kinds:
+            _batch_handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(kind: str, payload: Dict[str, Any], appointment_id: Optional[int] = None) -> OutboxMessage:
+    """Añade un mensaje a la transacción en curso (no hace commit)."""
+    message = OutboxMessage(
+        kind=kind,
+        payload=json.dumps(payload),
+        appointment_id=appointment_id,
+        status="pending",
+        attempts=0,
+        available_at=datetime.utcnow(),
+    )
+    db.session.add(message)
+    return message
+
+
+def kick() -> str:
+    """Pide un drenado después del commit. Retorna cómo se hizo: 'queued' o 'thread'."""
+    if os.getenv('REDIS_URL'):
+        try:
+            from tasks import drain_outbox
+            drain_outbox.delay()
+            return "queued"
+        except Exception as e:
+            logger.warning(f"⚠️ Celery no disponible, el outbox se drena en este worker: {e}")
+
+    from flask import current_app
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            drain_all()
+
+    threading.Thread(target=run, name="outbox-drain", daemon=True).start()
+    return "thread"
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(30 * 2 ** max(attempts - 1, 0), _MAX_BACKOFF_SECONDS))
+
+
+def _claim(batch_size: int) -> list:
+    now = datetime.utcnow()
+    messages = (
+        OutboxMessage.query
+        .filter(OutboxMessage.status == "pending", OutboxMessage.available_at <= now)
+        .order_by(OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for message in messages:
+        message.attempts += 1
+        message.available_at = now + timedelta(seconds=_CLAIM_SECONDS)
+    db.session.commit()
+    return messages
+
+
+def _mark_failed(message_id: int, error: Exception, max_attempts: int, result: Dict[str, int]) -> None:
+    message = db.session.get(OutboxMessage, message_id)
+    message.last_error = str(error)[:2000]
+    if message.attempts >= max_attempts:
+        message.status = "failed"
+        result["failed"] += 1
+        logger.error(f"❌ Outbox {message.id} ({message.kind}) descartado tras {message.attempts} intentos: {error}")
+    else:
+        message.available_at = datetime.utcnow() + _backoff(message.attempts)
+        result["retry"] += 1
+        logger.warning(f"Outbox {message.id} ({message.kind}) intento {message.attempts} fallido: {error}")
+
+
+def _mark_done(message_id: int, result: Dict[str, int]) -> None:
+    message = db.session.get(OutboxMessage, message_id)
+    message.status = "done"
+    message.processed_at = datetime.utcnow()
+    message.last_error = None
+    result["done"] += 1
+    lag_ms = (message.processed_at - message.created_at).total_seconds() * 1000
+    with _stats_lock:
+        _stats["lag_total_ms"] += lag_ms
+        _stats["lag_max_ms"] = max(_stats["lag_max_ms"], lag_ms)
+
+
+def _run_batch(handler: BatchHandler, messages: list, max_attempts: int, result: Dict[str, int]) -> None:
+    try:
+        errors = handler([(m, json.loads(m.payload or "{}")) for m in messages])
+    except Exception as e:
+        db.session.rollback()
+        for message in messages:
+            _mark_failed(message.id, e, max_attempts, result)
+        db.session.commit()
+        return
+    for message in messages:
+        error = errors.get(message.id)
+        if error:
+            _mark_failed(message.id, RuntimeError(error), max_attempts, result)
+        else:
+            _mark_done(message.id, result)
+    db.session.commit()
+
+
+def drain(batch_size: int = 50, max_attempts: int = 8) -> Dict[str, int]:
+    """Procesa un lote de mensajes pendientes. Requiere app context."""
+    from . import outbox_handlers  # noqa: F401  (registra los handlers)
+
+    started = time.perf_counter()
+    result = {"claimed": 0, "done": 0, "retry": 0, "failed": 0}
+    messages = _claim(batch_size)
+    result["claimed"] = len(messages)
+    batches: Dict[BatchHandler, list] = {}
+
+    for message in messages:
+        batch_handler = _batch_handlers.get(message.kind)
+        if batch_handler is not None:
+            batches.setdefault(batch_handler, []).append(message)
+            continue
+
+        handler = _handlers.get(message.kind)
+        message_id = message.id
+        try:
+            if handler is None:
+                raise LookupError(f"Sin handler para '{message.kind}'")
+            handler(json.loads(message.payload or "{}"))
+        except Exception as e:
+            db.session.rollback()
+            _mark_failed(message_id, e, max_attempts, result)
+            db.session.commit()
+            continue
+
+        # El handler pudo hacer commit de sus propios cambios (y encolar mensajes nuevos)
+        _mark_done(message_id, result)
+        db.session.commit()
+
+    for batch_handler, batch in batches.items():
+        _run_batch(batch_handler, batch, max_attempts, result)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _stats_lock:
+        _stats["drains"] += 1
+        _stats["processed"] += result["done"]
+        _stats["errors"] += result["retry"] + result["failed"]
+        _stats["dead"] += result["failed"]
+        _stats["last_drain_at"] = datetime.utcnow().isoformat()
+        _stats["last_drain_ms"] = round(elapsed_ms, 1)
+    if messages:
+        logger.info(f"📤 Outbox drenado: {result} en {elapsed_ms:.0f} ms")
+    return result
+
+
+def drain_all(batch_size: int = 50, max_rounds: int = 20) -> Dict[str, int]:
+    """Drena lotes seguidos mientras vengan llenos (cambios en bloque del admin)."""
+    total = {"claimed": 0, "done": 0, "retry": 0, "failed": 0}
+    for _ in range(max_rounds):
+        result = drain(batch_size)
+        for key in total:
+            total[key] += result[key]
+        if result["claimed"] < batch_size:
+            break
+    return total
+
+
+def get_outbox_stats() -> Dict[str, Any]:
+    """Backlog y lag del outbox (DB) más contadores de este proceso. Requiere app context."""
+    oldest = (
+        db.session.query(db.func.min(OutboxMessage.created_at))
+        .filter(OutboxMessage.status == "pending")
+        .scalar()
+    )
+    backlog = OutboxMessage.query.filter_by(status="pending").count()
+    failed = OutboxMessage.query.filter_by(status="failed").count()
+    with _stats_lock:
+        processed = _stats["processed"]
+        return {
+            "backlog": backlog,
+            "failed": failed,
+            "oldest_pending_seconds": (round((datetime.utcnow() - oldest).total_seconds(), 1)
+                                       if oldest else 0.0),
+            "lag_avg_ms": round(_stats["lag_total_ms"] / processed, 1) if processed else 0.0,
+            **{k: v for k, v in _stats.items() if k not in ("lag_total_ms", "lag_max_ms")},
+            "lag_max_ms": round(_stats["lag_max_ms"], 1),
+        }
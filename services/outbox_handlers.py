@@ -0,0 +1,51 @@
+"""
+Handlers de los mensajes del outbox. Todos son idempotentes: ejecutarlos dos veces
+con el mismo payload deja Calendar y la DB igual que una sola vez.
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from dateutil import parser as dateutil_parser
+
+from models import OutboxMessage
+from .appointment_service import _NOTIFICATION_EMAIL, enviar_correo_resend, procesar_reserva
+from .calendar_sync_service import apply_calendar_changes
+from .outbox import register_batch_handler, register_handler
+
+logger = logging.getLogger(__name__)
+
+
+@register_handler("calendar.create")
+def _crear_evento(payload: Dict[str, Any]) -> None:
+    procesar_reserva(payload["appointment_id"])
+
+
+@register_batch_handler("calendar.patch", "calendar.delete")
+def _cambios_en_calendar(items: List[Tuple[OutboxMessage, Dict[str, Any]]]) -> Dict[int, Optional[str]]:
+    # Todos los cambios de estado reclamados en un drenado van en un mismo batch HTTP
+    changes = []
+    for message, payload in items:
+        change = {"key": message.id, "event_id": payload["event_id"]}
+        if message.kind == "calendar.delete":
+            scheduled_at = payload.get("scheduled_at")
+            change.update(action="delete",
+                          scheduled_at=dateutil_parser.isoparse(scheduled_at) if scheduled_at else None)
+        else:
+            change.update(action="patch", status=payload["status"], appointment_id=message.appointment_id)
+        changes.append(change)
+    results = apply_calendar_changes(changes)
+    return {key: (None if result["ok"] else result["error"]) for key, result in results.items()}
+
+
+@register_handler("email.confirmation")
+def _enviar_confirmacion(payload: Dict[str, Any]) -> None:
+    # El outbox garantiza "al menos una vez": solo se reenvía si el worker muere entre
+    # el envío y marcar el mensaje como hecho
+    if not os.getenv('RESEND_API_KEY'):
+        logger.info(f"📧 Email simulado (sin RESEND_API_KEY): {payload['fecha']} {payload['hora']}")
+        return
+    if not enviar_correo_resend(_NOTIFICATION_EMAIL, payload["fecha"], payload["hora"],
+                                payload["telefono"], payload["sintoma"]):
+        raise RuntimeError("Resend no aceptó el correo de confirmación")
@@ -0,0 +1,141 @@
+"""
+Canonicalización de prompts para las claves de la caché de IA.
+
+Mensajes casi idénticos ("Me siento ansioso" / "me siento  ansioso.") deben
+producir la misma clave. Cada regla se aplica en orden y se mide
+cuántos aciertos de caché habrían sido fallos sin ella.
+El texto original es el que se envía al modelo; esto solo afecta a la clave.
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PRESERVED_CHARS = frozenset("ñÑ")
+
+
+def _unicode_nfkc(text: str) -> str:
+    return unicodedata.normalize("NFKC", text)
+
+
+def _casefold(text: str) -> str:
+    return text.casefold()
+
+
+def _fold_accents(text: str) -> str:
+    """Elimina tildes y diéresis conservando la ñ ("año" no debe ser "ano")."""
+    if text.isascii():
+        return text
+    folded = []
+    for ch in text:
+        if ch.isascii() or ch in _PRESERVED_CHARS:
+            folded.append(ch)
+            continue
+        decomposed = unicodedata.normalize("NFKD", ch)
+        folded.append("".join(c for c in decomposed if not unicodedata.combining(c)))
+    return "".join(folded)
+
+
+def _strip_punctuation(text: str) -> str:
+    return "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+
+
+def _collapse_whitespace(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+# Orden relevante: la eliminación de puntuación deja espacios que colapsa la última regla
+DEFAULT_RULES: List[Tuple[str, Callable[[str], str]]] = [
+    ("unicode", _unicode_nfkc),
+    ("case", _casefold),
+    ("accents", _fold_accents),
+    ("punctuation", _strip_punctuation),
+    ("whitespace", _collapse_whitespace),
+]
+
+
+class PromptNormalizer:
+    """
+    Aplica las reglas de canonicalización y mide qué reglas generan aciertos.
+
+    Para atribuir aciertos se usa una "huella" por consulta: el hash del texto
+    original y, para cada regla, el hash del texto normalizado sin esa regla.
+    En un acierto, una regla "pagó" si sin ella la clave habría sido distinta de
+    la de la entrada guardada (es decir, sin esa regla habría sido un fallo).
+    Las partes fijas del prompt no influyen porque son idénticas en ambas huellas.
+    """
+
+    def __init__(self, rules: Optional[List[Tuple[str, Callable[[str], str]]]] = None,
+                 max_tracked: int = 2048):
+        self.rules = rules or DEFAULT_RULES
+        self.max_tracked = max_tracked
+        self._origins: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "exact_hits": 0,
+                          "normalized_hits": 0, "unattributed_hits": 0}
+        self._rule_hits: Dict[str, int] = {name: 0 for name, _ in self.rules}
+
+    def normalize(self, text: str, skip: Optional[str] = None) -> str:
+        """Aplica todas las reglas (excepto `skip`) en orden."""
+        for name, rule in self.rules:
+            if name != skip:
+                text = rule(text)
+        return text
+
+    def fingerprint(self, texts: List[str]) -> Tuple[str, ...]:
+        """Huella: (hash del original, hash sin regla 1, ..., hash sin regla N)."""
+        variants = ["\x00".join(texts)]
+        variants.extend(
+            "\x00".join(self.normalize(t, skip=name) for t in texts) for name, _ in self.rules
+        )
+        return tuple(hashlib.blake2b(v.encode("utf-8"), digest_size=8).hexdigest() for v in variants)
+
+    def remember(self, key: str, fingerprint: Tuple[str, ...]) -> None:
+        """Guarda la huella de la consulta que originó la entrada `key`."""
+        with self._lock:
+            self._origins[key] = fingerprint
+            self._origins.move_to_end(key)
+            while len(self._origins) > self.max_tracked:
+                self._origins.popitem(last=False)
+
+    def record(self, key: str, fingerprint: Tuple[str, ...], hit: bool) -> None:
+        """Registra una consulta a caché y atribuye el acierto a las reglas que lo hicieron posible."""
+        with self._lock:
+            self._counters["lookups"] += 1
+            if not hit:
+                return
+            self._counters["hits"] += 1
+            origin = self._origins.get(key)
+            if origin is None:
+                # Entrada creada por otro worker (L2) o ya olvidada
+                self._counters["unattributed_hits"] += 1
+            elif origin[0] == fingerprint[0]:
+                self._counters["exact_hits"] += 1
+            else:
+                self._counters["normalized_hits"] += 1
+                for (name, _), stored, current in zip(self.rules, origin[1:], fingerprint[1:]):
+                    if stored != current:
+                        self._rule_hits[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            rule_hits = dict(self._rule_hits)
+        lookups = counters["lookups"]
+        return {
+            **counters,
+            "normalized_hit_rate": round(counters["normalized_hits"] / lookups, 4) if lookups else 0.0,
+            "rules": {name: {"hits_enabled": hits} for name, hits in rule_hits.items()},
+        }
+
+
+def scope_slug(value: Optional[str]) -> str:
+    """Segmento de clave legible para un síntoma ("Problemas de sueño" -> "problemas-de-sueño")."""
+    if not value:
+        return "general"
+    text = _fold_accents(_casefold(_unicode_nfkc(value)))
+    return _collapse_whitespace(_strip_punctuation(text)).replace(" ", "-")
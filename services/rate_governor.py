@@ -0,0 +1,323 @@
+"""
+Control de admisión de llamadas a Groq (límites de requests/min y tokens/min).
+
+- Dos "token buckets" por modelo: requests por minuto y tokens por minuto.
+  Con Redis los buckets se comparten entre workers (script Lua atómico);
+  sin Redis (o si falla) cada proceso usa buckets locales.
+- Las llamadas que no caben esperan en una cola con prioridad por modelo:
+  crisis primero, luego conversación interactiva y por último tareas de fondo
+  (resúmenes, calentamiento de aperturas). La cola de un modelo no retiene
+  las llamadas a otro (p. ej. la degradación al modelo rápido).
+- Cada prioridad tiene una espera máxima y una reserva de capacidad que no
+  puede consumir: las tareas de fondo solo usan el 70 % de la capacidad y se
+  descartan si no la obtienen a tiempo, dejando margen a los turnos interactivos.
+
+El llamador decide qué hacer con una admisión denegada (usar un modelo más
+barato o la respuesta de contingencia) antes de que Groq devuelva 429.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from .shared_redis import shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor = más urgente)
+CRISIS = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {CRISIS: "crisis", INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Espera máxima en cola (s) y fracción de capacidad reservada para prioridades superiores
+MAX_WAIT = {CRISIS: 10.0, INTERACTIVE: 3.0, BACKGROUND: 30.0}
+RESERVE = {CRISIS: 0.0, INTERACTIVE: 0.1, BACKGROUND: 0.3}
+
+_current_priority: ContextVar[int] = ContextVar("groq_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def call_priority(priority: int):
+    """Fija la prioridad de las llamadas a Groq hechas dentro del bloque (mismo hilo)."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+class AdmissionRejected(RuntimeError):
+    """La llamada no obtuvo capacidad a tiempo y se descartó antes de llegar a Groq."""
+
+
+class ModelLimits(NamedTuple):
+    rpm: float
+    tpm: float
+
+
+class Admission(NamedTuple):
+    granted: bool
+    waited: float
+    reason: str
+
+
+# ==================== BUCKETS ====================
+
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rcap = tonumber(ARGV[2])
+local tcap = tonumber(ARGV[3])
+local rcost = tonumber(ARGV[4])
+local tcost = tonumber(ARGV[5])
+local reserve = tonumber(ARGV[6])
+local force = tonumber(ARGV[7])
+
+local function level(key, cap)
+    local data = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or cap
+    local ts = tonumber(data[2]) or now
+    return math.min(cap, tokens + math.max(0, now - ts) * cap / 60)
+end
+
+local r = level(KEYS[1], rcap)
+local t = level(KEYS[2], tcap)
+local wait = 0
+if force == 0 then
+    local rneed = math.min(rcost + reserve * rcap, rcap)
+    local tneed = math.min(tcost + reserve * tcap, tcap)
+    if r < rneed then wait = math.max(wait, (rneed - r) * 60 / rcap) end
+    if t < tneed then wait = math.max(wait, (tneed - t) * 60 / tcap) end
+end
+if wait == 0 then
+    r = math.min(rcap, r - rcost)
+    t = math.min(tcap, t - tcost)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(r), 'ts', tostring(now))
+redis.call('HSET', KEYS[2], 'tokens', tostring(t), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('EXPIRE', KEYS[2], 120)
+return tostring(wait)
+"""
+
+
+class LocalBuckets:
+    """Buckets en proceso; misma semántica que el script de Redis."""
+
+    def __init__(self):
+        self._levels: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _level(self, key: str, cap: float, now: float) -> float:
+        tokens, ts = self._levels.get(key, (cap, now))
+        return min(cap, tokens + max(0.0, now - ts) * cap / 60)
+
+    def take(self, model: str, limits: ModelLimits, requests: float, tokens: float,
+             reserve: float = 0.0, force: bool = False) -> float:
+        """Consume si hay capacidad. Retorna 0 si se concedió, o segundos hasta que la haya."""
+        now = time.time()
+        with self._lock:
+            r = self._level(f"{model}:req", limits.rpm, now)
+            t = self._level(f"{model}:tok", limits.tpm, now)
+            wait = 0.0
+            if not force:
+                rneed = min(requests + reserve * limits.rpm, limits.rpm)
+                tneed = min(tokens + reserve * limits.tpm, limits.tpm)
+                if r < rneed:
+                    wait = max(wait, (rneed - r) * 60 / limits.rpm)
+                if t < tneed:
+                    wait = max(wait, (tneed - t) * 60 / limits.tpm)
+            if wait == 0:
+                r = min(limits.rpm, r - requests)
+                t = min(limits.tpm, t - tokens)
+            self._levels[f"{model}:req"] = (r, now)
+            self._levels[f"{model}:tok"] = (t, now)
+        return wait
+
+
+class RedisBuckets:
+    """Buckets compartidos en Redis; ante un error se usan los locales durante `retry_after` s."""
+
+    def __init__(self, client, prefix: str = "equilibra:groqrate:", retry_after: int = 30):
+        self.client = client
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self.local = LocalBuckets()
+        self._disabled_until = 0.0
+
+    def take(self, model: str, limits: ModelLimits, requests: float, tokens: float,
+             reserve: float = 0.0, force: bool = False) -> float:
+        if time.time() < self._disabled_until:
+            return self.local.take(model, limits, requests, tokens, reserve, force)
+        try:
+            wait = self.client.eval(
+                _TAKE_SCRIPT, 2, f"{self.prefix}{model}:req", f"{self.prefix}{model}:tok",
+                repr(time.time()), limits.rpm, limits.tpm, requests, tokens, reserve, int(force),
+            )
+        except Exception as e:
+            self._disabled_until = time.time() + self.retry_after
+            logger.warning(f"Límites de Groq compartidos no disponibles, usando locales: {e}")
+            return self.local.take(model, limits, requests, tokens, reserve, force)
+        return float(wait.decode() if isinstance(wait, bytes) else wait)
+
+
+# ==================== GOBERNADOR ====================
+
+class RateGovernor:
+    """Admite o rechaza llamadas según los buckets del modelo y la prioridad."""
+
+    def __init__(self, limits: Optional[Dict[str, ModelLimits]] = None,
+                 default: ModelLimits = ModelLimits(30, 8000), buckets=None,
+                 max_wait: Optional[Dict[int, float]] = None,
+                 reserve: Optional[Dict[int, float]] = None):
+        self.limits = dict(limits or {})
+        self.default = default
+        self.buckets = buckets or LocalBuckets()
+        self.max_wait = {**MAX_WAIT, **(max_wait or {})}
+        self.reserve = {**RESERVE, **(reserve or {})}
+        self._queues: Dict[str, list] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._counters: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateGovernor":
+        """
+        GROQ_RPM / GROQ_TPM: límites por defecto de cada modelo.
+        GROQ_RATE_LIMITS: JSON {"modelo": [rpm, tpm]} para límites específicos.
+        """
+        try:
+            default = ModelLimits(float(os.getenv("GROQ_RPM", 30)), float(os.getenv("GROQ_TPM", 8000)))
+            limits = {model: ModelLimits(*map(float, value))
+                      for model, value in json.loads(os.getenv("GROQ_RATE_LIMITS", "{}")).items()}
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Límites de Groq inválidos, usando valores por defecto: {e}")
+            default, limits = ModelLimits(30, 8000), {}
+        client = shared_redis_client("los límites de Groq")
+        buckets = RedisBuckets(client) if client is not None else LocalBuckets()
+        return cls(limits, default=default, buckets=buckets)
+
+    def limits_for(self, model: str) -> ModelLimits:
+        return self.limits.get(model, self.default)
+
+    def _count(self, model: str, name: str, amount: float = 1) -> None:
+        counters = self._counters.setdefault(
+            model, {"admitted": 0, "queued": 0, "rejected": 0, "forced": 0, "wait_seconds": 0.0}
+        )
+        counters[name] += amount
+
+    def acquire(self, model: str, tokens: int, priority: int = INTERACTIVE,
+                max_wait: Optional[float] = None) -> Admission:
+        """
+        Espera turno (por prioridad) hasta que el modelo tenga capacidad para una
+        llamada de `tokens` tokens estimados, o hasta agotar la espera máxima
+        (la de la prioridad, salvo que se indique `max_wait`).
+        """
+        limits = self.limits_for(model)
+        reserve = self.reserve.get(priority, 0.0)
+        start = time.monotonic()
+        if max_wait is None:
+            max_wait = self.max_wait.get(priority, 0.0)
+        deadline = start + max_wait
+        ticket = (priority, next(self._seq))
+        queued = False
+
+        with self._cond:
+            queue = self._queues.setdefault(model, [])
+            heapq.heappush(queue, ticket)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    if queue[0] != ticket:
+                        if remaining <= 0:
+                            self._count(model, "rejected")
+                            return Admission(False, now - start, "cola llena de prioridad superior")
+                        if not queued:
+                            queued = True
+                            self._count(model, "queued")
+                        self._cond.wait(timeout=remaining)
+                        continue
+
+                # Cabeza de la cola del modelo: los buckets (EVAL en Redis) se consultan
+                # sin retener la condición, para no bloquear al resto de modelos
+                wait = self.buckets.take(model, limits, 1, tokens, reserve)
+
+                with self._cond:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    if wait == 0:
+                        waited = now - start
+                        self._count(model, "admitted")
+                        self._count(model, "wait_seconds", waited)
+                        return Admission(True, waited, "admitted")
+                    if wait > remaining:
+                        # No habrá capacidad a tiempo: rechazar ya en lugar de esperar en vano
+                        self._count(model, "rejected")
+                        return Admission(False, now - start, f"sin capacidad en {wait:.1f}s")
+                    if not queued:
+                        queued = True
+                        self._count(model, "queued")
+                    self._cond.wait(timeout=min(wait, remaining))
+        finally:
+            with self._cond:
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                if not queue:
+                    self._queues.pop(model, None)
+                self._cond.notify_all()
+
+    def force(self, model: str, tokens: int) -> None:
+        """Registra una llamada hecha sin admisión (p. ej. crisis tras agotar la espera)."""
+        self.buckets.take(model, self.limits_for(model), 1, tokens, force=True)
+        with self._cond:
+            self._count(model, "forced")
+
+    def reconcile(self, model: str, estimated: int, actual: Optional[int]) -> None:
+        """Devuelve al bucket los tokens estimados de más cuando llega `usage`."""
+        if actual is None or actual >= estimated:
+            return
+        self.buckets.take(model, self.limits_for(model), 0, actual - estimated, force=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            counters = {model: dict(c) for model, c in self._counters.items()}
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for queue in self._queues.values():
+                for priority, _ in queue:
+                    depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        for data in counters.values():
+            admitted = data["admitted"]
+            data["avg_wait_seconds"] = round(data.pop("wait_seconds") / admitted, 3) if admitted else 0.0
+        return {
+            "shared": isinstance(self.buckets, RedisBuckets),
+            "default_limits": self.default._asdict(),
+            "limits": {model: lim._asdict() for model, lim in self.limits.items()},
+            "queue_depth": depth,
+            "models": counters,
+        }
+
+
+_governors: Dict[str, RateGovernor] = {}
+
+
+def register_governor(name: str, governor: RateGovernor) -> RateGovernor:
+    _governors[name] = governor
+    return governor
+
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: governor.snapshot() for name, governor in _governors.items()}
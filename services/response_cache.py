@@ -0,0 +1,407 @@
+"""
+Motor de caché LRU con TTL para respuestas de IA.
+
+- Expulsión LRU en O(1) (OrderedDict) acotada por número de entradas y por bytes.
+- Expiración por TTL evaluada de forma perezosa en cada lectura.
+- Claves estables: hash SHA-256 de los argumentos normalizados (sin `self`).
+- Contadores de aciertos/fallos/expulsiones expuestos vía get_cache_stats().
+- Con REDIS_URL: caché en dos niveles (L1 en proceso + L2 en Redis comprimido),
+  compartida por todos los workers web y el worker de Celery.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .shared_redis import shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def build_cache_key(namespace: str, arguments: Dict[str, Any]) -> str:
+    """Genera una clave estable a partir de un espacio de nombres y argumentos."""
+    payload = json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class CacheKeyBuilder:
+    """
+    Construye la clave de caché para una llamada a `func`.
+    Los argumentos se enlazan a la firma (aplicando valores por defecto) y se
+    descarta `self`/`cls`, de modo que la clave no depende del repr de la instancia.
+
+    Opcionalmente:
+    - `normalizer` canonicaliza los argumentos `normalize_args` antes del hash.
+    - `scope_arg` antepone el valor de ese argumento a la clave (p. ej. el síntoma),
+      para poder agrupar e invalidar entradas por ámbito.
+    - `ignore_args` no forman parte de la clave (p. ej. datos que ya están en el prompt).
+    """
+
+    def __init__(self, func: Callable, namespace: Optional[str] = None, normalizer=None,
+                 normalize_args: Tuple[str, ...] = (), scope_arg: Optional[str] = None,
+                 ignore_args: Tuple[str, ...] = ()):
+        self.signature = inspect.signature(func)
+        self.namespace = namespace or func.__qualname__
+        self.normalizer = normalizer
+        self.normalize_args = normalize_args
+        self.scope_arg = scope_arg
+        self.ignore_args = ("self", "cls") + tuple(ignore_args)
+
+    def build(self, *args, **kwargs) -> Tuple[str, Optional[Tuple[str, ...]]]:
+        """Retorna (clave, huella de normalización o None si no hay normalizador)."""
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {k: v for k, v in bound.arguments.items() if k not in self.ignore_args}
+
+        fingerprint = None
+        if self.normalizer:
+            originals = [str(arguments.get(name) or "") for name in self.normalize_args]
+            fingerprint = self.normalizer.fingerprint(originals)
+            for name in self.normalize_args:
+                if isinstance(arguments.get(name), str):
+                    arguments[name] = self.normalizer.normalize(arguments[name])
+
+        namespace = self.namespace
+        if self.scope_arg:
+            from .prompt_normalizer import scope_slug
+            namespace = f"{namespace}:{scope_slug(arguments.get(self.scope_arg))}"
+        return build_cache_key(namespace, arguments), fingerprint
+
+    def __call__(self, *args, **kwargs) -> str:
+        return self.build(*args, **kwargs)[0]
+
+
+def make_key_builder(func: Callable, namespace: Optional[str] = None) -> CacheKeyBuilder:
+    """Atajo para una CacheKeyBuilder sin normalización ni ámbito."""
+    return CacheKeyBuilder(func, namespace)
+
+
+def _entry_size(key: str, value: str) -> int:
+    return len(key) + len(value.encode("utf-8"))
+
+
+class ResponseCache:
+    """Caché LRU/TTL thread-safe acotada por entradas y por bytes."""
+
+    def __init__(self, name: str, max_entries: int = 100, ttl: int = 3600,
+                 max_bytes: int = 2 * 1024 * 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "rejected": 0,
+        }
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Retorna el valor cacheado (marcándolo como reciente) o `default`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return default
+            stored_at, value, size = entry
+            if time.time() - stored_at >= self.ttl:
+                self._remove(key, size)
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def peek(self, key: str) -> Optional[str]:
+        """Lee un valor vigente sin alterar el orden LRU ni los contadores."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: str) -> bool:
+        """Guarda un valor. Retorna False si excede el límite de bytes por sí solo."""
+        size = _entry_size(key, value)
+        with self._lock:
+            if size > self.max_bytes:
+                self._counters["rejected"] += 1
+                return False
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (time.time(), value, size)
+            self._bytes += size
+            self._counters["stores"] += 1
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self._counters["evictions"] += 1
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False
+            self._remove(key, entry[2])
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str, size: int) -> None:
+        del self._data[key]
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores y ocupación actual de la caché."""
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters["hits"] + counters["misses"]
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+                **counters,
+            }
+
+    def snapshot(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Vista previa de las entradas más recientes (para diagnóstico)."""
+        now = time.time()
+        with self._lock:
+            items = list(reversed(self._data.items()))[:limit]
+        return [
+            {
+                "key": key[:24] + "...",
+                "age_seconds": int(now - stored_at),
+                "bytes": size,
+                "preview": value[:100] + "..." if len(value) > 100 else value,
+            }
+            for key, (stored_at, value, size) in items
+        ]
+
+
+# ==================== NIVEL L2 (REDIS) ====================
+
+class RedisCacheBackend:
+    """
+    Nivel L2 compartido en Redis. Los valores se guardan comprimidos con zlib
+    y con TTL nativo de Redis. Ante un error de Redis se desactiva durante
+    `retry_after` segundos para no añadir latencia a cada request.
+    """
+
+    def __init__(self, client, prefix: str = "equilibra:aicache:", retry_after: int = 30):
+        self.client = client
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "errors": 0,
+                          "bytes_written": 0, "bytes_uncompressed": 0}
+
+    def _available(self) -> bool:
+        return time.time() >= self._disabled_until
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _fail(self, operation: str, error: Exception) -> None:
+        self._count("errors")
+        self._disabled_until = time.time() + self.retry_after
+        logger.warning(f"Caché L2 (Redis) no disponible en {operation}: {error}")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._available():
+            return None
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self._fail("get", e)
+            return None
+        if raw is None:
+            self._count("misses")
+            return None
+        try:
+            value = zlib.decompress(raw).decode("utf-8")
+        except (zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Entrada corrupta en caché L2 ({key[:24]}...): {e}")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value
+
+    def set(self, key: str, value: str, ttl: int) -> bool:
+        if not self._available():
+            return False
+        data = value.encode("utf-8")
+        compressed = zlib.compress(data, 6)
+        try:
+            self.client.set(self.prefix + key, compressed, ex=max(1, int(ttl)))
+        except Exception as e:
+            self._fail("set", e)
+            return False
+        with self._lock:
+            self._counters["writes"] += 1
+            self._counters["bytes_written"] += len(compressed)
+            self._counters["bytes_uncompressed"] += len(data)
+        return True
+
+    def delete(self, key: str) -> None:
+        if not self._available():
+            return
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            self._fail("delete", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        raw_bytes = counters["bytes_uncompressed"]
+        return {
+            "backend": "redis",
+            "prefix": self.prefix,
+            "available": self._available(),
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "compression_ratio": round(counters["bytes_written"] / raw_bytes, 3) if raw_bytes else None,
+            **counters,
+        }
+
+
+class TieredCache:
+    """
+    Caché de dos niveles: L1 (ResponseCache en proceso) delante de L2 (Redis).
+    Las lecturas que fallan en L1 y aciertan en L2 se promueven a L1.
+    Misma interfaz que ResponseCache para que cache_response no distinga.
+    """
+
+    def __init__(self, l1: ResponseCache, l2: RedisCacheBackend):
+        self.l1 = l1
+        self.l2 = l2
+        self.name = l1.name
+        self.ttl = l1.ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+        value = self.l2.get(key)
+        if value is None:
+            return default
+        self.l1.set(key, value)
+        return value
+
+    def peek(self, key: str) -> Optional[str]:
+        """Sondeo sin contar en L1; consulta L2 para ver lo publicado por otros workers."""
+        value = self.l1.peek(key)
+        if value is not None:
+            return value
+        value = self.l2.get(key)
+        if value is not None:
+            self.l1.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> bool:
+        stored = self.l1.set(key, value)
+        self.l2.set(key, value, self.ttl)
+        return stored
+
+    def delete(self, key: str) -> bool:
+        self.l2.delete(key)
+        return self.l1.delete(key)
+
+    def clear(self) -> None:
+        """Vacía solo L1; las entradas de L2 caducan por TTL."""
+        self.l1.clear()
+
+    def __len__(self) -> int:
+        return len(self.l1)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.l1.stats(), "l2": self.l2.stats()}
+
+    def snapshot(self, limit: int = 5) -> List[Dict[str, Any]]:
+        return self.l1.snapshot(limit)
+
+
+def create_response_cache(name: str, max_entries: int = 100, ttl: int = 3600,
+                          max_bytes: int = 2 * 1024 * 1024):
+    """
+    Crea la caché para `name`: TieredCache si REDIS_URL está configurada
+    (y AI_CACHE_SHARED no es 'false'), o una ResponseCache local en otro caso.
+    """
+    l1 = ResponseCache(name, max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+    client = shared_redis_client(f"la caché {name}")
+    if client is None:
+        return l1
+    return TieredCache(l1, RedisCacheBackend(client))
+
+
+# ==================== REGISTRO PARA INTROSPECCIÓN ====================
+
+_registry: Dict[str, Any] = {}
+_registry_lock = threading.Lock()
+_extra_stats: Dict[str, Dict[str, Callable[[], Dict[str, Any]]]] = {}
+
+
+def register_cache(cache, **extra_stats: Callable[[], Dict[str, Any]]):
+    """
+    Registra una caché para introspección. `extra_stats` son proveedores
+    adicionales (p. ej. normalization=normalizer.stats) incluidos en sus estadísticas.
+    """
+    with _registry_lock:
+        _registry[cache.name] = cache
+        _extra_stats[cache.name] = dict(extra_stats)
+    return cache
+
+
+def get_cache(name: str):
+    return _registry.get(name)
+
+
+def get_cache_stats(include_entries: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Estadísticas de todas las cachés registradas, indexadas por nombre."""
+    with _registry_lock:
+        caches = list(_registry.values())
+    result = {}
+    for cache in caches:
+        data = cache.stats()
+        for label, provider in _extra_stats.get(cache.name, {}).items():
+            data[label] = provider()
+        if include_entries:
+            data["entries_preview"] = cache.snapshot()
+        result[cache.name] = data
+    return result
@@ -0,0 +1,37 @@
+"""
+Redis compartido entre workers: cliente y scripts comunes.
+
+Lo usan la caché de respuestas, la coalescencia, los límites de Groq, las
+claves de idempotencia, los candados de horario y el resto de funciones que
+se coordinan entre procesos. Sin REDIS_URL cada una cae a su versión local.
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Libera un candado `SET NX PX` solo si sigue teniendo nuestro token (no el de otro
+# worker que lo tomó después de que el nuestro caducara)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def shared_redis_client(purpose: str):
+    """
+    Cliente Redis para funciones compartidas entre workers (caché, coalescencia, candados).
+    Retorna None si no hay REDIS_URL, si AI_CACHE_SHARED='false' o si falla la creación.
+    """
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url or os.getenv("AI_CACHE_SHARED", "true").lower() == "false":
+        return None
+    try:
+        import redis
+        return redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    except Exception as e:
+        logger.warning(f"No se pudo crear el cliente Redis para {purpose}: {e}")
+        return None
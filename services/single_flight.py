@@ -0,0 +1,197 @@
+"""
+Coalescencia de llamadas concurrentes idénticas ("single-flight").
+
+Cuando varias sesiones piden a la vez la misma respuesta con la caché fría,
+solo la primera llama a Groq; el resto espera su resultado:
+
+- Dentro de un worker: los hilos que llegan con la misma clave esperan el
+  mismo Future que resuelve el hilo líder.
+- Entre workers (con REDIS_URL): el líder toma un candado `SET NX PX` en Redis;
+  los demás sondean la caché compartida hasta que el líder publica la respuesta
+  o el candado desaparece (en cuyo caso generan la respuesta por su cuenta).
+
+Si la espera supera `wait_timeout`, el seguidor ejecuta la llamada él mismo:
+la coalescencia nunca debe convertir una respuesta lenta en una sin respuesta.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .shared_redis import RELEASE_LOCK_SCRIPT, shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Token devuelto cuando Redis no está disponible: se continúa sin coordinación
+LOCAL_TOKEN = "local"
+
+class RedisFlightLock:
+    """
+    Candado por clave en Redis para elegir un único líder entre workers.
+    Ante un error de Redis se desactiva durante `retry_after` segundos y
+    `try_acquire` devuelve LOCAL_TOKEN (cada worker sigue por su cuenta).
+    """
+
+    def __init__(self, client, prefix: str = "equilibra:aiflight:", lock_ttl: float = 30.0,
+                 retry_after: int = 30):
+        self.client = client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+
+    def _available(self) -> bool:
+        return time.time() >= self._disabled_until
+
+    def _fail(self, operation: str, error: Exception) -> None:
+        self._disabled_until = time.time() + self.retry_after
+        logger.warning(f"Coalescencia entre workers no disponible en {operation}: {error}")
+
+    def try_acquire(self, key: str) -> Optional[str]:
+        """Retorna un token si este worker es el líder, o None si otro ya lo es."""
+        if not self._available():
+            return LOCAL_TOKEN
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.client.set(self.prefix + key, token, nx=True,
+                                       px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            self._fail("acquire", e)
+            return LOCAL_TOKEN
+        return token if acquired else None
+
+    def is_held(self, key: str) -> bool:
+        if not self._available():
+            return False
+        try:
+            return bool(self.client.exists(self.prefix + key))
+        except Exception as e:
+            self._fail("exists", e)
+            return False
+
+    def release(self, key: str, token: str) -> None:
+        """Libera el candado solo si sigue siendo nuestro (comparación atómica)."""
+        if token == LOCAL_TOKEN or not self._available():
+            return
+        try:
+            self.client.eval(RELEASE_LOCK_SCRIPT, 1, self.prefix + key, token)
+        except Exception as e:
+            self._fail("release", e)
+
+
+class SingleFlight:
+    """
+    Ejecuta `fn` una sola vez por clave entre llamadas concurrentes.
+
+    `do(key, fn, peek)` retorna (resultado, compartido). `peek` es una función
+    sin efectos que devuelve el resultado ya publicado (p. ej. lectura de la caché
+    compartida) o None; se usa para esperar a un líder de otro worker.
+    """
+
+    def __init__(self, name: str, remote: Optional[RedisFlightLock] = None,
+                 wait_timeout: float = 30.0, poll_interval: float = 0.1):
+        self.name = name
+        self.remote = remote
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0, "remote_coalesced": 0,
+                          "timeouts": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key: str, fn: Callable[[], Any],
+           peek: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._flights[key] = future
+                self._counters["leaders"] += 1
+
+        if not leader:
+            try:
+                result = future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                self._count("timeouts")
+                logger.warning(f"⏳ Espera de coalescencia agotada en {self.name}; se llama directamente")
+                return fn(), False
+            self._count("coalesced")
+            return result, True
+
+        try:
+            result, shared = self._run_leader(key, fn, peek)
+        except BaseException as e:
+            self._count("errors")
+            with self._lock:
+                self._flights.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._flights.pop(key, None)
+        future.set_result(result)
+        return result, shared
+
+    def _run_leader(self, key: str, fn: Callable[[], Any],
+                    peek: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+        if self.remote is None:
+            return fn(), False
+
+        token = self.remote.try_acquire(key)
+        if token is None:
+            result = self._await_remote(key, peek)
+            if result is not None:
+                self._count("remote_coalesced")
+                return result, True
+            token = self.remote.try_acquire(key)
+
+        try:
+            # Otro worker pudo publicar entre la consulta a caché y el candado
+            result = peek() if peek else None
+            if result is not None:
+                return result, True
+            return fn(), False
+        finally:
+            if token:
+                self.remote.release(key, token)
+
+    def _await_remote(self, key: str, peek: Optional[Callable[[], Any]]) -> Any:
+        """Sondea el resultado publicado por el líder de otro worker."""
+        if peek is None:
+            return None
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = peek()
+            if result is not None:
+                return result
+            if not self.remote.is_held(key):
+                # El líder terminó (o falló) sin publicar: última comprobación
+                return peek()
+        self._count("timeouts")
+        logger.warning(f"⏳ Líder remoto de {self.name} no respondió en {self.wait_timeout}s")
+        return None
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = len(self._flights)
+        return {"shared": self.remote is not None, "in_flight": in_flight, **counters}
+
+
+def create_single_flight(name: str, wait_timeout: float = 30.0) -> SingleFlight:
+    """SingleFlight para `name`, coordinado entre workers si hay Redis compartido."""
+    client = shared_redis_client(f"la coalescencia de {name}")
+    remote = RedisFlightLock(client, lock_ttl=wait_timeout) if client is not None else None
+    return SingleFlight(name, remote=remote, wait_timeout=wait_timeout)
@@ -0,0 +1,148 @@
+"""
+Candado corto por horario para serializar reservas concurrentes del mismo slot.
+
+Dos pacientes que eligen el mismo horario llegarían juntos a la consulta de
+ocupación y a la transacción; el constraint único de la DB rechazaría a uno,
+pero solo después de todo ese trabajo. Con el candado, el segundo request
+falla en milisegundos:
+
+- En el worker: un conjunto de horarios tomados (hilos del mismo proceso).
+- Entre workers: `SET NX PX` en Redis con un token propio; se libera con una
+  comparación atómica para no borrar el candado de otro si el nuestro caducó.
+- Sin Redis (o si falla) en PostgreSQL: `pg_try_advisory_xact_lock`, que se
+  libera solo con el commit o rollback de la transacción de la reserva.
+
+El candado no sustituye al constraint uq_appointments_scheduled_at_active:
+si caduca o no hay coordinación entre workers, la DB sigue decidiendo.
+
+El TTL en Redis es por defecto el timeout de los requests (REQUEST_TIMEOUT, el
+--timeout de gunicorn): el candado no puede caducar mientras su request sigue
+vivo. Al terminar se libera explícitamente; el TTL solo cuenta si el worker
+muere con el candado tomado, y entonces el horario queda bloqueado como mucho
+ese tiempo.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .shared_redis import RELEASE_LOCK_SCRIPT, shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def _advisory_key(slot: str) -> int:
+    """Entero de 64 bits con signo (rango de bigint) derivado del horario."""
+    return int.from_bytes(hashlib.blake2b(slot.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class SlotLocks:
+    """Candados por horario; `hold(slot)` cede True si este request puede reservarlo."""
+
+    def __init__(self, client=None, prefix: str = "equilibra:slotlock:", ttl: float = 120.0,
+                 retry_after: int = 30):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+        self._held = set()
+        self._lock = threading.Lock()
+        self._counters = {"acquired": 0, "contended": 0, "redis": 0, "advisory": 0,
+                          "local_only": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _redis_available(self) -> bool:
+        return self.client is not None and time.time() >= self._disabled_until
+
+    def _redis_fail(self, operation: str, error: Exception) -> None:
+        self._count("errors")
+        self._disabled_until = time.time() + self.retry_after
+        logger.warning(f"Candados de horario en Redis no disponibles en {operation}: {error}")
+
+    def _acquire_redis(self, slot: str) -> Optional[str]:
+        """Token si se tomó, "" si lo tiene otro worker, None si Redis no respondió."""
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.client.set(self.prefix + slot, token, nx=True, px=int(self.ttl * 1000))
+        except Exception as e:
+            self._redis_fail("acquire", e)
+            return None
+        return token if acquired else ""
+
+    def _release_redis(self, slot: str, token: str) -> None:
+        try:
+            self.client.eval(RELEASE_LOCK_SCRIPT, 1, self.prefix + slot, token)
+        except Exception as e:
+            self._redis_fail("release", e)
+
+    def _acquire_advisory(self, slot: str) -> Optional[bool]:
+        """pg_try_advisory_xact_lock en la transacción en curso; None si la DB no lo soporta."""
+        from models import db
+        if db.session.get_bind().dialect.name != "postgresql":
+            return None
+        return bool(db.session.execute(
+            db.text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _advisory_key(slot)}
+        ).scalar())
+
+    @contextmanager
+    def hold(self, slot: str) -> Iterator[bool]:
+        with self._lock:
+            if slot in self._held:
+                self._counters["contended"] += 1
+                yield False
+                return
+            self._held.add(slot)
+
+        token = None
+        try:
+            acquired = True
+            if self._redis_available():
+                token = self._acquire_redis(slot)
+            if token:
+                self._count("redis")
+            elif token == "":
+                acquired = False
+            else:
+                advisory = self._acquire_advisory(slot)
+                if advisory is None:
+                    self._count("local_only")
+                else:
+                    acquired = advisory
+                    if advisory:
+                        self._count("advisory")
+
+            self._count("acquired" if acquired else "contended")
+            if not acquired:
+                logger.info(f"🔒 Horario {slot} en reserva por otro request")
+            yield acquired
+        finally:
+            if token:
+                self._release_redis(slot, token)
+            with self._lock:
+                self._held.discard(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            held = len(self._held)
+        return {"shared": self.client is not None, "redis_available": self._redis_available(),
+                "ttl_seconds": self.ttl, "held": held, **counters}
+
+
+def create_slot_locks(ttl: Optional[float] = None) -> SlotLocks:
+    """
+    SlotLocks coordinados entre workers si hay Redis compartido.
+    TTL: `ttl`, o SLOT_LOCK_TTL, o REQUEST_TIMEOUT (120 s, como el --timeout del Procfile).
+    """
+    if ttl is None:
+        ttl = float(os.getenv("SLOT_LOCK_TTL") or os.getenv("REQUEST_TIMEOUT", 120))
+    return SlotLocks(shared_redis_client("los candados de horario"), ttl=ttl)
@@ -62,7 +62,164 @@
       document.querySelector('form').submit();
     }
 
-    // Reiniciar chat 
+    // ===================== STREAMING DE RESPUESTAS (SSE) =====================
+    const chatForm = document.getElementById('chatForm');
+
+    function agregarBurbujaUsuario(mensaje) {
+      const chatBox = document.getElementById('chatBox');
+      const burbuja = document.createElement('div');
+      burbuja.className = 'message user';
+      burbuja.setAttribute('role', 'region');
+      const etiqueta = document.createElement('strong');
+      etiqueta.textContent = 'Tú:';
+      burbuja.append(etiqueta, document.createTextNode(' ' + mensaje));
+      chatBox.insertBefore(burbuja, document.getElementById('typingIndicator'));
+      scrollToBottom();
+      return burbuja;
+    }
+
+    function crearBurbujaBot() {
+      const chatBox = document.getElementById('chatBox');
+      const burbuja = document.createElement('div');
+      burbuja.className = 'message bot';
+      burbuja.setAttribute('role', 'complementary');
+
+      const header = document.createElement('div');
+      header.className = 'message-header';
+      const logo = document.querySelector('#typingIndicator .bot-logo');
+      if (logo) header.appendChild(logo.cloneNode());
+      const etiqueta = document.createElement('strong');
+      etiqueta.textContent = 'Equilibra:';
+      header.appendChild(etiqueta);
+
+      const texto = document.createElement('span');
+      burbuja.append(header, texto);
+      chatBox.insertBefore(burbuja, document.getElementById('typingIndicator'));
+      return texto;
+    }
+
+    function parsearEventoSSE(bloque) {
+      let tipo = 'message';
+      const datos = [];
+      bloque.split('\n').forEach(linea => {
+        if (linea.startsWith('event:')) tipo = linea.slice(6).trim();
+        else if (linea.startsWith('data:')) datos.push(linea.slice(5).trimStart());
+      });
+      if (!datos.length) return null;
+      try {
+        return { tipo, dato: JSON.parse(datos.join('\n')) };
+      } catch (error) {
+        return null;
+      }
+    }
+
+    // Envía el mensaje y pinta los fragmentos a medida que llegan.
+    // Retorna 'ocupado' (con el aviso del servidor) si está saturado, 'rechazado'
+    // si no aceptó el mensaje, 'completo' o 'incompleto'.
+    async function enviarMensajeStreaming(mensaje) {
+      const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+          'X-CSRFToken': window.__CSRF_TOKEN__
+        },
+        credentials: 'same-origin',
+        body: JSON.stringify({ user_input: mensaje })
+      });
+
+      if (response.status === 503) {
+        const datos = await response.json().catch(() => ({}));
+        return { estado: 'ocupado', mensaje: datos.error };
+      }
+      if (!response.ok || !response.body) return 'rechazado';
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let texto = null;
+      let completo = false;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let separador;
+        while ((separador = buffer.indexOf('\n\n')) !== -1) {
+          const evento = parsearEventoSSE(buffer.slice(0, separador));
+          buffer = buffer.slice(separador + 2);
+          if (!evento) continue;
+
+          if (!texto) {
+            ocultarEscribiendo();
+            texto = crearBurbujaBot();
+          }
+          if (evento.tipo === 'token') {
+            texto.textContent += evento.dato;
+          } else if (evento.tipo === 'done') {
+            // Texto final ya limpiado por el servidor
+            texto.textContent = evento.dato;
+            completo = true;
+          }
+          scrollToBottom();
+        }
+      }
+      return completo ? 'completo' : 'incompleto';
+    }
+
+    chatForm?.addEventListener('submit', async function(e) {
+      // Sin soporte de streams: envío tradicional del formulario
+      if (!window.ReadableStream || !window.TextDecoder) return;
+
+      const textarea = chatForm.querySelector('textarea[name="user_input"]');
+      const submitBtn = chatForm.querySelector('input[type="submit"]');
+      const mensaje = textarea.value.trim();
+      if (!mensaje) return;
+
+      e.preventDefault();
+      submitBtn.disabled = true;
+      textarea.disabled = true;
+      textarea.value = '';
+      const burbujaUsuario = agregarBurbujaUsuario(mensaje);
+      mostrarEscribiendo();
+
+      try {
+        const resultado = await enviarMensajeStreaming(mensaje);
+        if (resultado?.estado === 'ocupado') {
+          // Servidor saturado: el mensaje no se registró, se devuelve al campo de texto
+          burbujaUsuario.remove();
+          ocultarEscribiendo();
+          crearBurbujaBot().textContent = resultado.mensaje ||
+            'En este momento estoy atendiendo a muchas personas. Por favor, vuelve a enviar tu mensaje en unos segundos.';
+          scrollToBottom();
+          textarea.value = mensaje;
+        } else if (resultado === 'rechazado') {
+          // El servidor no registró el mensaje: reintentar con el flujo clásico
+          textarea.disabled = false;
+          textarea.value = mensaje;
+          chatForm.submit();
+          return;
+        }
+        if (resultado === 'incompleto') {
+          // El servidor completa la respuesta pendiente al recargar
+          window.location.href = '/';
+          return;
+        }
+      } catch (error) {
+        console.error('Error en streaming:', error);
+        window.location.href = '/';
+        return;
+      } finally {
+        ocultarEscribiendo();
+      }
+
+      submitBtn.disabled = false;
+      textarea.disabled = false;
+      textarea.focus();
+    });
+
+    // Reiniciar chat
     async function reiniciarChat() {
       mostrarEscribiendo();
       const btn = event.target.closest('button') || event.target;
@@ -125,16 +282,7 @@
     }
 
     // ===================== HORARIOS MEJORADOS =====================
-    const horariosPorDia = {
-      0: ["14:00", "15:00", "16:00", "17:00", "18:00", "19:00"],
-      1: ["14:00", "15:00", "16:00", "17:00", "18:00", "19:00"],
-      2: ["14:00", "15:00", "16:00", "17:00", "18:00", "19:00"],
-      3: ["14:00", "15:00", "16:00", "17:00", "18:00", "19:00"],
-      4: ["14:00", "15:00", "16:00", "17:00", "18:00", "19:00"],
-      5: ["08:00", "09:00", "10:00", "11:00", "12:00", "13:00", "14:00"],
-      6: []
-    };
-
+    // Los horarios de cada día los define el servidor (/obtener-horarios-disponibles)
     const fechaCitaInput = document.querySelector('input[name="fecha_cita"]');
     const selectDesktop = document.getElementById('selectHorariosDesktop');
     const botonesMobile = document.getElementById('botonesHorariosMobile');
@@ -165,6 +313,21 @@
       }
     }
 
+    // Clave de idempotencia de la reserva (la genera el servidor al renderizar el formulario)
+    function claveReserva() {
+      const campo = citaForm?.elements['idempotency_key'];
+      if (campo && !campo.value) nuevaClaveReserva();
+      return campo ? campo.value : '';
+    }
+
+    function nuevaClaveReserva() {
+      const campo = citaForm?.elements['idempotency_key'];
+      if (!campo) return;
+      campo.value = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID().replace(/-/g, '')
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
     async function verificarDisponibilidad(fecha, hora) {
       try {
         const response = await fetchWithRetry('/verificar-horario', {
@@ -324,19 +487,21 @@
         return;
       }
 
-      const opciones = horariosPorDia[dia] || [];
-      let horariosDisponibles = [];
-      
       try {
-        for (const hora of opciones) {
-          try {
-            const { disponible } = await verificarDisponibilidad(fecha, hora);
-            horariosDisponibles.push({ hora, disponible });
-          } catch (error) {
-            console.error(`Error verificando hora ${hora}:`, error);
-            horariosDisponibles.push({ hora, disponible: false, error: true });
-          }
+        // Una sola petición: el servidor consulta la ocupación del día una vez
+        const response = await fetchWithRetry('/obtener-horarios-disponibles', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': window.__CSRF_TOKEN__
+          },
+          body: JSON.stringify({ fecha })
+        });
+        if (!response.ok) {
+          throw new Error('Error al obtener horarios');
         }
+        const horariosDisponibles = (await response.json())
+          .map(({ hora, disponible }) => ({ hora, disponible }));
         
         horariosCache.set(fecha, horariosDisponibles);
         actualizarInterfazHorarios(horariosDisponibles);
@@ -349,12 +514,48 @@
       }
     }
 
+    // Próximos horarios libres: un clic elige fecha y hora sin probar día por día
+    async function cargarProximosHorarios() {
+      const contenedor = document.getElementById('proximosHorarios');
+      const lista = document.getElementById('proximosHorariosLista');
+      if (!contenedor || !lista) return;
+      try {
+        const response = await fetchWithRetry('/proximos-horarios?cantidad=4', { method: 'GET' });
+        if (!response.ok) return;
+        const { horarios } = await response.json();
+        if (!horarios || !horarios.length) return;
+
+        lista.innerHTML = '';
+        horarios.forEach(({ fecha, hora }) => {
+          const boton = document.createElement('button');
+          boton.type = 'button';
+          boton.className = 'boton-hora disponible';
+          boton.textContent = `${fecha} ${hora}`;
+          boton.addEventListener('click', async function() {
+            fechaCitaInput.value = fecha;
+            await cargarHorariosDisponibles(fecha);
+            horaSeleccionadaInput.value = hora;
+            if (selectDesktop) selectDesktop.value = hora;
+            document.querySelectorAll('#botonesHorariosMobile .boton-hora').forEach(btn => {
+              btn.classList.toggle('seleccionado', btn.dataset.hora === hora);
+            });
+          });
+          lista.appendChild(boton);
+        });
+        contenedor.style.display = 'block';
+      } catch (error) {
+        console.error('Error cargando próximos horarios:', error);
+      }
+    }
+
     // Detectar cambios de tamaño para alternar interfaces
     window.addEventListener('resize', function() {
         ajustarInterfazHorarios();
     });
 
     if (fechaCitaInput) {
+      cargarProximosHorarios();
+
       fechaCitaInput.addEventListener("change", async function() {
         if (this.value) await cargarHorariosDisponibles(this.value);
       });
@@ -412,12 +613,13 @@
         submitBtn.disabled = true;
         
         try {
-          // Enviar datos al endpoint real
-          const response = await fetch('/agendar-cita', {
+          // La misma clave en los reintentos: el servidor devuelve la reserva ya hecha
+          const response = await fetchWithRetry('/agendar-cita', {
             method: 'POST',
             headers: {
               'Content-Type': 'application/json',
-              'X-CSRFToken': window.__CSRF_TOKEN__
+              'X-CSRFToken': window.__CSRF_TOKEN__,
+              'Idempotency-Key': claveReserva()
             },
             body: JSON.stringify({
               fecha: fecha,
@@ -433,7 +635,8 @@
             // Éxito: redirigir a la página principal para mostrar estado final
             window.location.href = "/";
           } else {
-            // Error: mostrar mensaje específico
+            // Error: el siguiente intento es una reserva nueva
+            nuevaClaveReserva();
             alert(`Error: ${data.error || 'No se pudo agendar la cita'}`);
             submitBtn.value = originalText;
             submitBtn.disabled = false;
@@ -2,11 +2,12 @@
 Tareas asíncronas de Equilibra via Celery.
 
 Inicio del worker (desarrollo):
-    celery -A tasks.celery_app worker --loglevel=info
+    celery -A tasks.celery_app worker --beat --loglevel=info
 
 Inicio del worker (producción):
-    celery -A tasks.celery_app worker --loglevel=info --concurrency=2
+    celery -A tasks.celery_app worker --beat --loglevel=info --concurrency=2
 
+--beat ejecuta también las tareas programadas (celery_app.conf.beat_schedule).
 Requiere REDIS_URL en las variables de entorno.
 """
 import os
@@ -34,8 +35,44 @@ celery_app.conf.update(
     task_acks_late=True,
     worker_max_tasks_per_child=100,
     broker_connection_retry_on_startup=True,
+    beat_schedule={
+        'rotar-aperturas-por-sintoma': {
+            'task': 'tasks.warm_symptom_openings',
+            'schedule': 6 * 3600,
+            'kwargs': {'rotate': True},
+        },
+        'sincronizar-espejo-calendario': {
+            'task': 'tasks.sync_calendar_mirror',
+            'schedule': int(os.getenv('CALENDAR_SYNC_INTERVAL', 300)),
+        },
+        'drenar-outbox': {
+            'task': 'tasks.drain_outbox',
+            'schedule': int(os.getenv('OUTBOX_DRAIN_INTERVAL', 30)),
+        },
+        'renovar-canal-calendario': {
+            'task': 'tasks.renew_calendar_channel',
+            'schedule': 12 * 3600,
+        },
+    },
 )
 
+_db_app = None
+
+
+def _app_context():
+    """App context mínimo para las tareas que usan la DB (sin importar app.py ni sus hilos de arranque)."""
+    global _db_app
+    if _db_app is None:
+        from flask import Flask
+        from models import db
+        _db_app = Flask('equilibra-tasks')
+        _db_app.config.update(
+            SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///equilibra_dev.db'),
+            SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        )
+        db.init_app(_db_app)
+    return _db_app.app_context()
+
 
 @celery_app.task(
     bind=True,
@@ -67,3 +104,46 @@ def send_confirmation_email(
             f"Error enviando email (intento {self.request.retries + 1}/4): {exc}"
         )
         raise self.retry(exc=exc)
+
+
+@celery_app.task(name='tasks.drain_outbox', ignore_result=True)
+def drain_outbox() -> dict:
+    """
+    Ejecuta los efectos externos pendientes del outbox (Calendar, email) en lotes.
+    La encolan los requests tras su commit; beat la repite cada OUTBOX_DRAIN_INTERVAL s.
+    """
+    from services.outbox import drain_all
+    with _app_context():
+        return drain_all(batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', 50)))
+
+
+@celery_app.task(name='tasks.warm_symptom_openings', ignore_result=True)
+def warm_symptom_openings(rotate: bool = True) -> dict:
+    """
+    Genera aperturas por síntoma y las guarda en la caché compartida.
+    Programada cada 6 h con rotate=True: añade una apertura nueva por síntoma.
+    """
+    from services.conversation_service import warm_symptom_openings as _warm
+    return _warm(rotate=rotate)
+
+
+@celery_app.task(name='tasks.sync_calendar_mirror', ignore_result=True)
+def sync_calendar_mirror() -> dict:
+    """
+    Trae a la tabla espejo los cambios del calendario desde el último syncToken.
+    Programada cada CALENDAR_SYNC_INTERVAL s; también la encola el webhook push.
+    """
+    from services.calendar_mirror import sync_calendar_mirror as _sync
+    with _app_context():
+        return _sync()
+
+
+@celery_app.task(name='tasks.renew_calendar_channel', ignore_result=True)
+def renew_calendar_channel() -> dict:
+    """Abre o renueva el canal push del calendario si CALENDAR_WEBHOOK_URL está configurado."""
+    address = os.getenv('CALENDAR_WEBHOOK_URL')
+    if not address:
+        return {"ok": False, "error": "CALENDAR_WEBHOOK_URL no configurado"}
+    from services.calendar_mirror import watch_calendar
+    with _app_context():
+        return watch_calendar(address)
@@ -0,0 +1,81 @@
+"""Tests para BusyIntervalIndex — índice por día con bisect, TTL y write-through."""
+from datetime import datetime, timedelta
+
+import pytest
+from services.busy_index import LOCAL_TZ, BusyIntervalIndex
+
+BASE = datetime(2026, 6, 1, tzinfo=LOCAL_TZ)  # lunes
+
+
+def _h(dia, hora, minuto=0):
+    return BASE + timedelta(days=dia, hours=hora, minutes=minuto)
+
+
+class _Reloj:
+    def __init__(self):
+        self.now = BASE.timestamp() + 8 * 3600
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def reloj():
+    return _Reloj()
+
+
+@pytest.fixture()
+def consultas():
+    return []
+
+
+@pytest.fixture()
+def ocupado(consultas):
+    return [(_h(0, 15), _h(0, 16)), (_h(0, 15, 30), _h(0, 17)), (_h(2, 9), _h(2, 10))]
+
+
+@pytest.fixture()
+def indice(reloj, consultas, ocupado):
+    def fetch(time_min, time_max):
+        consultas.append((time_min, time_max))
+        return [(s, e) for s, e in ocupado if s < time_max and e > time_min]
+    return BusyIntervalIndex(fetch, horizon_days=30, ttl=60, clock=reloj)
+
+
+class TestBusyIntervalIndex:
+    def test_una_consulta_para_todo_el_horizonte(self, indice, consultas):
+        assert indice.is_busy(_h(0, 16), _h(0, 17)) is True
+        assert indice.is_busy(_h(0, 17), _h(0, 18)) is False
+        assert indice.is_busy(_h(2, 9), _h(2, 10)) is True
+        assert len(consultas) == 1
+        assert consultas[0][1] - consultas[0][0] == timedelta(days=30)
+
+    def test_fusiona_solapados(self, indice):
+        assert indice.busy(BASE.date()) == [(_h(0, 15), _h(0, 17))]
+
+    def test_fuera_del_horizonte_no_responde(self, indice):
+        assert indice.is_busy(_h(45, 9), _h(45, 10)) is None
+
+    def test_recarga_al_vencer_el_ttl(self, indice, consultas, reloj):
+        indice.is_busy(_h(0, 9), _h(0, 10))
+        reloj.now += 61
+        indice.is_busy(_h(0, 9), _h(0, 10))
+        assert len(consultas) == 2
+
+    def test_write_through_al_crear(self, indice, consultas):
+        version = indice.version
+        indice.add(_h(1, 14), _h(1, 15))
+        assert indice.is_busy(_h(1, 14), _h(1, 15)) is True
+        assert indice.version > version and len(consultas) == 1
+
+    def test_invalidar_dia_lo_vuelve_a_consultar_solo(self, indice, consultas, ocupado):
+        indice.is_busy(_h(2, 9), _h(2, 10))
+        ocupado.pop()  # cita cancelada en el calendario
+        indice.invalidate(_h(2, 0).date())
+        assert indice.is_busy(_h(2, 9), _h(2, 10)) is False
+        assert consultas[-1][1] - consultas[-1][0] == timedelta(days=1)
+
+    def test_fallo_de_carga_no_responde_desde_el_indice(self, reloj):
+        indice = BusyIntervalIndex(lambda a, b: None, clock=reloj)
+        assert indice.is_busy(_h(0, 9), _h(0, 10)) is None
+        assert indice.stats()["fetch_errors"] == 1
@@ -0,0 +1,171 @@
+"""Tests para el espejo local del calendario — syncToken, 410, webhook push y ocupación."""
+from datetime import date, datetime, timedelta
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from models import Appointment, CalendarEvent, CalendarSyncState, Patient, db
+from services import appointment_service, calendar_mirror
+from services.busy_index import LOCAL_TZ
+from scripts.simulate_calendar_push import push_headers
+
+
+def _evento(event_id, dia, hora, status="confirmed", **extra):
+    inicio = f"{dia}T{hora}:00-05:00"
+    fin = f"{dia}T{int(hora[:2]) + 1:02d}{hora[2:]}:00-05:00"
+    return {"id": event_id, "status": status, "start": {"dateTime": inicio},
+            "end": {"dateTime": fin}, "summary": f"Cita - {event_id}", **extra}
+
+
+class _FakeEvents:
+    """Imita service.events().list(...).execute() con páginas y syncToken."""
+
+    def __init__(self):
+        self.items = []
+        self.changes = []
+        self.token = 1
+        self.expired = set()
+        self.calls = []
+
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        self.calls.append(kwargs)
+        self._kwargs = kwargs
+        return self
+
+    def execute(self):
+        kwargs = self._kwargs
+        sync_token = kwargs.get("syncToken")
+        if sync_token in self.expired:
+            raise HttpError(httplib2.Response({"status": 410}), b'{"error": "fullSyncRequired"}')
+        items = list(self.changes) if sync_token else list(self.items)
+        page_size = kwargs["maxResults"]
+        offset = int(kwargs.get("pageToken") or 0)
+        page = {"items": items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            page["nextPageToken"] = str(offset + page_size)
+        else:
+            page["nextSyncToken"] = f"token-{self.token}"
+            self.token += 1
+            self.changes = []
+        return page
+
+
+@pytest.fixture()
+def espejo(app, db, monkeypatch):
+    monkeypatch.setattr(calendar_mirror, "_PAGE_SIZE", 2)
+    fake = _FakeEvents()
+    with app.app_context():
+        yield fake
+        db.session.rollback()
+        Appointment.query.delete()
+        Patient.query.delete()
+        CalendarEvent.query.delete()
+        CalendarSyncState.query.delete()
+        db.session.commit()
+
+
+@pytest.fixture()
+def manana():
+    return (date.today() + timedelta(days=1)).isoformat()
+
+
+class TestSincronizacion:
+    def test_primera_sincronizacion_completa_pagina_todo(self, espejo, manana):
+        espejo.items = [_evento(f"e{i}", manana, f"{9 + i:02d}:00") for i in range(5)]
+
+        resultado = calendar_mirror.sync_calendar_mirror(espejo)
+
+        assert resultado["ok"] and resultado["mode"] == "full"
+        assert resultado["pages"] == 3 and resultado["upserted"] == 5
+        assert CalendarEvent.query.count() == 5
+        assert db.session.get(CalendarSyncState, "primary").sync_token == "token-1"
+
+    def test_incremental_aplica_solo_los_cambios(self, espejo, manana):
+        espejo.items = [_evento("a", manana, "09:00"), _evento("b", manana, "10:00")]
+        calendar_mirror.sync_calendar_mirror(espejo)
+
+        espejo.changes = [_evento("a", manana, "09:00", status="cancelled"),
+                          _evento("c", manana, "15:00")]
+        resultado = calendar_mirror.sync_calendar_mirror(espejo)
+
+        assert resultado["mode"] == "incremental"
+        assert (resultado["upserted"], resultado["deleted"]) == (1, 1)
+        assert espejo.calls[-1]["syncToken"] == "token-1"
+        assert {e.event_id for e in CalendarEvent.query.all()} == {"b", "c"}
+
+    def test_token_vencido_fuerza_resincronizacion_completa(self, espejo, manana):
+        espejo.items = [_evento("a", manana, "09:00")]
+        calendar_mirror.sync_calendar_mirror(espejo)
+        espejo.expired.add("token-1")
+        espejo.items = [_evento("z", manana, "11:00")]
+
+        resultado = calendar_mirror.sync_calendar_mirror(espejo)
+
+        assert resultado["ok"] and resultado["mode"] == "full"
+        assert [e.event_id for e in CalendarEvent.query.all()] == ["z"]
+        assert db.session.get(CalendarSyncState, "primary").sync_token == "token-2"
+
+    def test_sync_from_calendar_crea_citas_desde_el_espejo(self, espejo, manana):
+        from services.calendar_sync_service import sync_from_calendar
+        espejo.items = [
+            _evento(f"e{i}", manana, f"{9 + i:02d}:00",
+                    summary=f"Cita - Paciente {i}", description=f"Teléfono: 099123456{i}")
+            for i in range(3)
+        ]
+
+        resultado = sync_from_calendar(espejo)
+
+        assert resultado["ok"] and resultado["created"] == 3
+        assert sync_from_calendar(espejo)["skipped"] == 3
+
+
+class TestOcupacionDesdeEspejo:
+    def test_intervalos_del_espejo_sin_consultar_freebusy(self, espejo, manana, monkeypatch):
+        espejo.items = [_evento("a", manana, "15:00"),
+                        _evento("libre", manana, "17:00", transparency="transparent")]
+        calendar_mirror.sync_calendar_mirror(espejo)
+        monkeypatch.setattr(appointment_service, "_consultar_freebusy",
+                            lambda *a: pytest.fail("no debería consultar freebusy"))
+
+        inicio = datetime.combine(date.fromisoformat(manana), datetime.min.time(), LOCAL_TZ)
+        ocupados = appointment_service._consultar_ocupacion(inicio, inicio + timedelta(days=1))
+
+        assert ocupados == [appointment_service.rango_horario(manana, "15:00")]
+
+    def test_espejo_desactualizado_vuelve_a_freebusy(self, espejo, monkeypatch):
+        calendar_mirror.sync_calendar_mirror(espejo)
+        estado = db.session.get(CalendarSyncState, "primary")
+        estado.last_sync = datetime.utcnow() - timedelta(seconds=calendar_mirror.MIRROR_MAX_AGE + 1)
+        monkeypatch.setattr(appointment_service, "_consultar_freebusy", lambda *a: ["freebusy"])
+
+        ahora = datetime.now(LOCAL_TZ)
+        assert appointment_service._consultar_ocupacion(ahora, ahora + timedelta(hours=1)) == ["freebusy"]
+
+
+class TestWebhook:
+    @pytest.fixture()
+    def encolado(self, monkeypatch):
+        llamadas = []
+        monkeypatch.setenv("CALENDAR_WEBHOOK_TOKEN", "secreto")
+        monkeypatch.setattr(calendar_mirror, "_last_push_sync", 0.0)
+        monkeypatch.setattr(calendar_mirror, "_schedule_sync", lambda app: llamadas.append(app) or "queued")
+        return llamadas
+
+    def test_cambio_dispara_sincronizacion(self, client, encolado):
+        r = client.post("/calendar/webhook", headers=push_headers("secreto"))
+        assert r.status_code == 200
+        assert len(encolado) == 1
+
+    def test_mensaje_sync_solo_se_confirma(self, client, encolado):
+        r = client.post("/calendar/webhook", headers=push_headers("secreto", state="sync"))
+        assert r.status_code == 200
+        assert encolado == []
+
+    def test_token_incorrecto_se_rechaza(self, client, encolado):
+        r = client.post("/calendar/webhook", headers=push_headers("otro"))
+        assert r.status_code == 403
+        assert encolado == []
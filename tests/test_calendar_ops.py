@@ -0,0 +1,213 @@
+"""Tests para las operaciones de Calendar en batch HTTP y la reparación desde el espejo."""
+import itertools
+from datetime import datetime, timedelta
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from models import Appointment, CalendarEvent, Patient, db
+from services import calendar_sync_service
+from services.calendar_ops import BATCH_LIMIT, CalendarBatch, status_patch_body
+from services.calendar_pool import CalendarClientPool
+
+
+class _Peticion:
+    def __init__(self, calendario, metodo, **kwargs):
+        self.calendario = calendario
+        self.metodo = metodo
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.calendario.ejecutar(self.metodo, **self.kwargs)
+
+
+class _Lote:
+    def __init__(self, calendario, callback):
+        self.calendario = calendario
+        self.callback = callback
+        self.peticiones = []
+
+    def add(self, request, request_id=None):
+        self.peticiones.append((request_id, request))
+
+    def execute(self):
+        self.calendario.round_trips += 1
+        if self.calendario.caido:
+            raise ConnectionResetError("reset")
+        for request_id, peticion in self.peticiones:
+            try:
+                self.callback(request_id, peticion.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+class FakeCalendarBatch:
+    """events() con get/patch/insert/delete sobre un dict y new_batch_http_request()."""
+
+    def __init__(self, eventos=None, caido=False):
+        self.eventos = dict(eventos or {})
+        self.caido = caido
+        self.round_trips = 0
+        self.llamadas = []
+
+    def events(self):
+        return self
+
+    def get(self, calendarId, eventId):
+        return _Peticion(self, "get", eventId=eventId)
+
+    def patch(self, calendarId, eventId, body):
+        return _Peticion(self, "patch", eventId=eventId, body=body)
+
+    def insert(self, calendarId, body):
+        return _Peticion(self, "insert", eventId=body.get("id"), body=body)
+
+    def delete(self, calendarId, eventId):
+        return _Peticion(self, "delete", eventId=eventId)
+
+    def new_batch_http_request(self, callback=None):
+        return _Lote(self, callback)
+
+    def ejecutar(self, metodo, eventId, body=None):
+        self.llamadas.append((metodo, eventId))
+        existe = eventId in self.eventos
+        if metodo == "insert" and existe:
+            raise HttpError(httplib2.Response({"status": 409}), b"duplicate")
+        if metodo in ("get", "patch", "delete") and not existe:
+            raise HttpError(httplib2.Response({"status": 404}), b"not found")
+        if metodo == "delete":
+            del self.eventos[eventId]
+            return ""
+        if metodo in ("patch", "insert"):
+            self.eventos[eventId] = {**self.eventos.get(eventId, {}), **body, "id": eventId}
+        return self.eventos[eventId]
+
+
+class TestCalendarBatch:
+    def test_un_round_trip_por_cada_50_operaciones(self):
+        fake = FakeCalendarBatch({f"e{i}": {} for i in range(120)})
+        batch = CalendarBatch(fake)
+        for i in range(120):
+            batch.patch(f"e{i}", {"description": "x"}, key=i)
+
+        resultados = batch.execute()
+
+        assert fake.round_trips == 3 == -(-120 // BATCH_LIMIT)
+        assert len(resultados) == 120 and all(r["ok"] for r in resultados.values())
+        assert len(batch) == 0
+
+    def test_resultado_por_operacion(self):
+        fake = FakeCalendarBatch({"existe": {"summary": "Cita"}})
+        batch = CalendarBatch(fake)
+        batch.get("existe", key="get")
+        batch.patch("no-existe", {"description": "x"}, key="patch")
+        batch.delete("no-existe", key="delete")
+        batch.insert({"id": "existe", "summary": "Cita"}, key="insert")
+
+        resultados = batch.execute()
+
+        assert resultados["get"]["ok"] and resultados["get"]["result"]["summary"] == "Cita"
+        assert not resultados["patch"]["ok"] and resultados["patch"]["status"] == 404
+        # Idempotentes: ya borrado / ya creado con ese ID
+        assert resultados["delete"]["ok"] and resultados["insert"]["ok"]
+        assert fake.round_trips == 1
+
+    def test_fallo_del_lote_marca_todas_sus_operaciones(self):
+        batch = CalendarBatch(FakeCalendarBatch({"a": {}}, caido=True))
+        batch.delete("a", key=1)
+        batch.delete("b", key=2)
+        resultados = batch.execute()
+        assert not resultados[1]["ok"] and not resultados[2]["ok"]
+        assert "reset" in resultados[1]["error"]
+
+
+def test_patch_de_estado_no_necesita_leer_el_evento():
+    cuerpo = status_patch_body("confirmed", "Teléfono del paciente: 0991234567\n")
+    assert cuerpo["description"] == "✅ CONFIRMADA\nTeléfono del paciente: 0991234567"
+    assert cuerpo["extendedProperties"]["private"]["equilibraStatus"] == "confirmed"
+
+
+@pytest.fixture()
+def calendario(app, db, monkeypatch):
+    fake = FakeCalendarBatch()
+    monkeypatch.setattr(calendar_sync_service, "calendar_client", CalendarClientPool(lambda: fake).lease)
+    with app.app_context():
+        yield fake
+        db.session.rollback()
+        CalendarEvent.query.delete()
+        Appointment.query.delete()
+        Patient.query.delete()
+        db.session.commit()
+
+
+_horas = itertools.count()
+
+
+def _cita(event_id, status, descripcion=None, en_calendar=True):
+    n = next(_horas)
+    paciente = Patient(name="Ana", phone=f"09{n:08d}")
+    db.session.add(paciente)
+    db.session.flush()
+    cita = Appointment(patient_id=paciente.id, scheduled_at=datetime(2030, 1, 7, 15) + timedelta(hours=n),
+                       symptom="Ansiedad", status=status, calendar_event_id=event_id)
+    db.session.add(cita)
+    if en_calendar:
+        db.session.add(CalendarEvent(calendar_id="primary", event_id=event_id, status="confirmed",
+                                     summary="Cita Psicológica - Ansiedad", description=descripcion,
+                                     start_at=cita.scheduled_at, end_at=cita.scheduled_at))
+    db.session.commit()
+    return cita
+
+
+class TestCambiosEnCalendar:
+    def test_patch_usa_la_descripcion_del_espejo_y_cambia_la_etiqueta(self, calendario):
+        cita = _cita("evt1", "completed", "✅ CONFIRMADA\nNota del psicólogo")
+        calendario.eventos["evt1"] = {}
+
+        resultados = calendar_sync_service.apply_calendar_changes([
+            {"key": 1, "action": "patch", "event_id": "evt1", "status": "completed", "appointment_id": cita.id},
+        ])
+
+        assert resultados[1]["ok"]
+        assert calendario.eventos["evt1"]["description"] == "✔️ COMPLETADA\nNota del psicólogo"
+        assert calendario.llamadas == [("patch", "evt1")]
+
+    def test_evento_fuera_del_espejo_conserva_la_descripcion_editada(self, calendario):
+        cita = _cita("evt1", "confirmed", en_calendar=False)
+        calendario.eventos["evt1"] = {"description": "⏳ PENDIENTE\nNota editada por la psicóloga"}
+
+        resultados = calendar_sync_service.apply_calendar_changes([
+            {"key": 1, "action": "patch", "event_id": "evt1", "status": "confirmed", "appointment_id": cita.id},
+        ])
+
+        assert resultados[1]["ok"]
+        assert calendario.eventos["evt1"]["description"] == "✅ CONFIRMADA\nNota editada por la psicóloga"
+        assert calendario.llamadas == [("get", "evt1"), ("patch", "evt1")]
+
+    def test_solo_se_envia_el_ultimo_cambio_de_cada_evento(self, calendario):
+        cita = _cita("evt1", "cancelled", "desc")
+        calendario.eventos["evt1"] = {}
+
+        resultados = calendar_sync_service.apply_calendar_changes([
+            {"key": 1, "action": "patch", "event_id": "evt1", "status": "confirmed", "appointment_id": cita.id},
+            {"key": 2, "action": "delete", "event_id": "evt1", "scheduled_at": cita.scheduled_at},
+        ])
+
+        assert resultados[1]["ok"] and resultados[1]["error"] == "superseded"
+        assert resultados[2]["ok"] and calendario.llamadas == [("delete", "evt1")]
+
+
+def test_reparacion_corrige_calendar_en_un_solo_lote(calendario):
+    _cita("cancelada", "cancelled", "desc")
+    _cita("sin_etiqueta", "confirmed", "Teléfono del paciente: 0991234567")
+    _cita("al_dia", "confirmed", "✅ CONFIRMADA\nTeléfono del paciente: 0991234567")
+    _cita("perdida", "confirmed", en_calendar=False)
+    calendario.eventos.update({"cancelada": {}, "sin_etiqueta": {}, "al_dia": {}})
+
+    resultado = calendar_sync_service.repair_calendar_events()
+
+    assert resultado == {"ok": True, "patched": 1, "deleted": 1, "failed": 0, "missing": 1}
+    assert calendario.round_trips == 1
+    assert "cancelada" not in calendario.eventos
+    assert calendario.eventos["sin_etiqueta"]["description"].startswith("✅ CONFIRMADA")
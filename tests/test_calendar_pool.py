@@ -0,0 +1,156 @@
+"""Tests para el pool de clientes de Google Calendar y la renovación de su token."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.calendar_pool import CalendarClientPool, TokenRefresher
+
+
+class _Fabrica:
+    def __init__(self):
+        self.creados = []
+
+    def __call__(self):
+        cliente = object()
+        self.creados.append(cliente)
+        return cliente
+
+
+class TestCalendarClientPool:
+    def test_reutiliza_clientes_libres(self):
+        fabrica = _Fabrica()
+        pool = CalendarClientPool(fabrica, size=2)
+        with pool.lease() as primero:
+            pass
+        with pool.lease() as segundo:
+            pass
+        assert primero is segundo
+        assert pool.stats()["created"] == 1
+
+    def test_hilos_concurrentes_reciben_clientes_distintos(self):
+        fabrica = _Fabrica()
+        pool = CalendarClientPool(fabrica, size=2)
+        dentro = threading.Barrier(2)
+        vistos = []
+
+        def usar():
+            with pool.lease() as cliente:
+                vistos.append(cliente)
+                dentro.wait(timeout=2)
+
+        hilos = [threading.Thread(target=usar) for _ in range(2)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        assert len(set(map(id, vistos))) == 2
+        assert pool.stats()["in_use"] == 0
+
+    def test_prestamo_anidado_reutiliza_el_cliente_del_hilo(self):
+        pool = CalendarClientPool(_Fabrica(), size=1, acquire_timeout=0.05)
+        with pool.lease() as externo:
+            with pool.lease() as interno:
+                assert interno is externo
+        assert pool.stats()["timeouts"] == 0
+
+    def test_sin_cliente_libre_espera_y_retorna_none(self):
+        pool = CalendarClientPool(_Fabrica(), size=1, acquire_timeout=0.05)
+        ocupado, liberar = threading.Event(), threading.Event()
+
+        def retener():
+            with pool.lease():
+                ocupado.set()
+                liberar.wait(timeout=2)
+
+        hilo = threading.Thread(target=retener)
+        hilo.start()
+        ocupado.wait(timeout=2)
+        with pool.lease() as cliente:
+            assert cliente is None
+        liberar.set()
+        hilo.join()
+
+        stats = pool.stats()
+        assert stats["timeouts"] == 1 and stats["waits"] == 1
+        assert stats["wait_max_ms"] >= 40
+
+    def test_error_de_red_descarta_el_cliente(self):
+        fabrica = _Fabrica()
+        pool = CalendarClientPool(fabrica, size=1)
+        with pytest.raises(OSError):
+            with pool.lease():
+                raise ConnectionResetError("reset")
+        with pool.lease() as cliente:
+            assert cliente is fabrica.creados[-1]
+        assert len(fabrica.creados) == 2
+        assert pool.stats()["discarded"] == 1
+
+    def test_sin_credenciales_retorna_none_y_libera_el_cupo(self):
+        pool = CalendarClientPool(lambda: None, size=1, acquire_timeout=0.05)
+        for _ in range(2):
+            with pool.lease() as cliente:
+                assert cliente is None
+        assert pool.stats()["timeouts"] == 0
+
+    def test_prefill_deja_clientes_listos(self):
+        fabrica = _Fabrica()
+        pool = CalendarClientPool(fabrica, size=3)
+        assert pool.prefill() == 3
+        with pool.lease() as cliente:
+            assert cliente in fabrica.creados
+        assert pool.stats()["created"] == 3
+
+
+class _Credencial:
+    def __init__(self, expira_en=None, falla=False):
+        self.token = "t" if expira_en is not None else None
+        self.expiry = datetime.utcnow() + timedelta(seconds=expira_en) if expira_en is not None else None
+        self.falla = falla
+        self.renovaciones = 0
+
+    def refresh(self, request):
+        if self.falla:
+            raise RuntimeError("sin red")
+        self.renovaciones += 1
+        self.token = "nuevo"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+class TestTokenRefresher:
+    def test_renueva_antes_del_margen(self):
+        assert TokenRefresher(_Credencial(), margin=300).seconds_until_due() == 0
+        assert TokenRefresher(_Credencial(expira_en=200), margin=300).seconds_until_due() == 0
+        assert 3200 < TokenRefresher(_Credencial(expira_en=3600), margin=300).seconds_until_due() <= 3300
+
+    def test_hilo_pide_el_primer_token_en_segundo_plano(self):
+        credencial = _Credencial()
+        refresher = TokenRefresher(credencial, request_factory=lambda: None)
+        refresher.start()
+        try:
+            for _ in range(100):
+                if credencial.renovaciones:
+                    break
+                time.sleep(0.01)
+            assert credencial.renovaciones == 1
+            assert refresher.stats()["running"]
+        finally:
+            refresher.stop()
+
+    def test_error_de_renovacion_queda_en_stats(self):
+        refresher = TokenRefresher(_Credencial(falla=True), request_factory=lambda: None)
+        assert refresher.refresh_now() is False
+        assert refresher.stats()["errors"] == 1 and refresher.stats()["last_error"] == "sin red"
+
+
+def test_cliente_se_construye_sin_red(monkeypatch):
+    from google.auth.credentials import AnonymousCredentials
+    from services import appointment_service
+    monkeypatch.setattr(appointment_service, "_load_calendar_credentials", lambda: AnonymousCredentials())
+    monkeypatch.setattr(appointment_service.httplib2.Http, "request",
+                        lambda *a, **k: pytest.fail("no debería haber tráfico de red"))
+
+    service = appointment_service._build_calendar_service()
+
+    assert service is not None and hasattr(service, "events")
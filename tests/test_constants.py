@@ -1,6 +1,9 @@
 """Tests para constants.py — crisis detection y lista de síntomas."""
 import pytest
-from constants import detectar_crisis, SINTOMAS_DISPONIBLES, CRISIS_RESPONSE
+from constants import (
+    detectar_crisis, buscar_crisis, CRISIS_CATEGORIES, CRISIS_PATTERNS,
+    SINTOMAS_DISPONIBLES, CRISIS_RESPONSE,
+)
 
 
 class TestDetectarCrisis:
@@ -26,6 +29,42 @@ class TestDetectarCrisis:
         assert isinstance(CRISIS_RESPONSE, str) and len(CRISIS_RESPONSE) > 10
 
 
+class TestBuscarCrisis:
+    def test_devuelve_categoria_y_span(self):
+        texto = "ya no quiero vivir así"
+        match = buscar_crisis(texto)
+        assert match.category == "ideacion_suicida"
+        assert texto[match.span[0]:match.span[1]] == match.matched == "no quiero vivir"
+
+    def test_mismas_coincidencias_que_patron_por_patron(self):
+        import re
+        textos = ["cambié los radios del auto", "estoy desesperadamente cansado",
+                  "una novela sin sentido", "me siento triste hoy", "postsuicidio"]
+        for texto in textos:
+            esperado = any(re.search(p, texto.lower()) for p in CRISIS_PATTERNS)
+            assert (buscar_crisis(texto) is not None) == esperado
+        assert buscar_crisis("cambié los radios del auto").matched == "adios"
+
+    def test_categoria_desesperanza(self):
+        assert buscar_crisis("Estoy harto de todo").category == "desesperanza"
+
+    def test_sin_coincidencia(self):
+        assert buscar_crisis("me siento triste hoy") is None
+
+    def test_cada_patron_se_detecta_en_su_categoria(self):
+        ejemplos = {
+            "ideacion_suicida": "acabar con mi vida",
+            "autolesion": "AUTOLESIÓN",
+            "desesperanza": "no puedo más",
+            "despedida": "quiero despedirme",
+        }
+        for categoria, texto in ejemplos.items():
+            assert buscar_crisis(texto).category == categoria
+
+    def test_lista_plana_cubre_todas_las_categorias(self):
+        assert len(CRISIS_PATTERNS) == sum(len(p) for p in CRISIS_CATEGORIES.values())
+
+
 class TestSintomasDisponibles:
     def test_lista_no_vacia(self):
         assert len(SINTOMAS_DISPONIBLES) > 0
@@ -0,0 +1,106 @@
+"""Tests para ConversationContextBuilder — ventana acotada y resumen incremental."""
+import pytest
+from services.ai_service import FallbackAIService
+from services.context_builder import ConversationContextBuilder
+from services.response_cache import ResponseCache
+
+
+class _InlineExecutor:
+    """Ejecuta el trabajo de fondo en el acto para que el test sea determinista."""
+
+    def __init__(self):
+        self.jobs = 0
+
+    def submit(self, fn, *args):
+        self.jobs += 1
+        fn(*args)
+
+
+def _historial(n):
+    return [
+        {"tipo": "user" if i % 2 == 0 else "bot", "mensaje": f"mensaje {i}"}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture()
+def resumenes():
+    return []
+
+
+@pytest.fixture()
+def builder(resumenes):
+    def summarizer(previo, turnos):
+        resumenes.append((previo, list(turnos)))
+        return (previo + " | " if previo else "") + ",".join(m for _, m in turnos)
+
+    return ConversationContextBuilder(
+        summarizer, window=4, summary_every=2,
+        cache=ResponseCache("test_resumen", ttl=60), executor=_InlineExecutor(),
+    )
+
+
+class TestContextBuilder:
+    def test_incluye_solo_la_ventana(self, builder):
+        contexto = builder.build("s1", _historial(4))
+        assert "Usuario: mensaje 0" in contexto and "Psicólogo: mensaje 3" in contexto
+        assert "Resumen" not in contexto
+
+    def test_resumen_incremental_cada_k_mensajes(self, builder, resumenes):
+        builder.build("s1", _historial(5))  # 1 mensaje fuera de la ventana: aún no
+        assert resumenes == []
+
+        builder.build("s1", _historial(6))  # 2 fuera: se resume
+        assert resumenes[-1] == ("", [("user", "mensaje 0"), ("bot", "mensaje 1")])
+
+        builder.build("s1", _historial(8))  # solo los 2 nuevos, sobre el resumen previo
+        assert resumenes[-1] == ("mensaje 0,mensaje 1", [("user", "mensaje 2"), ("bot", "mensaje 3")])
+        assert builder.get_summary("s1") == (4, "mensaje 0,mensaje 1 | mensaje 2,mensaje 3")
+
+    def test_tamano_acotado_aunque_crezca_el_historial(self, builder):
+        largo = "x" * 1000
+        historial = [{"tipo": "user", "mensaje": largo} for _ in range(50)]
+        contexto = builder.build("s2", historial)
+        assert "Últimos intercambios:" in contexto
+        assert len(contexto) <= len("Últimos intercambios:") + 4 * len("\nUsuario: " + "x" * 400)
+
+    def test_resumen_se_usa_en_el_contexto(self, builder):
+        builder.build("s3", _historial(6))
+        contexto = builder.build("s3", _historial(6))
+        assert contexto.startswith("Resumen de la conversación previa: mensaje 0,mensaje 1")
+
+    def test_historial_reiniciado_descarta_resumen(self, builder):
+        builder.build("s4", _historial(8))
+        contexto = builder.build("s4", _historial(2))
+        assert "Resumen" not in contexto
+
+
+class TestResumenPorDefecto:
+    def test_extractivo_conserva_mensajes_del_usuario_y_se_acota(self):
+        servicio = FallbackAIService()
+        resumen = servicio.summarize("", [("user", "duermo mal"), ("bot", "¿desde cuándo?")])
+        assert resumen == "El usuario comentó: duermo mal"
+        largo = servicio.summarize("a" * 900, [("user", "b")], max_chars=100)
+        assert len(largo) == 100 and largo.endswith("b")
+
+
+class TestPromptConContexto:
+    def test_prompt_incluye_intercambios_previos_sin_repetir_el_actual(self, app):
+        from flask import session
+        from services.conversation_service import ConversationService
+
+        with app.test_request_context("/"):
+            servicio = ConversationService()
+            servicio.initialize_session()
+            session["sintoma_actual"] = "Ansiedad"
+            servicio.add_user_interaction("No duermo bien")
+            servicio.add_bot_interaction("¿Desde cuándo te pasa?", "Ansiedad")
+            servicio.add_user_interaction("Hace dos semanas")
+
+            prompt = servicio._build_prompt("Ansiedad", "Hace dos semanas")
+            assert "Usuario: No duermo bien" in prompt
+            assert "Psicólogo: ¿Desde cuándo te pasa?" in prompt
+            assert prompt.count("Hace dos semanas") == 1
+
+            # La apertura no lleva contexto para seguir siendo cacheable
+            assert "Últimos intercambios" not in servicio._build_prompt("Ansiedad", "")
@@ -0,0 +1,184 @@
+"""Tests para la disponibilidad por día — una consulta al calendario para todos los horarios."""
+import json
+from datetime import date, timedelta
+
+import pytest
+from services import appointment_service
+from services.busy_index import BusyIntervalIndex
+from services.calendar_pool import CalendarClientPool
+from services.response_cache import ResponseCache
+
+
+def _usar_calendario(monkeypatch, service):
+    monkeypatch.setattr(appointment_service, "calendar_pool", CalendarClientPool(lambda: service))
+
+
+def _proximo_lunes():
+    hoy = date.today()
+    return (hoy + timedelta(days=7 - hoy.weekday())).isoformat()
+
+
+class _FakeCalendar:
+    """Imita service.freebusy().query(body=...).execute() y cuenta las consultas."""
+
+    def __init__(self, busy):
+        self.busy = busy
+        self.queries = []
+
+    def freebusy(self):
+        return self
+
+    def query(self, body):
+        self.queries.append(body)
+        return self
+
+    def execute(self):
+        return {"calendars": {"primary": {"busy": self.busy}}}
+
+
+@pytest.fixture(autouse=True)
+def indice_limpio(monkeypatch):
+    indice = BusyIntervalIndex(appointment_service._consultar_freebusy)
+    monkeypatch.setattr(appointment_service, "busy_index", indice)
+    monkeypatch.setattr(appointment_service, "_proximos_horarios_cache", ResponseCache("test_proximos", ttl=60))
+    return indice
+
+
+@pytest.fixture()
+def calendario(monkeypatch):
+    fecha = _proximo_lunes()
+    fake = _FakeCalendar([
+        {"start": f"{fecha}T15:00:00-05:00", "end": f"{fecha}T16:00:00-05:00"},
+        {"start": f"{fecha}T17:30:00-05:00", "end": f"{fecha}T18:15:00-05:00"},
+    ])
+    _usar_calendario(monkeypatch, fake)
+    return fecha, fake
+
+
+class TestDisponibilidadDia:
+    def test_marca_ocupados_con_una_sola_consulta(self, calendario):
+        fecha, fake = calendario
+        horarios = appointment_service.obtener_disponibilidad_dia(fecha)
+
+        ocupados = {h["hora"] for h in horarios if not h["disponible"]}
+        assert ocupados == {"15:00", "17:00", "18:00"}
+        assert len(horarios) == 6
+        assert len(fake.queries) == 1
+
+    def test_citas_pendientes_de_la_db_no_se_ofrecen(self, calendario, app, db):
+        from datetime import datetime
+        from models import Appointment, Patient
+
+        fecha, _ = calendario
+        with app.app_context():
+            paciente = Patient(name="Ana", phone="0990001515")
+            db.session.add(paciente)
+            db.session.flush()
+            for hora, estado in ((14, "pending"), (16, "cancelled")):
+                db.session.add(Appointment(patient_id=paciente.id, status=estado,
+                                           scheduled_at=datetime.strptime(f"{fecha} {hora}:00", "%Y-%m-%d %H:%M")))
+            db.session.commit()
+            try:
+                horarios = appointment_service.obtener_disponibilidad_dia(fecha)
+            finally:
+                Appointment.query.delete()
+                Patient.query.delete()
+                db.session.commit()
+
+        ocupados = {h["hora"] for h in horarios if not h["disponible"]}
+        assert ocupados == {"14:00", "15:00", "17:00", "18:00"}
+
+    def test_sin_calendario_nada_queda_disponible(self, monkeypatch):
+        _usar_calendario(monkeypatch, None)
+        horarios = appointment_service.obtener_disponibilidad_dia(_proximo_lunes())
+        assert horarios and not any(h["disponible"] for h in horarios)
+
+    def test_domingo_sin_horarios(self, calendario):
+        _, fake = calendario
+        domingo = (date.today() + timedelta(days=6 - date.today().weekday() + 7)).isoformat()
+        assert appointment_service.obtener_disponibilidad_dia(domingo) == []
+        assert fake.queries == []
+
+
+class TestEndpointHorarios:
+    def test_endpoint_retorna_ocupacion_real(self, client, calendario):
+        fecha, _ = calendario
+
+        r = client.post("/obtener-horarios-disponibles", data=json.dumps({"fecha": fecha}),
+                        content_type="application/json")
+        assert r.status_code == 200
+        assert {h["hora"]: h["disponible"] for h in r.get_json()}["15:00"] is False
+
+        r = client.post("/verificar-horario", data=json.dumps({"fecha": fecha, "hora": "16:00"}),
+                        content_type="application/json")
+        assert r.get_json() == {"disponible": True}
+
+
+class TestProximosHorarios:
+    @pytest.fixture()
+    def casi_lleno(self, monkeypatch):
+        """Todo ocupado salvo el próximo lunes a las 16:00."""
+        lunes = _proximo_lunes()
+        fake = _FakeCalendar([
+            {"start": "2000-01-01T00:00:00-05:00", "end": f"{lunes}T16:00:00-05:00"},
+            {"start": f"{lunes}T17:00:00-05:00", "end": "2100-01-01T00:00:00-05:00"},
+        ])
+        _usar_calendario(monkeypatch, fake)
+        return lunes, fake
+
+    def test_recorre_el_rango_con_una_consulta(self, casi_lleno):
+        lunes, fake = casi_lleno
+        assert appointment_service.buscar_proximos_horarios(3) == [{"fecha": lunes, "hora": "16:00"}]
+        assert len(fake.queries) == 1
+
+    def test_reserva_pendiente_en_la_db_se_salta_y_renueva_la_cache(self, monkeypatch, app, db):
+        from datetime import datetime
+        from models import Appointment, Patient
+
+        lunes = _proximo_lunes()
+        fake = _FakeCalendar([
+            {"start": "2000-01-01T00:00:00-05:00", "end": f"{lunes}T16:00:00-05:00"},
+            {"start": f"{lunes}T18:00:00-05:00", "end": "2100-01-01T00:00:00-05:00"},
+        ])
+        _usar_calendario(monkeypatch, fake)
+        with app.app_context():
+            libres = appointment_service.buscar_proximos_horarios(3)
+            assert [h["hora"] for h in libres] == ["16:00", "17:00"]
+
+            paciente = Patient(name="Ana", phone="0990001717")
+            db.session.add(paciente)
+            db.session.flush()
+            db.session.add(Appointment(patient_id=paciente.id, status="pending",
+                                       scheduled_at=datetime.strptime(f"{lunes} 16:00", "%Y-%m-%d %H:%M")))
+            db.session.commit()
+            try:
+                # El índice no cambió, pero la reserva de la DB sí cambia la clave de la caché
+                libres = appointment_service.buscar_proximos_horarios(3)
+            finally:
+                Appointment.query.delete()
+                Patient.query.delete()
+                db.session.commit()
+
+        assert libres == [{"fecha": lunes, "hora": "17:00"}]
+        assert len(fake.queries) == 1
+
+    def test_repetir_la_busqueda_sale_de_cache_hasta_que_cambia_la_ocupacion(self, casi_lleno, indice_limpio):
+        lunes, _ = casi_lleno
+        appointment_service.buscar_proximos_horarios(3)
+        assert appointment_service._proximos_horarios_cache.stats()["hits"] == 0
+        appointment_service.buscar_proximos_horarios(3)
+        assert appointment_service._proximos_horarios_cache.stats()["hits"] == 1
+
+        indice_limpio.add(*appointment_service.rango_horario(lunes, "16:00"))
+        assert appointment_service.buscar_proximos_horarios(3) == []
+
+    def test_endpoint(self, client, casi_lleno):
+        lunes, _ = casi_lleno
+        r = client.get("/proximos-horarios?cantidad=2")
+        assert r.status_code == 200
+        assert r.get_json() == {"horarios": [{"fecha": lunes, "hora": "16:00"}]}
+        assert client.get("/proximos-horarios?cantidad=x").status_code == 400
+
+    def test_endpoint_sin_calendario_retorna_503(self, client, monkeypatch):
+        _usar_calendario(monkeypatch, None)
+        assert client.get("/proximos-horarios").status_code == 503
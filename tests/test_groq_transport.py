@@ -0,0 +1,59 @@
+"""Tests para el transporte HTTP de Groq — pool con keep-alive y contadores de reutilización."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from services.groq_transport import TransportConfig, build_http_client, transport_stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"data": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def servidor():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestGroqTransport:
+    def test_reutiliza_la_conexion_entre_peticiones(self, servidor):
+        client = build_http_client(TransportConfig(http2=False), timeout=5)
+        for _ in range(3):
+            assert client.get(f"{servidor}/models").status_code == 200
+
+        stats = transport_stats(client).snapshot()
+        assert stats["requests"] == 3
+        assert (stats["new_connections"], stats["reused_connections"]) == (1, 2)
+        assert stats["http_versions"] == {"HTTP/1.1": 3}
+        client.close()
+
+    def test_sin_keepalive_abre_conexion_nueva(self, servidor):
+        client = build_http_client(TransportConfig(max_keepalive=0, http2=False), timeout=5)
+        client.get(f"{servidor}/models")
+        client.get(f"{servidor}/models")
+        assert transport_stats(client).snapshot()["new_connections"] == 2
+        client.close()
+
+    def test_configuracion_desde_entorno(self, monkeypatch):
+        monkeypatch.setenv("GROQ_POOL_MAX_CONNECTIONS", "4")
+        monkeypatch.setenv("GROQ_WARMUP", "false")
+        config = TransportConfig.from_env()
+        assert config.max_connections == 4 and config.warmup is False
+
+        monkeypatch.setenv("GROQ_KEEPALIVE_EXPIRY", "nope")
+        assert TransportConfig.from_env() == TransportConfig()
@@ -0,0 +1,160 @@
+"""Tests para HedgedExecutor — presupuesto p95, respaldo y plazo duro."""
+import time
+from types import SimpleNamespace
+
+from services.hedging import HedgedExecutor, HedgePolicy
+from services.model_router import ModelRouter
+from services.rate_governor import RateGovernor
+
+
+def _lenta(segundos, valor):
+    def llamada():
+        time.sleep(segundos)
+        return valor
+    return llamada
+
+
+class TestHedgedExecutor:
+    def test_principal_rapida_no_lanza_respaldo(self):
+        executor = HedgedExecutor(HedgePolicy(hedge_after=0.5, deadline=1))
+        llamadas = []
+        result = executor.run(lambda: "principal", lambda: llamadas.append(1) or "respaldo")
+        assert (result.value, result.outcome) == ("principal", "primary")
+        assert llamadas == []
+        assert executor.stats.snapshot()["hedges_launched"] == 0
+
+    def test_respaldo_gana_si_la_principal_excede_el_presupuesto(self):
+        executor = HedgedExecutor(HedgePolicy(hedge_after=0.05, deadline=1))
+        result = executor.run(_lenta(0.5, "principal"), lambda: "respaldo")
+        assert (result.value, result.outcome) == ("respaldo", "hedge")
+        assert result.elapsed < 0.4
+        assert executor.stats.snapshot()["hedges_launched"] == 1
+
+    def test_plazo_duro_devuelve_sin_valor(self):
+        executor = HedgedExecutor(HedgePolicy(hedge_after=0.02, deadline=0.1))
+        result = executor.run(_lenta(0.5, "principal"), _lenta(0.5, "respaldo"))
+        assert result.value is None and result.outcome == "deadline"
+        assert result.elapsed < 0.3
+        assert executor.stats.snapshot()["outcomes"]["deadline"] == 1
+
+    def test_error_de_la_principal_lanza_respaldo_de_inmediato(self):
+        executor = HedgedExecutor(HedgePolicy(hedge_after=5, deadline=10))
+
+        def falla():
+            raise ConnectionError("groq caído")
+
+        result = executor.run(falla, lambda: "respaldo")
+        assert (result.value, result.outcome) == ("respaldo", "hedge")
+        assert result.elapsed < 1
+
+    def test_todas_fallan(self):
+        executor = HedgedExecutor(HedgePolicy(hedge_after=5, deadline=10))
+
+        def falla():
+            raise ConnectionError("groq caído")
+
+        result = executor.run(falla)
+        assert result.value is None and result.outcome == "error"
+
+    def test_policy_desde_entorno(self, monkeypatch):
+        monkeypatch.setenv("AI_HEDGE_AFTER_SECONDS", "30")
+        monkeypatch.setenv("AI_DEADLINE_SECONDS", "12")
+        assert HedgePolicy.from_env() == HedgePolicy(hedge_after=12, deadline=12)
+
+
+class _FakeCompletions:
+    def __init__(self, demoras):
+        self.demoras = demoras
+        self.modelos = []
+
+    def create(self, model, **kwargs):
+        self.modelos.append(model)
+        time.sleep(self.demoras.get(model, 0))
+        return SimpleNamespace(
+            usage=SimpleNamespace(total_tokens=42),
+            choices=[SimpleNamespace(message=SimpleNamespace(content=f"**Respuesta** de {model}"))],
+        )
+
+
+def _servicio(demoras, policy):
+    from services.ai_service import FallbackAIService, GroqAIService
+    servicio = object.__new__(GroqAIService)
+    servicio.api_key = "test"
+    servicio.hedger = HedgedExecutor(policy)
+    servicio.fallback_service = FallbackAIService()
+    servicio.available_models = {"high_quality": "grande", "balanced": "medio", "fast": "rapido"}
+    servicio.router = ModelRouter(servicio.available_models)
+    servicio.governor = RateGovernor()
+    completions = _FakeCompletions(demoras)
+    servicio.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return servicio, completions
+
+
+class TestGroqConPresupuesto:
+    def test_modelo_rapido_responde_cuando_el_principal_se_demora(self):
+        servicio, completions = _servicio({"medio": 0.5}, HedgePolicy(hedge_after=0.05, deadline=1))
+        respuesta = servicio.generate_response("Me cuesta concentrarme últimamente", "Estrés")
+        assert respuesta == "Respuesta de rapido"
+        assert completions.modelos == ["medio", "rapido"]
+
+    def test_plazo_vencido_usa_fallback_sin_cachearlo(self):
+        from services.ai_service import FallbackAIService, GroqAIService
+        servicio, _ = _servicio({"medio": 0.5, "rapido": 0.5}, HedgePolicy(hedge_after=0.02, deadline=0.1))
+        texto = "Tengo problemas con mi familia desde hace meses"
+        respuesta = servicio.generate_response(texto, "Problemas familiares")
+        assert respuesta in FallbackAIService().predefined_responses["general"]
+        _, cached = GroqAIService.generate_response.cache_lookup(servicio, texto, "Problemas familiares")
+        assert cached is None
+
+    def test_crisis_se_evalua_solo_en_el_mensaje_actual(self):
+        servicio, completions = _servicio({}, HedgePolicy(hedge_after=5, deadline=10))
+        prompt = ('Resumen: el usuario dijo "ya no quiero vivir".\n'
+                  'Último mensaje del usuario: "{}"')
+        servicio.generate_response(prompt.format("Hoy dormí un poco mejor"), "Estrés",
+                                   user_input="Hoy dormí un poco mejor")
+        servicio.generate_response(prompt.format("Ya no quiero vivir así"), "Estrés",
+                                   user_input="Ya no quiero vivir así")
+        assert completions.modelos == ["medio", "grande"]
+
+    def test_mensaje_corto_va_a_la_ruta_normal_aunque_el_prompt_sea_largo(self):
+        servicio, completions = _servicio({}, HedgePolicy(hedge_after=5, deadline=10))
+        mensaje = "Hoy estuve mejor"
+        prompt = ("El usuario está experimentando: Tristeza.\n" + "Contexto previo. " * 20
+                  + f'Último mensaje del usuario: "{mensaje}"\n\nResponde de manera empática.')
+        servicio.generate_response(prompt, "Tristeza", user_input=mensaje)
+        assert completions.modelos == ["rapido"]
+        assert servicio.router.snapshot()["recent_decisions"][-1]["route"] == "normal"
+
+
+class _StreamFalso:
+    def __init__(self, fragmentos, usage):
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f))], x_groq=None)
+                  for f in fragmentos]
+        chunks.append(SimpleNamespace(choices=[], x_groq={"usage": usage}))
+        self._chunks = iter(chunks)
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        pass
+
+
+def test_streaming_alimenta_los_tokens_por_segundo_del_router():
+    servicio, completions = _servicio({}, HedgePolicy(hedge_after=5, deadline=10))
+    usage = {"completion_tokens": 120, "completion_time": 0.6, "total_tokens": 300}
+    completions.create = lambda model, **kwargs: _StreamFalso(["Hola, ", "te escucho."], usage)
+
+    respuesta = "".join(servicio.stream_response("Prompt de prueba para streaming", "Tristeza",
+                                                 user_input="Hola"))
+
+    assert respuesta == "Hola, te escucho."
+    assert servicio.router.snapshot()["models"]["rapido"]["tokens_per_second"] == 200.0
+
+
+def test_percentil_compartido_por_las_metricas():
+    from services.metrics import percentile
+
+    assert percentile([], 95) is None
+    assert percentile(iter([0.3, 0.1, 0.2]), 50) == 0.2
+    assert percentile([0.1, 0.2, 0.30049], 95) == 0.3
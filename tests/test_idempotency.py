@@ -0,0 +1,108 @@
+"""Tests para las claves de idempotencia de las reservas."""
+import threading
+
+import pytest
+
+from services.idempotency import (
+    IdempotencyInProgress,
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    LocalIdempotencyBackend,
+    RedisIdempotencyBackend,
+    request_fingerprint,
+    valid_idempotency_key,
+)
+
+CLAVE = "a1b2c3d4e5f6"
+
+
+class _Operacion:
+    def __init__(self, resultado=None):
+        self.resultado = resultado if resultado is not None else [True, "ok", 7]
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        return self.resultado
+
+
+class TestIdempotencyStore:
+    def test_repeticion_devuelve_el_resultado_guardado(self):
+        store = IdempotencyStore("prueba")
+        operacion = _Operacion()
+
+        assert store.execute(CLAVE, "h1", operacion) == ([True, "ok", 7], False)
+        assert store.execute(CLAVE, "h1", operacion) == ([True, "ok", 7], True)
+        assert operacion.llamadas == 1
+        assert store.stats()["replayed"] == 1
+
+    def test_misma_clave_con_otros_datos(self):
+        store = IdempotencyStore("prueba")
+        store.execute(CLAVE, "h1", _Operacion())
+        with pytest.raises(IdempotencyKeyReused):
+            store.execute(CLAVE, "h2", _Operacion())
+
+    def test_resultado_no_guardado_o_excepcion_libera_la_clave(self):
+        store = IdempotencyStore("prueba")
+        fallo = _Operacion([False, "ocupado", None])
+        store.execute(CLAVE, "h1", fallo, should_store=lambda r: r[0])
+        store.execute(CLAVE, "h1", fallo, should_store=lambda r: r[0])
+        assert fallo.llamadas == 2
+
+        def explota():
+            raise RuntimeError("DB caída")
+
+        with pytest.raises(RuntimeError):
+            store.execute("otra-clave-1", "h1", explota)
+        assert store.execute("otra-clave-1", "h1", _Operacion())[1] is False
+
+    def test_doble_clic_espera_al_original(self):
+        store = IdempotencyStore("prueba", poll_interval=0.01)
+        dentro, seguir = threading.Event(), threading.Event()
+        resultados = []
+
+        def lenta():
+            dentro.set()
+            seguir.wait(timeout=2)
+            return [True, "ok", 1]
+
+        hilo = threading.Thread(target=lambda: resultados.append(store.execute(CLAVE, "h1", lenta)))
+        hilo.start()
+        dentro.wait(timeout=2)
+        threading.Timer(0.05, seguir.set).start()
+
+        repetido = store.execute(CLAVE, "h1", _Operacion([False, "no", None]))
+        hilo.join()
+
+        assert repetido == ([True, "ok", 1], True)
+        assert resultados == [([True, "ok", 1], False)]
+
+    def test_original_que_no_termina(self):
+        store = IdempotencyStore("prueba", wait_timeout=0.05, poll_interval=0.01)
+        store.backend.claim(CLAVE, "pending:h1", 60)
+        with pytest.raises(IdempotencyInProgress):
+            store.execute(CLAVE, "h1", _Operacion())
+
+
+class _RedisCaido:
+    def set(self, *args, **kwargs):
+        raise ConnectionError("redis caído")
+
+    get = delete = set
+
+
+def test_sin_redis_usa_la_memoria_del_worker():
+    local = LocalIdempotencyBackend()
+    store = IdempotencyStore("prueba", backend=RedisIdempotencyBackend(_RedisCaido(), local))
+    operacion = _Operacion()
+
+    store.execute(CLAVE, "h1", operacion)
+    assert store.execute(CLAVE, "h1", operacion)[1] is True
+    assert operacion.llamadas == 1 and len(local) == 1
+
+
+def test_formato_de_clave_y_huella():
+    assert valid_idempotency_key("3f2a9c0e-77b1")
+    assert not valid_idempotency_key("corta")
+    assert not valid_idempotency_key("con espacios y más")
+    assert request_fingerprint({"a": 1, "b": 2}) == request_fingerprint({"b": 2, "a": 1})
@@ -0,0 +1,146 @@
+"""Tests para LLMExecutor — capacidad acotada, rechazo inmediato y métricas."""
+import json
+import threading
+
+import pytest
+from services.llm_executor import ExecutorBusy, LLMExecutor
+
+
+@pytest.fixture()
+def executor():
+    return LLMExecutor("test", max_workers=1, max_queue=1)
+
+
+def _bloqueada(evento):
+    def llamada():
+        evento.wait(2)
+        return "ok"
+    return llamada
+
+
+class TestLLMExecutor:
+    def test_rechaza_sin_esperar_cuando_esta_lleno(self, executor):
+        liberar = threading.Event()
+        en_curso = [executor.submit(_bloqueada(liberar)) for _ in range(2)]
+
+        with pytest.raises(ExecutorBusy):
+            executor.submit(lambda: "sobra")
+
+        stats = executor.stats()
+        assert stats["rejected"] == 1 and stats["saturation"] == 1.0
+        liberar.set()
+        assert [f.result(timeout=2) for f in en_curso] == ["ok", "ok"]
+
+    def test_libera_capacidad_al_terminar(self, executor):
+        assert executor.run(lambda: 1, timeout=2) == 1
+        with pytest.raises(ValueError):
+            executor.run(lambda: int("x"), timeout=2)
+        stats = executor.stats()
+        assert (stats["completed"], stats["failed"], stats["saturation"]) == (1, 1, 0.0)
+        assert stats["peak_in_use"] == 1 and stats["run_time_p50"] is not None
+
+    def test_stream_reemite_elementos_y_valor_final(self, executor):
+        def generador():
+            yield "a"
+            yield "b"
+            return "ab"
+
+        stream = executor.stream(generador)
+        assert next(stream) == "a" and next(stream) == "b"
+        with pytest.raises(StopIteration) as fin:
+            next(stream)
+        assert fin.value.value == "ab"
+
+    def test_stream_cerrado_detiene_el_generador(self, executor):
+        cerrado = threading.Event()
+
+        def infinito():
+            try:
+                while True:
+                    yield "x"
+            finally:
+                cerrado.set()
+
+        stream = executor.stream(infinito)
+        next(stream)
+        stream.close()
+        assert cerrado.wait(2)
+
+
+class TestChatSaturado:
+    def test_stream_responde_503_sin_registrar_el_mensaje(self, client, monkeypatch):
+        from services import conversation_service as cs
+
+        lleno = LLMExecutor("lleno", max_workers=1, max_queue=0)
+        liberar = threading.Event()
+        lleno.submit(_bloqueada(liberar))
+        monkeypatch.setattr(cs, "get_llm_executor", lambda: lleno)
+
+        with client.session_transaction() as s:
+            s["estado"] = "profundizacion"
+            s["sintoma_actual"] = "Ansiedad"
+            s["conversacion_data"] = {"interacciones": []}
+        r = client.post("/chat/stream", data=json.dumps({"user_input": "Me siento ansioso"}),
+                        content_type="application/json")
+        liberar.set()
+
+        assert r.status_code == 503 and r.get_json()["ocupado"] is True
+        with client.session_transaction() as s:
+            assert s["conversacion_data"]["interacciones"] == []
+            assert "respuesta_pendiente" not in s
+
+    def test_flujo_clasico_saturado_no_guarda_el_turno(self, client, monkeypatch):
+        from services import conversation_service as cs
+
+        lleno = LLMExecutor("lleno", max_workers=1, max_queue=0)
+        liberar = threading.Event()
+        lleno.submit(_bloqueada(liberar))
+        monkeypatch.setattr(cs, "get_llm_executor", lambda: lleno)
+
+        with client.session_transaction() as s:
+            s["estado"] = "profundizacion"
+            s["sintoma_actual"] = "Ansiedad"
+            s["conversacion_data"] = {"interacciones": []}
+        r = client.post("/", data={"user_input": "Hace días que no duermo"})
+        liberar.set()
+
+        assert r.status_code == 503 and "atendiendo a muchas personas" in r.get_data(as_text=True)
+        with client.session_transaction() as s:
+            assert s["conversacion_data"]["interacciones"] == []
+
+    def test_evaluacion_saturada_no_avanza_ni_guarda_el_turno(self, client, monkeypatch):
+        from services import conversation_service as cs
+
+        lleno = LLMExecutor("lleno", max_workers=1, max_queue=0)
+        liberar = threading.Event()
+        lleno.submit(_bloqueada(liberar))
+        monkeypatch.setattr(cs, "get_llm_executor", lambda: lleno)
+        monkeypatch.setattr(cs.opening_pool, "pick", lambda sintoma: None)
+
+        with client.session_transaction() as s:
+            s["estado"] = "evaluacion"
+            s["sintoma_actual"] = "Ansiedad"
+            s["conversacion_data"] = {"interacciones": []}
+        r = client.post("/", data={"fecha_inicio_sintoma": "2026-01-01"})
+        liberar.set()
+
+        assert r.status_code == 503 and "atendiendo a muchas personas" in r.get_data(as_text=True)
+        with client.session_transaction() as s:
+            assert s["estado"] == "evaluacion"
+            assert s["conversacion_data"]["interacciones"] == []
+
+    def test_respuesta_de_ocupado_en_el_flujo_clasico(self, app, monkeypatch):
+        from flask import session
+        from services import conversation_service as cs
+
+        lleno = LLMExecutor("lleno", max_workers=1, max_queue=0)
+        liberar = threading.Event()
+        lleno.submit(_bloqueada(liberar))
+        monkeypatch.setattr(cs, "get_llm_executor", lambda: lleno)
+
+        with app.test_request_context("/"):
+            servicio = cs.ConversationService()
+            servicio.initialize_session()
+            session["sintoma_actual"] = "Ansiedad"
+            assert servicio.get_conversation_response("Hace días que no duermo") == cs.RESPUESTA_OCUPADO
+        liberar.set()
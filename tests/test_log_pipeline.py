@@ -0,0 +1,94 @@
+"""Tests para el pipeline de logging — JSON, muestreo, cola no bloqueante y rotación multiproceso."""
+import atexit
+import json
+import logging
+import os
+import queue
+
+from services.log_pipeline import (
+    JsonFormatter, NonBlockingQueueHandler, ProcessSafeRotatingFileHandler, SamplingFilter, parse_level, parse_levels,
+)
+
+
+def _record(msg="hola %s", args=("mundo",), level=logging.INFO, lineno=10, **extra):
+    record = logging.LogRecord("services.test", level, "/app/x.py", lineno, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter:
+    def test_formatea_mensaje_y_campos_extra(self):
+        data = json.loads(JsonFormatter().format(_record(model="rapido")))
+        assert data["msg"] == "hola mundo"
+        assert data["level"] == "INFO" and data["logger"] == "services.test"
+        assert data["model"] == "rapido"
+
+
+class TestSamplingFilter:
+    def test_muestrea_debug_por_punto_de_llamada(self):
+        sampler = SamplingFilter(every=3)
+        kept = [sampler.filter(_record(level=logging.DEBUG)) for _ in range(6)]
+        assert kept == [True, False, False, True, False, False]
+        assert sampler.filter(_record(level=logging.DEBUG, lineno=99))
+        assert sampler.sampled_out == 4
+
+    def test_no_muestrea_info_ni_superiores(self):
+        sampler = SamplingFilter(every=100)
+        assert all(sampler.filter(_record(level=logging.WARNING)) for _ in range(5))
+
+
+class TestQueueHandler:
+    def test_encola_sin_formatear_y_descarta_si_esta_llena(self):
+        cola = queue.Queue(maxsize=1)
+        handler = NonBlockingQueueHandler(cola)
+        handler.handle(_record())
+        handler.handle(_record())
+        record = cola.get_nowait()
+        assert record.args == ("mundo",)  # el formateo queda para el listener
+        assert handler.dropped == 1
+
+
+class TestRotacion:
+    def test_reabre_si_otro_proceso_roto(self, tmp_path):
+        path = str(tmp_path / "app.log")
+        a = ProcessSafeRotatingFileHandler(path, maxBytes=60, backupCount=2)
+        b = ProcessSafeRotatingFileHandler(path, maxBytes=60, backupCount=2)
+        for handler in (a, b):
+            handler.setFormatter(logging.Formatter("%(message)s"))
+
+        a.emit(_record("x" * 40, ()))
+        b.emit(_record("y" * 40, ()))  # b rota: el archivo de a ya es app.log.1
+        a.emit(_record("z" * 10, ()))  # a debe escribir en el nuevo app.log
+        a.close()
+        b.close()
+
+        with open(path) as f:
+            actual = f.read()
+        assert "y" * 40 in actual and "z" * 10 in actual
+        assert os.path.exists(path + ".1")
+
+
+def test_parse_levels_ignora_entradas_invalidas():
+    niveles = parse_levels("services.ai_service=DEBUG, googleapiclient=warning,roto,x=NOPE")
+    assert niveles == {"services.ai_service": logging.DEBUG, "googleapiclient": logging.WARNING}
+
+
+def test_nivel_raiz_invalido_no_rompe_el_arranque(monkeypatch):
+    from services import log_pipeline
+
+    monkeypatch.setattr(log_pipeline, "_listener", None)
+    monkeypatch.setenv("LOG_LEVEL", "verbose")
+    monkeypatch.setenv("LOG_FILE", "")
+    raiz = logging.getLogger()
+    nivel_previo, handlers_previos = raiz.level, list(raiz.handlers)
+    listener = log_pipeline.setup_logging()
+    try:
+        assert raiz.level == logging.INFO
+        assert parse_level("verbose") is None and parse_level(" debug ") == logging.DEBUG
+    finally:
+        atexit.unregister(listener.stop)
+        listener.stop()
+        for handler in list(raiz.handlers):
+            if handler not in handlers_previos:
+                raiz.removeHandler(handler)
+        raiz.setLevel(nivel_previo)
@@ -0,0 +1,61 @@
+"""Tests para ModelRouter — elección por SLO, 429 y crisis fijada a calidad."""
+from types import SimpleNamespace
+
+import pytest
+from services.model_router import ModelRouter
+
+MODELOS = {"high_quality": "grande", "balanced": "medio", "fast": "rapido"}
+
+
+@pytest.fixture()
+def router():
+    return ModelRouter(MODELOS, slo_seconds={"normal": 2.0, "complejo": 5.0}, min_samples=3)
+
+
+def _registrar(router, modelo, latencia, n=5, **kwargs):
+    for _ in range(n):
+        router.record(modelo, latencia, **kwargs)
+
+
+class TestModelRouter:
+    def test_sin_datos_elige_el_mas_barato(self, router):
+        assert router.choose(20, "normal").model == "rapido"
+        assert router.choose(20, "complejo").model == "medio"
+
+    def test_crisis_siempre_calidad(self, router):
+        _registrar(router, "grande", 30.0)
+        decision = router.choose(20, "crisis")
+        assert decision.model == "grande" and decision.route == "crisis"
+
+    def test_modelo_lento_se_descarta(self, router):
+        _registrar(router, "rapido", 3.5)
+        _registrar(router, "medio", 1.0)
+        decision = router.choose(20, "normal")
+        assert decision.model == "medio"
+        assert "fast" in decision.reason
+
+    def test_429_reciente_enfria_el_modelo(self, router):
+        router.record("rapido", None, ok=False, rate_limited=True)
+        assert router.choose(20, "normal").model == "medio"
+
+    def test_tasa_de_errores(self, router):
+        _registrar(router, "medio", None, ok=False)
+        assert router.choose(150, "normal").model == "grande"
+
+    def test_ninguno_cumple_elige_menor_p95(self, router):
+        _registrar(router, "medio", 9.0)
+        _registrar(router, "grande", 7.0)
+        decision = router.choose(150, "normal")
+        assert decision.model == "grande"
+        assert decision.reason.startswith("ninguno cumple")
+
+    def test_tokens_por_segundo_desde_usage(self, router):
+        usage = SimpleNamespace(completion_tokens=200, completion_time=0.5)
+        router.record("rapido", 0.8, usage=usage)
+        assert router.snapshot()["models"]["rapido"]["tokens_per_second"] == 400.0
+
+    def test_snapshot_expone_decisiones(self, router):
+        router.choose(20, "normal")
+        snapshot = router.snapshot()
+        assert snapshot["recent_decisions"][-1]["model"] == "rapido"
+        assert snapshot["routes"]["crisis"] == ["grande"]
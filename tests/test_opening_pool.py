@@ -0,0 +1,58 @@
+"""Tests para OpeningPool — aperturas precalculadas por síntoma."""
+import pytest
+from services.opening_pool import OpeningPool, warm_openings
+from services.response_cache import ResponseCache
+
+
+@pytest.fixture()
+def pool():
+    return OpeningPool(size=2, cache=ResponseCache("test_aperturas", ttl=60))
+
+
+class TestOpeningPool:
+    def test_vacio_retorna_none(self, pool):
+        assert pool.pick("Ansiedad") is None
+        assert pool.stats()["empty"] == 1
+
+    def test_rota_descartando_la_mas_antigua(self, pool):
+        for texto in ("uno", "dos", "tres"):
+            pool.add("Ansiedad", texto)
+        assert pool.get_all("Ansiedad") == ["dos", "tres"]
+        assert pool.pick("Ansiedad") in ("dos", "tres")
+
+    def test_pools_separados_por_sintoma(self, pool):
+        pool.add("Ansiedad", "a")
+        assert pool.get_all("Tristeza") == []
+
+
+class TestWarmOpenings:
+    def test_sin_rotar_solo_rellena_vacios(self, pool):
+        pool.add("Ansiedad", "existente")
+        llamadas = []
+        result = warm_openings(pool, ["Ansiedad", "Tristeza"], lambda s: llamadas.append(s) or f"apertura {s}")
+        assert llamadas == ["Tristeza"]
+        assert result == {"generated": 1, "skipped": 1, "failed": 0}
+
+    def test_rotar_genera_para_todos(self, pool):
+        pool.add("Ansiedad", "existente")
+        warm_openings(pool, ["Ansiedad", "Tristeza"], lambda s: f"nueva {s}", rotate=True)
+        assert pool.get_all("Ansiedad") == ["existente", "nueva Ansiedad"]
+
+    def test_se_detiene_si_la_ia_no_responde(self, pool):
+        llamadas = []
+        result = warm_openings(pool, [f"s{i}" for i in range(10)],
+                               lambda s: llamadas.append(s), max_consecutive_failures=3)
+        assert len(llamadas) == 3 and result["failed"] == 3
+
+
+class TestEvaluacionUsaElPool:
+    def test_respuesta_de_apertura_sale_del_pool(self, app):
+        from flask import session
+        from services import conversation_service as cs
+
+        cs.opening_pool.add("Insomnio", "Apertura precalculada sobre el insomnio")
+        with app.test_request_context("/"):
+            servicio = cs.ConversationService()
+            servicio.initialize_session()
+            session["sintoma_actual"] = "Insomnio"
+            assert servicio.get_conversation_response("") == "Apertura precalculada sobre el insomnio"
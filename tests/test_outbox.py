@@ -0,0 +1,130 @@
+"""Tests para el outbox transaccional de efectos externos (Calendar, email)."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Appointment, OutboxMessage, Patient, db
+from services import calendar_sync_service, outbox, outbox_handlers  # noqa: F401  (handlers reales)
+from services.calendar_pool import CalendarClientPool
+from tests.test_calendar_ops import FakeCalendarBatch
+
+
+@pytest.fixture()
+def bandeja(app, db, monkeypatch):
+    monkeypatch.setattr(outbox, "_handlers", {})
+    with app.app_context():
+        yield
+        db.session.rollback()
+        OutboxMessage.query.delete()
+        Appointment.query.delete()
+        Patient.query.delete()
+        db.session.commit()
+
+
+def _cita_con_evento(event_id):
+    paciente = Patient(phone="0991234567", name="Ana")
+    db.session.add(paciente)
+    db.session.flush()
+    cita = Appointment(patient_id=paciente.id, scheduled_at=datetime(2030, 1, 7, 15),
+                       status="pending", symptom="Ansiedad", calendar_event_id=event_id)
+    db.session.add(cita)
+    db.session.commit()
+    return cita
+
+
+def _registrar(kind, fn):
+    outbox.register_handler(kind)(fn)
+
+
+class TestDrain:
+    def test_ejecuta_el_handler_y_marca_hecho(self, bandeja):
+        vistos = []
+        _registrar("prueba", vistos.append)
+        outbox.enqueue("prueba", {"n": 1})
+        db.session.commit()
+
+        resultado = outbox.drain()
+
+        assert resultado["done"] == 1 and vistos == [{"n": 1}]
+        mensaje = OutboxMessage.query.one()
+        assert mensaje.status == "done" and mensaje.processed_at is not None
+        assert outbox.drain()["claimed"] == 0
+
+    def test_rollback_del_llamador_descarta_el_mensaje(self, bandeja):
+        outbox.enqueue("prueba", {})
+        db.session.rollback()
+        assert OutboxMessage.query.count() == 0
+
+    def test_fallo_se_reintenta_con_espera_y_luego_queda_failed(self, bandeja):
+        def falla(payload):
+            raise RuntimeError("Calendar caído")
+
+        _registrar("prueba", falla)
+        outbox.enqueue("prueba", {})
+        db.session.commit()
+
+        assert outbox.drain(max_attempts=2)["retry"] == 1
+        mensaje = OutboxMessage.query.one()
+        assert mensaje.status == "pending" and mensaje.last_error == "Calendar caído"
+        assert mensaje.available_at > datetime.utcnow() + timedelta(seconds=20)
+        # Aún en espera: el siguiente drenado no lo toca
+        assert outbox.drain(max_attempts=2)["claimed"] == 0
+
+        mensaje.available_at = datetime.utcnow()
+        db.session.commit()
+        assert outbox.drain(max_attempts=2)["failed"] == 1
+        assert OutboxMessage.query.one().status == "failed"
+
+    def test_stats_muestran_backlog(self, bandeja):
+        outbox.enqueue("prueba", {})
+        db.session.commit()
+        stats = outbox.get_outbox_stats()
+        assert stats["backlog"] == 1 and stats["oldest_pending_seconds"] >= 0
+
+
+class TestHandlersCalendar:
+    def test_cambios_de_estado_salen_en_un_solo_batch(self, bandeja, monkeypatch):
+        fake = FakeCalendarBatch({"evt1": {}, "evt2": {}})
+        monkeypatch.setattr(calendar_sync_service, "calendar_client", CalendarClientPool(lambda: fake).lease)
+        cita = _cita_con_evento("evt1")
+        outbox.enqueue("calendar.patch", {"event_id": "evt1", "status": "confirmed"}, cita.id)
+        outbox.enqueue("calendar.delete", {"event_id": "evt2", "scheduled_at": "2030-01-08T15:00:00"})
+        outbox.enqueue("calendar.delete", {"event_id": "ya-borrado", "scheduled_at": None})
+        db.session.commit()
+
+        resultado = outbox.drain()
+
+        # Un lote para leer el evento que no está en el espejo y otro con los tres cambios
+        assert resultado["done"] == 3 and fake.round_trips == 2
+        assert fake.eventos["evt1"]["description"].startswith("✅ CONFIRMADA")
+        assert "evt2" not in fake.eventos
+
+    def test_error_de_un_evento_solo_reintenta_ese_mensaje(self, bandeja, monkeypatch):
+        fake = FakeCalendarBatch({"evt1": {}})
+        monkeypatch.setattr(calendar_sync_service, "calendar_client", CalendarClientPool(lambda: fake).lease)
+        cita = _cita_con_evento("evt1")
+        outbox.enqueue("calendar.patch", {"event_id": "evt1", "status": "completed"}, cita.id)
+        outbox.enqueue("calendar.patch", {"event_id": "no-existe", "status": "completed"}, cita.id)
+        db.session.commit()
+
+        resultado = outbox.drain()
+
+        assert resultado["done"] == 1 and resultado["retry"] == 1
+        fallido = OutboxMessage.query.filter_by(status="pending").one()
+        assert "no-existe" in fallido.payload and "404" in fallido.last_error
+
+    def test_cambio_de_estado_se_encola_con_la_cita(self, bandeja):
+        cita = _cita_con_evento("evt1")
+
+        cita.status = "cancelled"
+        assert calendar_sync_service.queue_calendar_status_change(cita, "cancelled")
+        db.session.commit()
+
+        mensaje = OutboxMessage.query.one()
+        assert mensaje.kind == "calendar.delete" and mensaje.appointment_id == cita.id
+        assert json.loads(mensaje.payload) == {"event_id": "evt1", "scheduled_at": "2030-01-07T15:00:00"}
+
+    def test_cita_sin_evento_no_encola_nada(self, bandeja):
+        assert not calendar_sync_service.queue_calendar_status_change(Appointment(status="pending"), "confirmed")
+        assert OutboxMessage.query.count() == 0
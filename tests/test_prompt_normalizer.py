@@ -0,0 +1,72 @@
+"""Tests para PromptNormalizer — claves de caché canónicas y métricas por regla."""
+from services.prompt_normalizer import PromptNormalizer, scope_slug
+
+
+class TestNormalize:
+    def test_variantes_producen_el_mismo_texto(self):
+        n = PromptNormalizer()
+        a = n.normalize("Me siento ansioso")
+        b = n.normalize("me siento  ansioso.")
+        c = n.normalize("¡ME SIENTO ANSIÓSO!")
+        assert a == b == c
+
+    def test_conserva_la_enie(self):
+        n = PromptNormalizer()
+        assert n.normalize("Hace un año") != n.normalize("Hace un ano")
+
+
+class TestAtribucionPorRegla:
+    PLANTILLA = 'El usuario está experimentando: Ansiedad.\nÚltimo mensaje: "{}"'
+
+    def _consultar(self, n, texto, clave="k"):
+        huella = n.fingerprint([self.PLANTILLA.format(texto)])
+        return clave, huella
+
+    def test_acierto_exacto(self):
+        n = PromptNormalizer()
+        n.remember(*self._consultar(n, "Me siento ansioso"))
+        n.record(*self._consultar(n, "Me siento ansioso"), hit=True)
+        stats = n.stats()
+        assert stats["exact_hits"] == 1
+        assert all(r["hits_enabled"] == 0 for r in stats["rules"].values())
+
+    def test_acierto_atribuido_solo_a_las_reglas_necesarias(self):
+        n = PromptNormalizer()
+        n.remember(*self._consultar(n, "Me siento ansioso"))
+        n.record(*self._consultar(n, "me siento  ansioso"), hit=True)
+        rules = n.stats()["rules"]
+        assert rules["case"]["hits_enabled"] == 1
+        assert rules["whitespace"]["hits_enabled"] == 1
+        # La plantilla tiene tildes y puntuación, pero no cambian entre consultas
+        assert rules["accents"]["hits_enabled"] == 0
+        assert rules["punctuation"]["hits_enabled"] == 0
+
+    def test_acierto_sin_origen_conocido(self):
+        n = PromptNormalizer()
+        n.record(*self._consultar(n, "hola"), hit=True)
+        assert n.stats()["unattributed_hits"] == 1
+
+
+class TestScopeSlug:
+    def test_slug_de_sintoma(self):
+        assert scope_slug("Problemas de sueño") == "problemas-de-sueño"
+        assert scope_slug(None) == "general"
+
+
+class TestCacheResponseNormalizado:
+    def test_mensajes_casi_identicos_acierta_en_cache(self):
+        from services.ai_service import cache_response
+
+        llamadas = []
+
+        class Servicio:
+            @cache_response(max_size=10, ttl=60, normalize_args=("text",), scope_arg="symptom")
+            def generar(self, text, symptom=None):
+                llamadas.append(text)
+                return f"respuesta para {text} ({symptom})"
+
+        s = Servicio()
+        s.generar("Me siento ansioso", "Ansiedad")
+        s.generar("me siento  ansioso.", "Ansiedad")
+        s.generar("Me siento ansioso", "Tristeza")
+        assert len(llamadas) == 2
@@ -0,0 +1,129 @@
+"""Tests para RateGovernor — buckets por modelo, prioridades y degradación."""
+import threading
+import time
+
+from services.rate_governor import (
+    BACKGROUND, CRISIS, INTERACTIVE, LocalBuckets, ModelLimits, RateGovernor, RedisBuckets,
+)
+
+
+class _BrokenRedis:
+    def eval(self, *args):
+        raise ConnectionError("redis caído")
+
+
+class TestBuckets:
+    def test_consume_y_calcula_espera(self):
+        buckets = LocalBuckets()
+        limits = ModelLimits(rpm=2, tpm=1000)
+        assert buckets.take("m", limits, 1, 100) == 0
+        assert buckets.take("m", limits, 1, 100) == 0
+        espera = buckets.take("m", limits, 1, 100)
+        assert 25 < espera <= 30  # 1 request se repone en 60/2 s
+
+    def test_limite_de_tokens(self):
+        buckets = LocalBuckets()
+        assert buckets.take("m", ModelLimits(rpm=100, tpm=1000), 1, 900) == 0
+        assert buckets.take("m", ModelLimits(rpm=100, tpm=1000), 1, 900) > 0
+
+    def test_redis_caido_usa_buckets_locales(self):
+        buckets = RedisBuckets(_BrokenRedis())
+        assert buckets.take("m", ModelLimits(rpm=1, tpm=1000), 1, 10) == 0
+        assert buckets.take("m", ModelLimits(rpm=1, tpm=1000), 1, 10) > 0
+
+
+class TestRateGovernor:
+    def test_rechaza_sin_esperar_si_no_habra_capacidad_a_tiempo(self):
+        governor = RateGovernor(default=ModelLimits(rpm=1, tpm=10_000))
+        assert governor.acquire("m", 10, CRISIS).granted
+        inicio = time.monotonic()
+        admission = governor.acquire("m", 10, INTERACTIVE)
+        assert not admission.granted
+        assert time.monotonic() - inicio < 0.5
+        assert governor.snapshot()["models"]["m"]["rejected"] == 1
+
+    def test_fondo_respeta_la_reserva(self):
+        governor = RateGovernor(default=ModelLimits(rpm=10, tpm=10_000), max_wait={BACKGROUND: 0})
+        for _ in range(7):
+            assert governor.acquire("m", 10, CRISIS).granted
+        # Quedan 3 de 10: por debajo de 1 + 30 % de reserva para tareas de fondo
+        assert not governor.acquire("m", 10, BACKGROUND).granted
+        assert governor.acquire("m", 10, INTERACTIVE, max_wait=0).granted
+
+    def test_crisis_adelanta_a_la_cola(self):
+        governor = RateGovernor(default=ModelLimits(rpm=600, tpm=1_000_000),
+                                max_wait={INTERACTIVE: 2, CRISIS: 2}, reserve={INTERACTIVE: 0})
+        while governor.acquire("m", 1, CRISIS, max_wait=0).granted:
+            pass
+        orden = []
+
+        def pedir(prioridad, etiqueta):
+            if governor.acquire("m", 1, prioridad).granted:
+                orden.append(etiqueta)
+
+        interactivo = threading.Thread(target=pedir, args=(INTERACTIVE, "interactivo"))
+        interactivo.start()
+        time.sleep(0.02)
+        crisis = threading.Thread(target=pedir, args=(CRISIS, "crisis"))
+        crisis.start()
+        interactivo.join(3)
+        crisis.join(3)
+        assert orden[0] == "crisis"
+
+    def test_cola_de_un_modelo_no_bloquea_a_otro(self):
+        governor = RateGovernor(default=ModelLimits(rpm=60, tpm=1_000_000))
+        while governor.acquire("grande", 1, CRISIS, max_wait=0).granted:
+            pass
+        esperando = threading.Thread(target=governor.acquire, args=("grande", 1, CRISIS, 2))
+        esperando.start()
+        time.sleep(0.02)
+        # Degradación al modelo rápido mientras una crisis espera al grande
+        assert governor.acquire("rapido", 10, INTERACTIVE, max_wait=0).granted
+        esperando.join(2)
+
+    def test_buckets_se_consultan_sin_retener_la_condicion(self):
+        class _BucketsLentos(LocalBuckets):
+            def take(self, model, *args, **kwargs):
+                if model == "lento":
+                    time.sleep(0.3)
+                return super().take(model, *args, **kwargs)
+
+        governor = RateGovernor(buckets=_BucketsLentos())
+        lento = threading.Thread(target=governor.acquire, args=("lento", 10, INTERACTIVE))
+        lento.start()
+        time.sleep(0.02)
+        inicio = time.monotonic()
+        assert governor.acquire("rapido", 10, INTERACTIVE).granted
+        assert time.monotonic() - inicio < 0.2
+        lento.join(2)
+
+    def test_reconcile_devuelve_tokens(self):
+        governor = RateGovernor(default=ModelLimits(rpm=100, tpm=1000))
+        assert governor.acquire("m", 900, CRISIS).granted
+        governor.reconcile("m", 900, 100)
+        assert governor.acquire("m", 700, CRISIS, max_wait=0).granted
+
+
+class TestDegradacionEnGroq:
+    def test_interactivo_baja_al_modelo_rapido(self):
+        from tests.test_hedging import _servicio
+        from services.hedging import HedgePolicy
+        servicio, completions = _servicio({}, HedgePolicy(hedge_after=5, deadline=5))
+        servicio.governor = RateGovernor(limits={"medio": ModelLimits(rpm=1, tpm=100_000)},
+                                         default=ModelLimits(rpm=100, tpm=100_000))
+        servicio.governor.acquire("medio", 10, CRISIS)  # agota el modelo principal
+
+        respuesta = servicio.generate_response("Tengo mucho estrés con el trabajo", "Estrés")
+        assert respuesta == "Respuesta de rapido"
+        assert completions.modelos == ["rapido"]
+
+    def test_crisis_llama_aunque_no_haya_capacidad(self):
+        from tests.test_hedging import _servicio
+        from services.hedging import HedgePolicy
+        servicio, completions = _servicio({}, HedgePolicy(hedge_after=5, deadline=5))
+        servicio.governor = RateGovernor(default=ModelLimits(rpm=1, tpm=100_000), max_wait={CRISIS: 0})
+        servicio.governor.acquire("grande", 10, CRISIS)
+
+        servicio._complete("grande", [{"role": "user", "content": "x"}], priority=CRISIS)
+        assert completions.modelos == ["grande"]
+        assert servicio.governor.snapshot()["models"]["grande"]["forced"] == 1
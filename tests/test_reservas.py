@@ -0,0 +1,218 @@
+"""Tests para el agendamiento write-behind — reserva en DB y evento de Calendar desde el outbox."""
+import json
+from datetime import date, timedelta
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from constants import SINTOMAS_DISPONIBLES
+from models import Appointment, OutboxMessage, Patient, db
+from services import appointment_service
+from services.busy_index import BusyIntervalIndex
+from services.calendar_pool import CalendarClientPool
+from services.idempotency import IdempotencyStore
+
+TELEFONO = "0991234567"
+
+
+def _proximo_lunes():
+    hoy = date.today()
+    return (hoy + timedelta(days=7 - hoy.weekday())).isoformat()
+
+
+class _FakeCalendar:
+    """freebusy().query() con los eventos guardados (y `ajenos`), events().get() e insert() por ID."""
+
+    def __init__(self):
+        self.eventos = {}
+        self.ajenos = []
+        self.inserts = 0
+        self._pendiente = None
+
+    def freebusy(self):
+        return self
+
+    def events(self):
+        return self
+
+    def query(self, body):
+        busy = [{"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+                for e in self.eventos.values() if "start" in e] + self.ajenos
+        self._pendiente = {"calendars": {"primary": {"busy": busy}}}
+        return self
+
+    def get(self, calendarId, eventId):
+        self._pendiente = self.eventos.get(eventId) or HttpError(httplib2.Response({"status": 404}), b"not found")
+        return self
+
+    def insert(self, calendarId, body):
+        self.inserts += 1
+        if body["id"] in self.eventos:
+            self._pendiente = HttpError(httplib2.Response({"status": 409}), b"duplicate")
+        else:
+            self.eventos[body["id"]] = body
+            self._pendiente = {"id": body["id"], "htmlLink": "https://calendar/" + body["id"]}
+        return self
+
+    def execute(self):
+        if isinstance(self._pendiente, Exception):
+            raise self._pendiente
+        return self._pendiente
+
+
+@pytest.fixture()
+def reservas(app, db, monkeypatch):
+    fake = _FakeCalendar()
+    avisos = []
+    monkeypatch.setattr(appointment_service, "calendar_pool", CalendarClientPool(lambda: fake))
+    monkeypatch.setattr(appointment_service, "busy_index", BusyIntervalIndex(appointment_service._consultar_freebusy))
+    monkeypatch.setattr(appointment_service.outbox, "kick", lambda: avisos.append(1))
+    monkeypatch.setattr(appointment_service, "reservas_idempotentes", IdempotencyStore("reservas"))
+    with app.app_context():
+        yield fake, avisos
+        db.session.rollback()
+        OutboxMessage.query.delete()
+        Appointment.query.delete()
+        Patient.query.delete()
+        db.session.commit()
+
+
+class TestReserva:
+    def test_reserva_en_db_sin_llamar_a_calendar(self, reservas):
+        fake, avisos = reservas
+        ok, _, appointment_id = appointment_service.agendar_cita_completa(
+            _proximo_lunes(), "15:00", TELEFONO, "Ansiedad")
+
+        assert ok and avisos == [1]
+        cita = db.session.get(Appointment, appointment_id)
+        assert cita.status == "pending" and cita.calendar_event_id is None
+        mensaje = OutboxMessage.query.filter_by(appointment_id=appointment_id).one()
+        assert mensaje.kind == "calendar.create" and json.loads(mensaje.payload) == {"appointment_id": appointment_id}
+        assert fake.inserts == 0
+
+    def test_mismo_horario_lo_rechaza_el_constraint(self, reservas):
+        lunes = _proximo_lunes()
+        appointment_service.agendar_cita_completa(lunes, "15:00", TELEFONO, "Ansiedad")
+        # El índice local no sabe de la reserva de otro worker: decide la DB
+        appointment_service.busy_index.invalidate()
+        appointment_service.busy_index.refresh()
+
+        ok, mensaje, _ = appointment_service.agendar_cita_completa(lunes, "15:00", "0997654321", "Estrés")
+
+        assert not ok and "reservado" in mensaje
+        assert Appointment.query.count() == 1
+        assert OutboxMessage.query.count() == 1
+
+
+class TestProcesarReserva:
+    def test_crea_evento_y_guarda_su_id(self, reservas):
+        fake, _ = reservas
+        _, _, appointment_id = appointment_service.agendar_cita_completa(
+            _proximo_lunes(), "16:00", TELEFONO, "Ansiedad")
+
+        resultado = appointment_service.procesar_reserva(appointment_id)
+
+        assert resultado["status"] == "synced"
+        assert db.session.get(Appointment, appointment_id).calendar_event_id == resultado["event_id"]
+        assert appointment_service.procesar_reserva(appointment_id)["status"] == "already_synced"
+        assert fake.inserts == 1
+        kinds = [m.kind for m in OutboxMessage.query.order_by(OutboxMessage.id)]
+        assert kinds == ["calendar.create", "email.confirmation"]
+
+    def test_cita_cancelada_mientras_se_creaba_encola_el_borrado(self, reservas, monkeypatch):
+        fake, _ = reservas
+        _, _, appointment_id = appointment_service.agendar_cita_completa(
+            _proximo_lunes(), "16:00", TELEFONO, "Ansiedad")
+        crear = appointment_service.crear_evento_calendar
+
+        def crear_y_cancelar(*args, **kwargs):
+            evento = crear(*args, **kwargs)
+            db.session.get(Appointment, appointment_id).status = "cancelled"
+            db.session.commit()
+            return evento
+
+        monkeypatch.setattr(appointment_service, "crear_evento_calendar", crear_y_cancelar)
+        appointment_service.procesar_reserva(appointment_id)
+
+        kinds = [m.kind for m in OutboxMessage.query.order_by(OutboxMessage.id)]
+        assert kinds == ["calendar.create", "calendar.delete"]
+
+    def test_reintento_tras_insert_sin_commit_no_duplica_el_evento(self, reservas):
+        fake, _ = reservas
+        _, _, appointment_id = appointment_service.agendar_cita_completa(
+            _proximo_lunes(), "17:00", TELEFONO, "Ansiedad")
+        cita = db.session.get(Appointment, appointment_id)
+        # Un intento anterior creó el evento pero no llegó a guardar el ID: freebusy lo ve ocupado
+        fecha = _proximo_lunes()
+        fake.eventos[appointment_service._event_id_reserva(cita)] = {
+            "start": {"dateTime": f"{fecha}T17:00:00-05:00"}, "end": {"dateTime": f"{fecha}T18:00:00-05:00"}}
+
+        resultado = appointment_service.procesar_reserva(appointment_id)
+
+        assert resultado["event_id"] == appointment_service._event_id_reserva(cita)
+        assert len(fake.eventos) == 1
+
+    def test_horario_tomado_en_calendar_queda_en_conflicto(self, reservas):
+        fake, _ = reservas
+        fecha = _proximo_lunes()
+        _, _, appointment_id = appointment_service.agendar_cita_completa(fecha, "16:00", TELEFONO, "Ansiedad")
+        # Evento creado en Calendar después de la reserva (el índice no lo conoce)
+        fake.ajenos.append({"start": f"{fecha}T16:30:00-05:00", "end": f"{fecha}T17:30:00-05:00"})
+
+        resultado = appointment_service.procesar_reserva(appointment_id)
+
+        assert resultado["status"] == "conflict" and fake.inserts == 0
+        cita = db.session.get(Appointment, appointment_id)
+        assert cita.status == "conflict" and cita.calendar_event_id is None
+        assert [m.kind for m in OutboxMessage.query] == ["calendar.create"]
+        assert appointment_service.procesar_reserva(appointment_id)["status"] == "skipped"
+
+    def test_sin_calendario_pide_reintento(self, reservas, monkeypatch):
+        _, _, appointment_id = appointment_service.agendar_cita_completa(
+            _proximo_lunes(), "18:00", TELEFONO, "Ansiedad")
+        monkeypatch.setattr(appointment_service, "calendar_pool", CalendarClientPool(lambda: None))
+
+        with pytest.raises(RuntimeError):
+            appointment_service.procesar_reserva(appointment_id)
+
+
+class TestEndpointAgendar:
+    def test_responde_sin_esperar_a_calendar_y_409_en_doble_reserva(self, client, reservas):
+        fake, avisos = reservas
+        datos = {"fecha": _proximo_lunes(), "hora": "14:00", "telefono": TELEFONO,
+                 "sintoma": SINTOMAS_DISPONIBLES[0]}
+
+        r = client.post("/agendar-cita", data=json.dumps(datos), content_type="application/json")
+        assert r.status_code == 200 and r.get_json()["status"] == "success"
+        assert len(avisos) == 1 and fake.inserts == 0
+
+        datos["telefono"] = "0997654321"
+        r = client.post("/agendar-cita", data=json.dumps(datos), content_type="application/json")
+        assert r.status_code == 409
+
+    def test_reintento_con_la_misma_clave_no_vuelve_a_reservar(self, client, reservas):
+        _, avisos = reservas
+        datos = json.dumps({"fecha": _proximo_lunes(), "hora": "19:00", "telefono": TELEFONO,
+                            "sintoma": SINTOMAS_DISPONIBLES[0]})
+        cabeceras = {"Idempotency-Key": "reserva-0001"}
+
+        primera = client.post("/agendar-cita", data=datos, content_type="application/json", headers=cabeceras)
+        repetida = client.post("/agendar-cita", data=datos, content_type="application/json", headers=cabeceras)
+
+        assert primera.status_code == repetida.status_code == 200
+        assert repetida.headers.get("Idempotent-Replayed") == "true"
+        assert Appointment.query.count() == 1 and OutboxMessage.query.count() == 1
+        assert len(avisos) == 1
+
+    def test_misma_clave_con_otro_horario_es_422(self, client, reservas):
+        datos = {"fecha": _proximo_lunes(), "hora": "19:00", "telefono": TELEFONO,
+                 "sintoma": SINTOMAS_DISPONIBLES[0]}
+        cabeceras = {"Idempotency-Key": "reserva-0002"}
+        client.post("/agendar-cita", data=json.dumps(datos), content_type="application/json", headers=cabeceras)
+
+        datos["hora"] = "18:00"
+        r = client.post("/agendar-cita", data=json.dumps(datos), content_type="application/json", headers=cabeceras)
+
+        assert r.status_code == 422
+        assert Appointment.query.count() == 1
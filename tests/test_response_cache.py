@@ -0,0 +1,113 @@
+"""Tests para ResponseCache — LRU, TTL, límites de bytes y claves estables."""
+import pytest
+from services.response_cache import ResponseCache, make_key_builder
+
+
+@pytest.fixture()
+def cache():
+    return ResponseCache("test", max_entries=3, ttl=60, max_bytes=10_000)
+
+
+class TestLRU:
+    def test_hit_y_miss(self, cache):
+        assert cache.get("a") is None
+        cache.set("a", "respuesta")
+        assert cache.get("a") == "respuesta"
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+
+    def test_expulsa_menos_reciente(self, cache):
+        for k in ("a", "b", "c"):
+            cache.set(k, k * 20)
+        cache.get("a")  # "a" pasa a ser la más reciente
+        cache.set("d", "d" * 20)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_limite_de_bytes(self):
+        cache = ResponseCache("bytes", max_entries=100, ttl=60, max_bytes=100)
+        cache.set("a", "x" * 60)
+        cache.set("b", "y" * 60)
+        assert len(cache) == 1
+        assert cache.stats()["bytes"] <= 100
+
+    def test_valor_mayor_que_el_limite_se_rechaza(self):
+        cache = ResponseCache("bytes", max_entries=100, ttl=60, max_bytes=10)
+        assert cache.set("a", "x" * 50) is False
+        assert cache.stats()["rejected"] == 1
+
+    def test_ttl_expira(self, monkeypatch, cache):
+        import services.response_cache as rc
+        now = [1000.0]
+        monkeypatch.setattr(rc.time, "time", lambda: now[0])
+        cache.set("a", "valor")
+        now[0] += 61
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["bytes"] == 0
+
+
+class TestKeyBuilder:
+    def test_ignora_self_y_aplica_defaults(self):
+        class Servicio:
+            def generar(self, text, symptom=None):
+                pass
+
+        key = make_key_builder(Servicio.generar)
+        assert key(Servicio(), "hola") == key(Servicio(), "hola", None)
+        assert key(Servicio(), "hola") == key(Servicio(), text="hola")
+        assert key(Servicio(), "hola") != key(Servicio(), "hola", "Ansiedad")
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class _BrokenRedis:
+    def get(self, key):
+        raise ConnectionError("redis caído")
+
+    set = delete = get
+
+
+class TestTieredCache:
+    def test_l2_compartido_entre_workers(self):
+        from services.response_cache import RedisCacheBackend, TieredCache
+        redis = _FakeRedis()
+        worker_a = TieredCache(ResponseCache("a", ttl=60), RedisCacheBackend(redis))
+        worker_b = TieredCache(ResponseCache("b", ttl=60), RedisCacheBackend(redis))
+
+        worker_a.set("k", "respuesta compartida " * 20)
+        assert worker_b.get("k") == "respuesta compartida " * 20
+        assert worker_b.stats()["l2"]["hits"] == 1
+        # Promovida a L1: la segunda lectura no consulta Redis
+        worker_b.get("k")
+        assert worker_b.stats()["l2"]["hits"] == 1
+
+    def test_valores_comprimidos_en_redis(self):
+        from services.response_cache import RedisCacheBackend, TieredCache
+        redis = _FakeRedis()
+        cache = TieredCache(ResponseCache("c", ttl=60), RedisCacheBackend(redis))
+        valor = "texto repetido " * 100
+        cache.set("k", valor)
+        (raw,) = redis.data.values()
+        assert len(raw) < len(valor.encode("utf-8"))
+
+    def test_redis_caido_degrada_a_l1(self):
+        from services.response_cache import RedisCacheBackend, TieredCache
+        cache = TieredCache(ResponseCache("d", ttl=60), RedisCacheBackend(_BrokenRedis()))
+        assert cache.get("k") is None
+        cache.set("k", "valor local")
+        assert cache.get("k") == "valor local"
+        assert cache.stats()["l2"]["available"] is False
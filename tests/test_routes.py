@@ -106,3 +106,84 @@ class TestReset:
     def test_reset_post_retorna_json(self, client):
         r = client.post("/reset")
         assert r.content_type.startswith("application/json")
+
+
+class TestChatStream:
+    def _sesion_profundizacion(self, client):
+        with client.session_transaction() as s:
+            s["estado"] = "profundizacion"
+            s["sintoma_actual"] = "Ansiedad"
+            s["conversacion_data"] = {"interacciones": []}
+
+    def test_estado_invalido_retorna_400(self, client):
+        with client.session_transaction() as s:
+            s["estado"] = "inicio"
+        r = client.post(
+            "/chat/stream",
+            data=json.dumps({"user_input": "hola"}),
+            content_type="application/json",
+        )
+        assert r.status_code == 400
+
+    def test_mensaje_vacio_retorna_400(self, client):
+        self._sesion_profundizacion(client)
+        r = client.post(
+            "/chat/stream",
+            data=json.dumps({"user_input": "   "}),
+            content_type="application/json",
+        )
+        assert r.status_code == 400
+
+    def test_stream_emite_tokens_y_done(self, client):
+        self._sesion_profundizacion(client)
+        r = client.post(
+            "/chat/stream",
+            data=json.dumps({"user_input": "Me siento ansioso"}),
+            content_type="application/json",
+        )
+        assert r.status_code == 200
+        assert r.mimetype == "text/event-stream"
+        body = r.get_data(as_text=True)
+        assert "event: token" in body
+        assert "event: done" in body
+
+    def test_respuesta_pendiente_se_registra_en_historial(self, client):
+        self._sesion_profundizacion(client)
+        r = client.post(
+            "/chat/stream",
+            data=json.dumps({"user_input": "Me siento ansioso"}),
+            content_type="application/json",
+        )
+        r.get_data()
+        client.get("/")
+        with client.session_transaction() as s:
+            interacciones = s["conversacion_data"]["interacciones"]
+            assert "respuesta_pendiente" not in s
+        assert [i["tipo"] for i in interacciones] == ["user", "bot"]
+
+    def test_respuesta_pendiente_perdida_no_se_regenera(self, client, monkeypatch):
+        from services.conversation_service import ConversationService
+
+        self._sesion_profundizacion(client)
+        with client.session_transaction() as s:
+            s["conversacion_data"] = {"interacciones": [{"tipo": "user", "contenido": "hola"}]}
+            s["respuesta_pendiente"] = {"id": "no-existe", "sintoma": "Ansiedad"}
+        llamadas = []
+        monkeypatch.setattr(ConversationService, "get_conversation_response",
+                            lambda *a, **k: llamadas.append(a) or "regenerada")
+        client.get("/")
+        with client.session_transaction() as s:
+            interacciones = s["conversacion_data"]["interacciones"]
+            assert "respuesta_pendiente" not in s
+        assert llamadas == [] and [i["tipo"] for i in interacciones] == ["user"]
+
+    def test_crisis_no_deja_respuesta_pendiente(self, client):
+        self._sesion_profundizacion(client)
+        r = client.post(
+            "/chat/stream",
+            data=json.dumps({"user_input": "ya no quiero vivir"}),
+            content_type="application/json",
+        )
+        assert "Líneas de ayuda" in r.get_data(as_text=True)
+        with client.session_transaction() as s:
+            assert "respuesta_pendiente" not in s
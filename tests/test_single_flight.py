@@ -0,0 +1,170 @@
+"""Tests para SingleFlight — coalescencia en proceso y entre workers."""
+import threading
+import time
+
+import pytest
+from services.response_cache import RedisCacheBackend, ResponseCache, TieredCache
+from services.single_flight import LOCAL_TOKEN, RedisFlightLock, SingleFlight
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def eval(self, script, numkeys, key, token):
+        with self.lock:
+            if self.data.get(key) == token:
+                del self.data[key]
+                return 1
+            return 0
+
+
+class _BrokenRedis:
+    def set(self, *args, **kwargs):
+        raise ConnectionError("redis caído")
+
+
+class TestEnProceso:
+    def test_una_sola_llamada_para_hilos_concurrentes(self):
+        flight = SingleFlight("t")
+        llamadas = []
+        liberar = threading.Event()
+        resultados = []
+
+        def lento():
+            llamadas.append(1)
+            liberar.wait(2)
+            return "respuesta"
+
+        def cliente():
+            resultados.append(flight.do("k", lento))
+
+        hilos = [threading.Thread(target=cliente) for _ in range(5)]
+        for h in hilos:
+            h.start()
+        while flight.stats()["leaders"] == 0 or len(llamadas) == 0:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        liberar.set()
+        for h in hilos:
+            h.join(timeout=5)
+
+        assert len(llamadas) == 1
+        assert [r for r, _ in resultados] == ["respuesta"] * 5
+        assert sum(1 for _, compartido in resultados if compartido) == 4
+        assert flight.stats()["coalesced"] == 4
+        assert flight.in_flight() == 0
+
+    def test_error_del_lider_se_propaga(self):
+        flight = SingleFlight("t")
+
+        def falla():
+            raise RuntimeError("groq caído")
+
+        with pytest.raises(RuntimeError):
+            flight.do("k", falla)
+        assert flight.stats()["errors"] == 1
+        assert flight.do("k", lambda: "ok") == ("ok", False)
+
+    def test_seguidor_llama_directamente_si_la_espera_se_agota(self):
+        flight = SingleFlight("t", wait_timeout=0.05)
+        liberar = threading.Event()
+        hilo = threading.Thread(target=lambda: flight.do("k", lambda: liberar.wait(2) and "lider"))
+        hilo.start()
+        while flight.in_flight() == 0:
+            time.sleep(0.01)
+        assert flight.do("k", lambda: "propia") == ("propia", False)
+        assert flight.stats()["timeouts"] == 1
+        liberar.set()
+        hilo.join(timeout=5)
+
+
+class TestEntreWorkers:
+    def test_seguidor_remoto_espera_la_publicacion_del_lider(self):
+        redis = _FakeRedis()
+        cache_b = TieredCache(ResponseCache("b", ttl=60), RedisCacheBackend(redis))
+        worker_b = SingleFlight("b", remote=RedisFlightLock(redis), poll_interval=0.01)
+
+        # El worker A tiene el candado y publica la respuesta poco después
+        lider = RedisFlightLock(redis)
+        token = lider.try_acquire("k")
+        cache_a = TieredCache(ResponseCache("a", ttl=60), RedisCacheBackend(redis))
+
+        def publicar():
+            time.sleep(0.05)
+            cache_a.set("k", "respuesta de A " * 5)
+            lider.release("k", token)
+
+        threading.Thread(target=publicar).start()
+        llamadas = []
+        resultado = worker_b.do("k", lambda: llamadas.append(1) or "propia",
+                                peek=lambda: cache_b.peek("k"))
+
+        assert resultado == ("respuesta de A " * 5, True)
+        assert llamadas == []
+        assert worker_b.stats()["remote_coalesced"] == 1
+
+    def test_lider_remoto_sin_publicar_no_bloquea(self):
+        redis = _FakeRedis()
+        otro = RedisFlightLock(redis)
+        token = otro.try_acquire("k")
+        threading.Timer(0.03, lambda: otro.release("k", token)).start()
+
+        flight = SingleFlight("b", remote=RedisFlightLock(redis), poll_interval=0.01)
+        assert flight.do("k", lambda: "propia", peek=lambda: None) == ("propia", False)
+        assert not redis.data  # el candado propio también se libera
+
+    def test_redis_caido_continua_sin_coordinacion(self):
+        lock = RedisFlightLock(_BrokenRedis())
+        assert lock.try_acquire("k") == LOCAL_TOKEN
+        flight = SingleFlight("b", remote=lock)
+        assert flight.do("k", lambda: "ok") == ("ok", False)
+
+
+class TestCacheResponseCoalescido:
+    def test_generate_response_coalesce_fallos_concurrentes(self):
+        from services.ai_service import cache_response
+
+        llamadas = []
+        liberar = threading.Event()
+
+        class Servicio:
+            @cache_response(max_size=10, ttl=60)
+            def generate_response(self, text, symptom=None):
+                llamadas.append(text)
+                liberar.wait(2)
+                return "Respuesta de apertura para el síntoma"
+
+        servicio = Servicio()
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(
+            servicio.generate_response("", "Ansiedad"))) for _ in range(4)]
+        for h in hilos:
+            h.start()
+        while not llamadas:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        liberar.set()
+        for h in hilos:
+            h.join(timeout=5)
+
+        assert len(llamadas) == 1
+        assert len(resultados) == 4 and len(set(resultados)) == 1
+        assert Servicio.generate_response.flight.stats()["coalesced"] == 3
@@ -0,0 +1,99 @@
+"""Tests para el candado por horario de las reservas concurrentes."""
+from datetime import date, timedelta
+
+import pytest
+
+from models import Appointment, OutboxMessage, Patient
+from services import appointment_service
+from services.slot_lock import SlotLocks, _advisory_key, create_slot_locks
+
+SLOT = "2030-01-07T15:00"
+
+
+class _FakeRedis:
+    """SET NX PX y el script de liberación por token."""
+
+    def __init__(self, caido=False):
+        self.claves = {}
+        self.caido = caido
+
+    def set(self, clave, valor, nx=False, px=None):
+        if self.caido:
+            raise ConnectionError("redis caído")
+        if nx and clave in self.claves:
+            return None
+        self.claves[clave] = valor
+        return True
+
+    def eval(self, script, numkeys, clave, token):
+        if self.claves.get(clave) == token:
+            del self.claves[clave]
+            return 1
+        return 0
+
+
+class TestSlotLocks:
+    def test_segundo_request_del_mismo_worker_pierde(self, app):
+        locks = SlotLocks()
+        with app.app_context():
+            with locks.hold(SLOT) as primero:
+                with locks.hold(SLOT) as segundo:
+                    assert primero and not segundo
+            with locks.hold(SLOT) as otra_vez:
+                assert otra_vez
+        assert locks.stats()["contended"] == 1
+
+    def test_candado_de_otro_worker_en_redis(self):
+        redis = _FakeRedis()
+        otro_worker, este_worker = SlotLocks(redis), SlotLocks(redis)
+        with otro_worker.hold(SLOT) as tomado:
+            assert tomado
+            with este_worker.hold(SLOT) as libre:
+                assert not libre
+        assert redis.claves == {}
+
+    def test_sin_redis_ni_postgres_queda_el_candado_local(self, app):
+        locks = SlotLocks(_FakeRedis(caido=True))
+        with app.app_context():
+            with locks.hold(SLOT) as libre:
+                assert libre
+        stats = locks.stats()
+        assert stats["errors"] == 1 and stats["local_only"] == 1 and not stats["redis_available"]
+
+    def test_clave_advisory_cabe_en_bigint(self):
+        clave = _advisory_key(SLOT)
+        assert -2 ** 63 <= clave < 2 ** 63
+        assert clave == _advisory_key(SLOT) != _advisory_key("2030-01-07T16:00")
+
+    def test_ttl_por_defecto_es_el_timeout_del_request(self, monkeypatch):
+        monkeypatch.delenv("SLOT_LOCK_TTL", raising=False)
+        monkeypatch.setenv("REQUEST_TIMEOUT", "90")
+        assert create_slot_locks().ttl == 90
+        monkeypatch.setenv("SLOT_LOCK_TTL", "30")
+        assert create_slot_locks().ttl == 30
+
+
+@pytest.fixture()
+def reservas(app, db, monkeypatch):
+    monkeypatch.setattr(appointment_service, "slot_locks", SlotLocks())
+    monkeypatch.setattr(appointment_service.outbox, "kick", lambda: None)
+    with app.app_context():
+        yield
+        db.session.rollback()
+        OutboxMessage.query.delete()
+        Appointment.query.delete()
+        Patient.query.delete()
+        db.session.commit()
+
+
+def test_reserva_concurrente_falla_antes_de_consultar_la_ocupacion(reservas, monkeypatch):
+    hoy = date.today()
+    lunes = (hoy + timedelta(days=7 - hoy.weekday())).isoformat()
+    consultas = []
+    monkeypatch.setattr(appointment_service, "consultar_horario_ocupado", lambda *a: consultas.append(a))
+
+    with appointment_service.slot_locks.hold(f"{lunes}T15:00"):
+        ok, mensaje, _ = appointment_service.agendar_cita_completa(lunes, "15:00", "0991234567", "Ansiedad")
+
+    assert not ok and "reservado" in mensaje
+    assert consultas == [] and Appointment.query.count() == 0